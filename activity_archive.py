@@ -0,0 +1,298 @@
+﻿# /database/activity_archive.py
+
+import os
+import gzip
+import json
+import functools
+from datetime import datetime, date
+from .connection import config, get_connection, get_cursor
+from .activity_codes import ACTIVITY_ACTION_NAMES, ACTIVITY_RECORD_TYPE_NAMES, render_activity_description
+
+# activity_log is RANGE-partitioned by month (migration 3): partition pYYYYMM
+# holds rows before the first day of the following month, and p_future
+# catches anything beyond the last month created so far. Closed months older
+# than keep_months are moved into read-only gzip JSON-lines files,
+#   <archive_dir>/activity_log_YYYY-MM.jsonl.gz
+# each with a small sidecar index (row count, time span, column list, and the
+# record ids it mentions) so lookups can skip archives that cannot match.
+# Archives store action and record type by name, not code, so they stay
+# readable on their own. Dropping a partition is instant, unlike DELETE.
+FUTURE_PARTITION = "p_future"
+PARTITION_MONTHS_AHEAD = 2
+ARCHIVE_FILE_PREFIX = "activity_log_"
+ARCHIVE_FILE_SUFFIX = ".jsonl.gz"
+ARCHIVE_INDEX_SUFFIX = ".index.json"
+ARCHIVE_FETCH_ROWS = 5000
+ARCHIVE_COLUMNS = ('id', 'user_id', 'username', 'action', 'record_type', 'record_id', 'payload', 'timestamp')
+
+def load_activity_archive_settings():
+    """Reads the [activity_log] section of config.ini."""
+    return {
+        'archive_dir': config.get('activity_log', 'archive_dir', fallback='activity_archive'),
+        'keep_months': config.getint('activity_log', 'keep_months', fallback=12),
+    }
+
+def _month_start(year, month):
+    return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+def _next_month(month_start):
+    return _month_start(month_start.year, month_start.month + 1)
+
+def _partition_name(month_start):
+    return f"p{month_start.year:04d}{month_start.month:02d}"
+
+def _partition_bound(data_type, month_start):
+    """The VALUES LESS THAN expression for a partition ending before month_start."""
+    if data_type == 'timestamp':
+        return f"UNIX_TIMESTAMP('{month_start.isoformat()} 00:00:00')"
+    return f"TO_DAYS('{month_start.isoformat()}')"
+
+def _timestamp_data_type(cur):
+    cur.execute("""
+        SELECT DATA_TYPE AS data_type FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'activity_log' AND COLUMN_NAME = 'timestamp'
+    """)
+    return cur.fetchone()['data_type']
+
+def _partition_months(cur):
+    """Returns the month starts of activity_log's monthly partitions, oldest first ([] if unpartitioned)."""
+    cur.execute("""
+        SELECT PARTITION_NAME AS name FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'activity_log' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    months = []
+    for row in cur.fetchall():
+        if row['name'] != FUTURE_PARTITION:
+            months.append(date(int(row['name'][1:5]), int(row['name'][5:7]), 1))
+    return months
+
+def partition_activity_log(cur):
+    """
+    Migration step: converts activity_log to monthly RANGE partitions.
+    MySQL requires the partitioning column in every unique key and does not
+    allow foreign keys on partitioned tables, so the primary key becomes
+    (id, timestamp) and any foreign keys are dropped (user_id is only ever
+    LEFT JOINed, and deleted users already show as such).
+    """
+    cur.execute("""
+        SELECT CONSTRAINT_NAME AS name FROM information_schema.TABLE_CONSTRAINTS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'activity_log' AND CONSTRAINT_TYPE = 'FOREIGN KEY'
+    """)
+    for row in cur.fetchall():
+        cur.execute(f"ALTER TABLE activity_log DROP FOREIGN KEY `{row['name']}`")
+    # Primary key columns must be NOT NULL.
+    cur.execute("UPDATE activity_log SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL")
+    cur.execute("ALTER TABLE activity_log DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)")
+
+    data_type = _timestamp_data_type(cur)
+    cur.execute("SELECT MIN(timestamp) AS oldest FROM activity_log")
+    oldest = cur.fetchone()['oldest'] or datetime.now()
+    today = date.today()
+    month = _month_start(oldest.year, oldest.month)
+    last = _month_start(today.year, today.month + PARTITION_MONTHS_AHEAD)
+    partitions = []
+    while month <= last:
+        partitions.append(f"PARTITION {_partition_name(month)} VALUES LESS THAN ({_partition_bound(data_type, _next_month(month))})")
+        month = _next_month(month)
+    partitions.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+    column = "UNIX_TIMESTAMP(timestamp)" if data_type == 'timestamp' else "TO_DAYS(timestamp)"
+    cur.execute(f"ALTER TABLE activity_log PARTITION BY RANGE ({column}) ({', '.join(partitions)})")
+
+def ensure_activity_log_partitions(months_ahead=PARTITION_MONTHS_AHEAD):
+    """
+    Splits p_future so monthly partitions exist through months_ahead months
+    from now. A no-op when they already do or the table is not partitioned;
+    cheap enough to call at every start.
+    """
+    with get_cursor() as cur:
+        months = _partition_months(cur)
+        if not months:
+            return
+        today = date.today()
+        target = _month_start(today.year, today.month + months_ahead)
+        month = _next_month(months[-1])
+        if month > target:
+            return
+        data_type = _timestamp_data_type(cur)
+        partitions = []
+        while month <= target:
+            partitions.append(f"PARTITION {_partition_name(month)} VALUES LESS THAN ({_partition_bound(data_type, _next_month(month))})")
+            month = _next_month(month)
+        partitions.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+        cur.execute(f"ALTER TABLE activity_log REORGANIZE PARTITION {FUTURE_PARTITION} INTO ({', '.join(partitions)})")
+
+def _archive_paths(archive_dir, month_start):
+    base = os.path.join(archive_dir, f"{ARCHIVE_FILE_PREFIX}{month_start.year:04d}-{month_start.month:02d}")
+    return base + ARCHIVE_FILE_SUFFIX, base + ARCHIVE_FILE_SUFFIX + ARCHIVE_INDEX_SUFFIX
+
+def _write_month_archive(month_start, data_path, index_path):
+    """Streams one partition into a gzip JSON-lines file plus its index. Returns the row count."""
+    partition = _partition_name(month_start)
+    rows_written, records = 0, {}
+    first_ts, last_ts = None, None
+    tmp_path = data_path + ".tmp"
+    with get_connection() as conn, gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=9) as out:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT al.id, al.user_id, u.username, al.action_code, al.record_type_code, al.record_id, al.payload, al.timestamp
+            FROM activity_log PARTITION ({partition}) al LEFT JOIN users u ON al.user_id = u.id
+            ORDER BY al.timestamp, al.id
+        """)
+        while True:
+            rows = cur.fetchmany(ARCHIVE_FETCH_ROWS)
+            if not rows:
+                break
+            for row in rows:
+                row = list(row)
+                payload = row[6].decode('utf-8') if isinstance(row[6], (bytes, bytearray)) else row[6]
+                row[6] = json.loads(payload) if payload else None
+                row[3] = ACTIVITY_ACTION_NAMES.get(row[3]) or (row[6] or {}).get('_action', 'UNKNOWN')
+                row[4] = ACTIVITY_RECORD_TYPE_NAMES.get(row[4]) or (row[6] or {}).get('_record_type', 'unknown')
+                row[7] = row[7].isoformat(sep=' ')
+                out.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + "\n")
+                if row[5] is not None:
+                    records.setdefault(row[4], set()).add(row[5])
+                first_ts = first_ts or row[7]
+                last_ts = row[7]
+            rows_written += len(rows)
+        cur.close()
+    index = {
+        'month': f"{month_start.year:04d}-{month_start.month:02d}",
+        'rows': rows_written,
+        'first_timestamp': first_ts,
+        'last_timestamp': last_ts,
+        'columns': list(ARCHIVE_COLUMNS),
+        'records': {record_type: sorted(ids) for record_type, ids in records.items()},
+    }
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, data_path)
+    os.chmod(data_path, 0o444)
+    os.chmod(index_path, 0o444)
+    return rows_written
+
+def archive_activity_log(archive_dir=None, keep_months=None, user_id=None):
+    """
+    Moves every closed month older than keep_months into a read-only archive
+    file and drops its partition. Each month is written and verified before
+    its partition is dropped, so an interrupted run loses nothing and is
+    simply resumed next time. Returns (success, message).
+    """
+    from .utility_queries import log_activity
+    settings = load_activity_archive_settings()
+    archive_dir = archive_dir or settings['archive_dir']
+    keep_months = settings['keep_months'] if keep_months is None else keep_months
+    try:
+        ensure_activity_log_partitions()
+        with get_cursor() as cur:
+            months = _partition_months(cur)
+        if not months:
+            return False, "جدول سجل الأنشطة غير مقسم بعد؛ شغل ترحيلات قاعدة البيانات أولاً."
+        today = date.today()
+        cutoff = _month_start(today.year, today.month - keep_months)
+        os.makedirs(archive_dir, exist_ok=True)
+        archived, total_rows = [], 0
+        for month in months:
+            if month >= cutoff:
+                break
+            data_path, index_path = _archive_paths(archive_dir, month)
+            partition = _partition_name(month)
+            with get_cursor() as cur:
+                cur.execute(f"SELECT COUNT(*) AS row_count FROM activity_log PARTITION ({partition})")
+                in_table = cur.fetchone()['row_count']
+            if os.path.exists(data_path):
+                # Left by an earlier run that stopped before dropping the partition.
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    written = json.load(f)['rows']
+                if written != in_table:
+                    return False, f"ملف الأرشيف {os.path.basename(data_path)} موجود ولا يطابق الجدول ({written} من {in_table} صف)."
+            else:
+                written = _write_month_archive(month, data_path, index_path)
+                if written != in_table:
+                    return False, f"عدد الصفوف المؤرشفة لشهر {month:%Y-%m} غير مطابق ({written} من {in_table})."
+            with get_cursor() as cur:
+                cur.execute(f"ALTER TABLE activity_log DROP PARTITION {partition}")
+            archived.append(f"{month:%Y-%m}")
+            total_rows += written
+        if not archived:
+            return True, "لا توجد أشهر مغلقة تحتاج إلى أرشفة."
+        log_activity(user_id, 'ARCHIVE', 'activity_log', None,
+                     {'rows': total_rows, 'first': archived[0], 'last': archived[-1], 'archive_dir': archive_dir})
+        return True, f"تمت أرشفة {total_rows} سجل نشاط من {len(archived)} شهر ({archived[0]} إلى {archived[-1]})."
+    except Exception as e:
+        return False, f"حدث استثناء أثناء أرشفة سجل الأنشطة:\n{str(e)}"
+
+def list_activity_archives(archive_dir=None):
+    """Returns [(month 'YYYY-MM', data_path, index dict)] for every archive, newest first."""
+    archive_dir = archive_dir or load_activity_archive_settings()['archive_dir']
+    archives = []
+    if not os.path.isdir(archive_dir):
+        return archives
+    for name in os.listdir(archive_dir):
+        if not (name.startswith(ARCHIVE_FILE_PREFIX) and name.endswith(ARCHIVE_FILE_SUFFIX)):
+            continue
+        data_path = os.path.join(archive_dir, name)
+        try:
+            with open(data_path + ARCHIVE_INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            continue
+        archives.append((index['month'], data_path, index))
+    archives.sort(key=lambda a: a[0], reverse=True)
+    return archives
+
+@functools.lru_cache(maxsize=2)
+def _load_month(data_path, mtime, columns):
+    """Decodes one archive, newest row first. Cached because paging re-reads the same month."""
+    rows = []
+    with gzip.open(data_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            entry = dict(zip(columns, json.loads(line)))
+            entry['timestamp'] = datetime.fromisoformat(entry['timestamp'])
+            if 'payload' in entry: # Archives written before the compact encoding carry 'description'.
+                entry['payload'] = entry['payload'] or {}
+                entry['description'] = render_activity_description(entry['action'], entry['record_type'],
+                                                                    entry['record_id'], entry['payload'])
+            entry['archived'] = True
+            rows.append(entry)
+    rows.reverse()
+    return rows
+
+def _matches(entry, filters):
+    for column in ('user_id', 'action', 'record_type', 'record_id'):
+        if filters.get(column) is not None and entry[column] != filters[column]:
+            return False
+    if filters.get('date_from') and entry['timestamp'].date() < date.fromisoformat(filters['date_from']):
+        return False
+    if filters.get('date_to') and entry['timestamp'].date() > date.fromisoformat(filters['date_to']):
+        return False
+    return True
+
+def iter_archived_activity(filters=None, after=None, archive_dir=None):
+    """
+    Yields archived activity rows matching filters (as for
+    fetch_activity_log_page), newest first, starting after the (timestamp, id)
+    key if given. Archives whose index rules them out are not opened.
+    """
+    filters = filters or {}
+    for month, data_path, index in list_activity_archives(archive_dir):
+        if not index['rows']:
+            continue
+        if filters.get('date_from') and index['last_timestamp'][:10] < filters['date_from']:
+            break
+        if filters.get('date_to') and index['first_timestamp'][:10] > filters['date_to']:
+            continue
+        if after is not None and index['first_timestamp'] > after[0].isoformat(sep=' '):
+            continue
+        if filters.get('record_id') is not None:
+            ids = index['records'].get(filters.get('record_type'), []) if filters.get('record_type') else \
+                [i for ids in index['records'].values() for i in ids]
+            if filters['record_id'] not in ids:
+                continue
+        columns = tuple(index.get('columns', ARCHIVE_COLUMNS))
+        for entry in _load_month(data_path, os.path.getmtime(data_path), columns):
+            if after is not None and (entry['timestamp'], entry['id']) >= tuple(after):
+                continue
+            if _matches(entry, filters):
+                yield entry
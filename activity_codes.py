@@ -0,0 +1,175 @@
+﻿# /database/activity_codes.py
+
+import re
+import json
+from .connection import get_cursor
+
+BACKFILL_BATCH_ROWS = 5000
+
+# activity_log stores the action and record type as small integers and the
+# event details as a JSON payload; the human-readable description is rendered
+# from ACTIVITY_TEMPLATES when the log is read. The codes are persisted, so
+# never renumber or reuse one - only append. Code 0 means "not in this table";
+# the original name is then kept in the payload under _action / _record_type.
+ACTIVITY_ACTIONS = {
+    'INSERT': 1,
+    'UPDATE': 2,
+    'TRASH': 3,
+    'RESTORE': 4,
+    'DELETE': 5,
+    'BACKUP': 6,
+    'BACKUP_FAILED': 7,
+    'ARCHIVE': 8,
+    'MERGE': 9,
+}
+ACTIVITY_RECORD_TYPES = {
+    'maintenance': 1,
+    'attachment': 2,
+    'user': 3,
+    'department': 4,
+    'scheduled_backup': 5,
+    'activity_log': 6,
+    'lookup': 7,
+}
+ACTIVITY_ACTION_NAMES = {code: name for name, code in ACTIVITY_ACTIONS.items()}
+ACTIVITY_RECORD_TYPE_NAMES = {code: name for name, code in ACTIVITY_RECORD_TYPES.items()}
+
+# (action, record_type) -> format string over the payload (plus record_id), or
+# a callable(payload, record_id) for descriptions with optional parts.
+ACTIVITY_TEMPLATES = {
+    ('INSERT', 'maintenance'): "Added record for device: {device}",
+    ('UPDATE', 'maintenance'): lambda p, record_id: (
+        f"Updated record for device: {p['device']}" + (f" ({', '.join(p['fields'])})" if p.get('fields') else "")),
+    ('TRASH', 'maintenance'): "Moved record to trash ID: {record_id}",
+    ('RESTORE', 'maintenance'): "Restored record from trash ID: {record_id}",
+    ('DELETE', 'maintenance'): "Permanently deleted record ID: {record_id}",
+    ('INSERT', 'attachment'): "Added attachment '{filename}' to record {maintenance_id}",
+    ('DELETE', 'attachment'): lambda p, record_id: (
+        f"Removed {'missing ' if p.get('missing') else ''}attachment '{p['filename']}' from record {p['maintenance_id']}"),
+    ('INSERT', 'user'): "Added user: {username} with role: {role}",
+    ('UPDATE', 'user'): lambda p, record_id: f"Updated user ID {record_id} ({', '.join(p['fields'])})",
+    ('TRASH', 'user'): "Moved user to trash ID: {record_id}",
+    ('RESTORE', 'user'): "Restored user from trash ID: {record_id}",
+    ('DELETE', 'user'): "Permanently deleted user ID: {record_id}",
+    ('INSERT', 'department'): "Added department: {name}",
+    ('UPDATE', 'department'): "Renamed department to: {name}",
+    ('DELETE', 'department'): "Deleted department: {name}",
+    ('BACKUP', 'scheduled_backup'): "Scheduled {kind} backup {file} ({size_mb} MB); pruned {pruned} old archive(s)",
+    ('BACKUP_FAILED', 'scheduled_backup'): "Scheduled backup failed: {error}",
+    ('ARCHIVE', 'activity_log'): "Archived {rows} activity log rows ({first} to {last}) to {archive_dir}",
+    ('ARCHIVE', 'maintenance'): "Archived {rows} maintenance records dated before {before}",
+    ('MERGE', 'lookup'): lambda p, record_id: (
+        f"Merged {p['kind']} values {', '.join(p['sources'])} into {p['target']} ({p['records']} records)"),
+}
+
+# Descriptions written before the compact encoding that the string templates
+# above cannot be reversed from automatically.
+_LEGACY_PATTERNS = {
+    ('DELETE', 'attachment'): re.compile(r"Removed (?P<missing>missing )?attachment '(?P<filename>.*)' from record (?P<maintenance_id>\d+)"),
+    ('UPDATE', 'maintenance'): re.compile(r"Updated record for device: (?P<device>.*)"),
+    ('UPDATE', 'user'): re.compile(r"Updated user ID \d+ \((?P<fields>.*)\)"),
+}
+
+def encode_activity(action, record_type, payload=None):
+    """Returns (action_code, record_type_code, payload_json) for a new log row."""
+    payload = dict(payload or {})
+    action_code = ACTIVITY_ACTIONS.get(action, 0)
+    record_type_code = ACTIVITY_RECORD_TYPES.get(record_type, 0)
+    if not action_code:
+        payload['_action'] = action
+    if not record_type_code:
+        payload['_record_type'] = record_type
+    payload_json = json.dumps(payload, ensure_ascii=False, separators=(',', ':')) if payload else None
+    return action_code, record_type_code, payload_json
+
+def render_activity_description(action, record_type, record_id, payload):
+    """Renders the description of one event. Legacy rows that kept their original text show it as-is."""
+    payload = payload or {}
+    if 'text' in payload:
+        return payload['text']
+    template = ACTIVITY_TEMPLATES.get((action, record_type))
+    try:
+        if callable(template):
+            return template(payload, record_id)
+        if template:
+            return template.format(record_id=record_id, **payload)
+    except (KeyError, IndexError, TypeError, ValueError):
+        pass
+    return f"{action} {record_type}" + (f" ID: {record_id}" if record_id is not None else "")
+
+def decode_activity_row(row):
+    """
+    Turns a row selected with action_code, record_type_code and payload into
+    the shape the UI expects: action and record_type names, a payload dict and
+    a rendered description.
+    """
+    payload = row.pop('payload', None)
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode('utf-8')
+    payload = json.loads(payload) if payload else {}
+    action = ACTIVITY_ACTION_NAMES.get(row.pop('action_code', None)) or payload.get('_action', 'UNKNOWN')
+    record_type = ACTIVITY_RECORD_TYPE_NAMES.get(row.pop('record_type_code', None)) or payload.get('_record_type', 'unknown')
+    row['action'] = action
+    row['record_type'] = record_type
+    row['payload'] = payload
+    row['description'] = render_activity_description(action, record_type, row.get('record_id'), payload)
+    return row
+
+def _template_regex(template):
+    """Builds an anchored regex with one named group per {field} of a format string."""
+    parts = re.split(r"\{(\w+)(?::[^}]*)?\}", template)
+    pattern = ""
+    for i, part in enumerate(parts):
+        pattern += re.escape(part) if i % 2 == 0 else f"(?P<{part}>.*?)"
+    return re.compile(pattern + "$")
+
+def parse_legacy_description(action, record_type, record_id, description):
+    """
+    Recovers a structured payload from a pre-migration description. The
+    result is only used if it renders back to exactly the same text;
+    anything else is kept verbatim under 'text', so no information is lost.
+    """
+    if not description:
+        return {}
+    key = (action, record_type)
+    template = ACTIVITY_TEMPLATES.get(key)
+    pattern = _LEGACY_PATTERNS.get(key) or (_template_regex(template) if isinstance(template, str) else None)
+    match = pattern.fullmatch(description) if pattern else None
+    if match:
+        payload = {k: v for k, v in match.groupdict().items() if k != 'record_id'}
+        if key == ('DELETE', 'attachment'):
+            payload['missing'] = bool(payload['missing'])
+            if not payload['missing']:
+                del payload['missing']
+        if key == ('UPDATE', 'user'):
+            payload['fields'] = payload['fields'].split(', ')
+        if render_activity_description(action, record_type, record_id, payload) == description:
+            return payload
+    return {'text': description}
+
+def backfill_activity_codes(cur):
+    """
+    Migration step: fills action_code, record_type_code and payload from the
+    legacy string columns, BACKFILL_BATCH_ROWS rows per transaction so the
+    table is never locked for long. Resumable; rows already converted are
+    skipped. (The migration's own cursor is not used, so each batch commits.)
+    """
+    last_id = 0
+    while True:
+        with get_cursor() as batch_cur:
+            batch_cur.execute("""
+                SELECT id, timestamp, action, record_type, record_id, description FROM activity_log
+                WHERE id > %s AND action_code IS NULL ORDER BY id LIMIT %s
+            """, (last_id, BACKFILL_BATCH_ROWS))
+            rows = batch_cur.fetchall()
+            if not rows:
+                return
+            updates = []
+            for row in rows:
+                payload = parse_legacy_description(row['action'], row['record_type'], row['record_id'], row['description'])
+                updates.append((*encode_activity(row['action'], row['record_type'], payload), row['id'], row['timestamp']))
+            batch_cur.executemany("""
+                UPDATE activity_log SET action_code = %s, record_type_code = %s, payload = %s
+                WHERE id = %s AND timestamp = %s
+            """, updates)
+            last_id = rows[-1]['id']
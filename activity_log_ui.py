@@ -1,31 +1,163 @@
 ﻿# activity_log_ui.py
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QMessageBox
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QMessageBox,
+    QLabel, QComboBox, QLineEdit, QDateEdit, QCheckBox
+)
+from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtGui import QIntValidator
 import db_ops
 
+# Fetch the next page once the user scrolls within this many rows of the end.
+LOAD_MORE_THRESHOLD_ROWS = 20
+
 class ActivityLogWindow(QWidget):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("سجل الأنشطة")
         self.setGeometry(200, 200, 1000, 600)
         self.setLayoutDirection(Qt.RightToLeft)
+        self.filters = {}
+        self.include_archived = False
+        self.last_key = None # (timestamp, id) of the last loaded row
+        self.has_more = False
+        self.loading = False
         layout = QVBoxLayout(self)
+
+        # --- Filters (applied on the server) ---
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("المستخدم:"))
+        self.user_combo = QComboBox()
+        filter_layout.addWidget(self.user_combo)
+        filter_layout.addWidget(QLabel("الإجراء:"))
+        self.action_combo = QComboBox()
+        filter_layout.addWidget(self.action_combo)
+        filter_layout.addWidget(QLabel("نوع السجل:"))
+        self.record_type_combo = QComboBox()
+        filter_layout.addWidget(self.record_type_combo)
+        filter_layout.addWidget(QLabel("معرف السجل:"))
+        self.record_id_edit = QLineEdit()
+        self.record_id_edit.setValidator(QIntValidator(1, 2147483647, self))
+        self.record_id_edit.setMaximumWidth(90)
+        filter_layout.addWidget(self.record_id_edit)
+        layout.addLayout(filter_layout)
+
+        date_layout = QHBoxLayout()
+        self.date_filter_checkbox = QCheckBox("تقييد بالتاريخ")
+        self.date_filter_checkbox.toggled.connect(self.update_date_edits_state)
+        date_layout.addWidget(self.date_filter_checkbox)
+        date_layout.addWidget(QLabel("من تاريخ:"))
+        self.date_from_edit = QDateEdit(calendarPopup=True)
+        self.date_from_edit.setDate(QDate.currentDate().addMonths(-1))
+        date_layout.addWidget(self.date_from_edit)
+        date_layout.addWidget(QLabel("إلى تاريخ:"))
+        self.date_to_edit = QDateEdit(calendarPopup=True)
+        self.date_to_edit.setDate(QDate.currentDate())
+        date_layout.addWidget(self.date_to_edit)
+        self.apply_button = QPushButton("تطبيق")
+        self.apply_button.clicked.connect(self.apply_filters)
+        date_layout.addWidget(self.apply_button)
+        self.clear_button = QPushButton("مسح الفلاتر")
+        self.clear_button.clicked.connect(self.clear_filters)
+        date_layout.addWidget(self.clear_button)
+        self.include_archived_checkbox = QCheckBox("تضمين الأرشيف")
+        self.include_archived_checkbox.setToolTip("متابعة التحميل في الأشهر المؤرشفة بعد انتهاء السجلات في قاعدة البيانات (أبطأ)")
+        date_layout.addWidget(self.include_archived_checkbox)
         self.refresh_button = QPushButton("تحديث السجل")
         self.refresh_button.clicked.connect(self.load_log)
-        layout.addWidget(self.refresh_button)
+        date_layout.addWidget(self.refresh_button)
+        date_layout.addStretch()
+        layout.addLayout(date_layout)
+        self.update_date_edits_state(False)
+
         self.table = QTableWidget()
         self.table.verticalHeader().setVisible(False)
         self.table.setColumnCount(7)
         self.table.setHorizontalHeaderLabels(["ID", "اسم المستخدم", "الإجراء", "نوع السجل", "معرف السجل", "الوصف", "الوقت والتاريخ"])
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.verticalScrollBar().valueChanged.connect(self.on_scroll)
         layout.addWidget(self.table)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        self.load_filter_options()
+        self.load_log()
+
+    def load_filter_options(self):
+        """Fills the filter combos, keeping the current selections where they still exist."""
+        try:
+            options = db_ops.get_activity_log_filter_options()
+        except Exception as e:
+            QMessageBox.critical(self, "خطأ", f"فشل في تحميل خيارات الفلترة:\n{str(e)}")
+            return
+        for combo, items in ((self.user_combo, [(u['username'], u['id']) for u in options['users']]),
+                             (self.action_combo, [(a, a) for a in options['actions']]),
+                             (self.record_type_combo, [(t, t) for t in options['record_types']])):
+            current = combo.currentData()
+            combo.clear()
+            combo.addItem("الجميع", None)
+            for text, data in items:
+                combo.addItem(text, data)
+            index = combo.findData(current)
+            combo.setCurrentIndex(index if index >= 0 else 0)
+
+    def update_date_edits_state(self, checked):
+        self.date_from_edit.setEnabled(checked)
+        self.date_to_edit.setEnabled(checked)
+
+    def current_filters(self):
+        filters = {
+            'user_id': self.user_combo.currentData(),
+            'action': self.action_combo.currentData(),
+            'record_type': self.record_type_combo.currentData(),
+            'record_id': int(self.record_id_edit.text()) if self.record_id_edit.text() else None,
+        }
+        self.include_archived = self.include_archived_checkbox.isChecked()
+        if self.date_filter_checkbox.isChecked():
+            filters['date_from'] = self.date_from_edit.date().toString("yyyy-MM-dd")
+            filters['date_to'] = self.date_to_edit.date().toString("yyyy-MM-dd")
+        return filters
+
+    def apply_filters(self):
+        self.filters = self.current_filters()
         self.load_log()
 
+    def clear_filters(self):
+        for combo in (self.user_combo, self.action_combo, self.record_type_combo):
+            combo.setCurrentIndex(0)
+        self.record_id_edit.clear()
+        self.date_filter_checkbox.setChecked(False)
+        self.include_archived_checkbox.setChecked(False)
+        self.apply_filters()
+
     def load_log(self):
+        """Reloads the log from the newest entry with the applied filters."""
+        self.table.setRowCount(0)
+        self.last_key = None
+        self.has_more = True
+        self.load_next_page()
+        self.table.resizeColumnsToContents()
+
+    def on_scroll(self, value):
+        scrollbar = self.table.verticalScrollBar()
+        row_height = self.table.verticalHeader().defaultSectionSize()
+        if value >= scrollbar.maximum() - LOAD_MORE_THRESHOLD_ROWS * row_height:
+            self.load_next_page()
+
+    def load_next_page(self):
+        """Appends the next page of rows after the last one loaded."""
+        if self.loading or not self.has_more:
+            return
+        self.loading = True
         try:
-            log_entries = db_ops.fetch_activity_log()
-            self.table.setRowCount(len(log_entries))
-            for row_idx, entry in enumerate(log_entries):
-                self.table.setItem(row_idx, 0, QTableWidgetItem(str(entry['id'])))
+            log_entries = db_ops.fetch_activity_log_page(self.filters, after=self.last_key,
+                                                         include_archived=self.include_archived)
+            start_row = self.table.rowCount()
+            self.table.setRowCount(start_row + len(log_entries))
+            for offset, entry in enumerate(log_entries):
+                row_idx = start_row + offset
+                id_text = f"{entry['id']} (أرشيف)" if entry.get('archived') else str(entry['id'])
+                self.table.setItem(row_idx, 0, QTableWidgetItem(id_text))
                 self.table.setItem(row_idx, 1, QTableWidgetItem(entry['username'] or "مستخدم محذوف"))
                 self.table.setItem(row_idx, 2, QTableWidgetItem(entry['action']))
                 self.table.setItem(row_idx, 3, QTableWidgetItem(entry['record_type']))
@@ -33,6 +165,13 @@ class ActivityLogWindow(QWidget):
                 self.table.setItem(row_idx, 5, QTableWidgetItem(entry['description'] or ""))
                 timestamp_str = entry['timestamp'].strftime("%Y-%m-%d %H:%M:%S") if entry['timestamp'] else ""
                 self.table.setItem(row_idx, 6, QTableWidgetItem(timestamp_str))
-            self.table.resizeColumnsToContents()
+            if log_entries:
+                self.last_key = (log_entries[-1]['timestamp'], log_entries[-1]['id'])
+            self.has_more = len(log_entries) == db_ops.ACTIVITY_PAGE_SIZE
+            more_text = " (مرر للأسفل لتحميل المزيد)" if self.has_more else ""
+            self.status_label.setText(f"تم تحميل {self.table.rowCount()} سجل{more_text}")
         except Exception as e:
-            QMessageBox.critical(self, "خطأ", f"فشل في تحميل سجل الأنشطة:\n{str(e)}")
\ No newline at end of file
+            self.has_more = False
+            QMessageBox.critical(self, "خطأ", f"فشل في تحميل سجل الأنشطة:\n{str(e)}")
+        finally:
+            self.loading = False
@@ -30,7 +30,8 @@ def add_admin_user(username, password, department=None):
             return False
 
         cur.execute(
-            "INSERT INTO users (username, password_hash, role_id, department) VALUES (%s, %s, %s, %s)",
+            "INSERT INTO users (username, password_hash, role_id, department_id)"
+            " VALUES (%s, %s, %s, (SELECT id FROM departments WHERE name = %s))",
             (username, password, role_id, department)
         )
         conn.commit()
@@ -1,22 +1,46 @@
 ﻿# admin_dashboard_ui.py
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidget, QTableWidgetItem,
-    QMessageBox, QTabWidget, QTextEdit, QFileDialog, QDialog
+    QMessageBox, QTabWidget, QTextEdit, QFileDialog, QDialog, QProgressBar
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 import db_ops
 import os
 from datetime import datetime
 from user_mgmt_ui import UserManagementWindow
 from user_edit_ui import UserEditWindow
 from department_mgmt_ui import DepartmentManagementWindow
+from lookup_mgmt_ui import LookupManagementWindow
 from trash_ui import TrashWindow
 from users_trash_ui import UsersTrashWindow
+from backup_restore_ui import BackupRestoreWorker
+
+class StorageCheckWorker(QThread):
+    """Runs the attachment storage check in the background."""
+    progress = pyqtSignal(int, int) # checked, total
+    finished = pyqtSignal(bool, object) # success, report dict or error message
+
+    def __init__(self, user_id, delete_orphans=False, purge_missing=False):
+        super().__init__()
+        self.user_id = user_id
+        self.delete_orphans = delete_orphans
+        self.purge_missing = purge_missing
+
+    def run(self):
+        try:
+            success, result = db_ops.check_attachment_storage(
+                delete_orphans=self.delete_orphans, purge_missing=self.purge_missing,
+                user_id=self.user_id, progress_callback=self.progress.emit
+            )
+            self.finished.emit(success, result)
+        except Exception as e:
+            self.finished.emit(False, f"استثناء في الخلفية:\n{str(e)}")
 
 class AdminDashboardWindow(QWidget):
     def __init__(self, current_user_id):
         super().__init__()
         self.current_user_id = current_user_id
+        self.backup_worker = None
         self.setWindowTitle("لوحة تحكم الأدمن")
         self.setGeometry(100, 100, 1200, 700)
         self.setLayoutDirection(Qt.RightToLeft)
@@ -43,6 +67,10 @@ class AdminDashboardWindow(QWidget):
         self.tabs.addTab(self.backup_restore_tab, "نسخ احتياطي واستعادة")
         self.setup_backup_restore_tab()
         
+        self.storage_tab = QWidget()
+        self.tabs.addTab(self.storage_tab, "فحص المرفقات")
+        self.setup_storage_tab()
+        
         self.refresh_dashboard()
 
     def setup_overview_tab(self):
@@ -83,6 +111,10 @@ class AdminDashboardWindow(QWidget):
         self.btn_manage_depts.clicked.connect(self.open_department_management)
         user_actions_layout.addWidget(self.btn_manage_depts)
         
+        self.btn_manage_lookups = QPushButton("إدارة القيم المرجعية")
+        self.btn_manage_lookups.clicked.connect(self.open_lookup_management)
+        user_actions_layout.addWidget(self.btn_manage_lookups)
+        
         self.btn_open_trash = QPushButton("سلة محذوفات السجلات")
         self.btn_open_trash.clicked.connect(self.open_trash_bin)
         user_actions_layout.addWidget(self.btn_open_trash)
@@ -118,12 +150,71 @@ class AdminDashboardWindow(QWidget):
         
         self.status_label = QLabel("الحالة: جاهز")
         layout.addWidget(self.status_label)
+        self.backup_progress_bar = QProgressBar()
+        self.backup_progress_bar.setVisible(False)
+        layout.addWidget(self.backup_progress_bar)
+        schedule = db_ops.load_backup_schedule_settings()
+        if schedule['enabled']:
+            schedule_text = f"النسخ الاحتياطي المجدول: مفعل ({', '.join(schedule['times'])}) في المجلد {schedule['backup_dir']}"
+        else:
+            schedule_text = "النسخ الاحتياطي المجدول: غير مفعل على هذا الجهاز (راجع قسم [backup] في config.ini)"
+        layout.addWidget(QLabel(schedule_text))
         self.log_text = QTextEdit()
         self.log_text.setReadOnly(True)
         self.log_text.setMaximumHeight(200)
         layout.addWidget(QLabel("سجل العمليات:"))
         layout.addWidget(self.log_text)
 
+    def setup_storage_tab(self):
+        layout = QVBoxLayout(self.storage_tab)
+        layout.addWidget(QLabel("مطابقة ملفات المرفقات مع قاعدة البيانات والتحقق من سلامتها."))
+        btn_layout = QHBoxLayout()
+        self.btn_check_storage = QPushButton("فحص فقط")
+        self.btn_check_storage.clicked.connect(lambda: self.start_storage_check(False))
+        btn_layout.addWidget(self.btn_check_storage)
+        self.btn_clean_storage = QPushButton("فحص وتنظيف")
+        self.btn_clean_storage.setObjectName("DeleteButton")
+        self.btn_clean_storage.clicked.connect(lambda: self.start_storage_check(True))
+        btn_layout.addWidget(self.btn_clean_storage)
+        btn_layout.addStretch()
+        layout.addLayout(btn_layout)
+        self.storage_progress = QProgressBar()
+        self.storage_progress.setVisible(False)
+        layout.addWidget(self.storage_progress)
+        self.storage_report_text = QTextEdit()
+        self.storage_report_text.setReadOnly(True)
+        layout.addWidget(self.storage_report_text)
+        self.storage_worker = None
+
+    def start_storage_check(self, clean):
+        if clean:
+            reply = QMessageBox.question(self, 'تأكيد التنظيف', "سيتم حذف الملفات اليتيمة وسجلات المرفقات المفقودة نهائياً. هل تريد المتابعة؟", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes: return
+        self.btn_check_storage.setDisabled(True)
+        self.btn_clean_storage.setDisabled(True)
+        self.storage_progress.setRange(0, 0)
+        self.storage_progress.setVisible(True)
+        self.storage_report_text.setPlainText("جاري الفحص...")
+        self.storage_worker = StorageCheckWorker(self.current_user_id, delete_orphans=clean, purge_missing=clean)
+        self.storage_worker.progress.connect(self.on_storage_check_progress)
+        self.storage_worker.finished.connect(self.on_storage_check_finished)
+        self.storage_worker.start()
+
+    def on_storage_check_progress(self, checked, total):
+        self.storage_progress.setRange(0, total)
+        self.storage_progress.setValue(checked)
+
+    def on_storage_check_finished(self, success, result):
+        self.storage_progress.setVisible(False)
+        self.btn_check_storage.setDisabled(False)
+        self.btn_clean_storage.setDisabled(False)
+        if success:
+            self.storage_report_text.setPlainText(db_ops.format_storage_report(result))
+        else:
+            self.storage_report_text.setPlainText(result)
+            QMessageBox.critical(self, "خطأ", result)
+        self.storage_worker = None
+
     def refresh_dashboard(self):
         self.load_overview_data()
         self.load_users_data()
@@ -182,6 +273,10 @@ class AdminDashboardWindow(QWidget):
         dialog.exec_()
         self.refresh_dashboard()
 
+    def open_lookup_management(self):
+        dialog = LookupManagementWindow(self.current_user_id, self)
+        dialog.exec_()
+
     def open_trash_bin(self):
         dialog = TrashWindow(self.current_user_id, self)
         dialog.exec_()
@@ -208,24 +303,55 @@ class AdminDashboardWindow(QWidget):
         self.log_text.append(f"[{timestamp}] {message}")
 
     def create_backup(self):
-        default_filename = f"maintenance_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sql"
-        file_path, _ = QFileDialog.getSaveFileName(self, "حفظ النسخة الاحتياطية", default_filename, "SQL Files (*.sql)")
+        default_filename = f"maintenance_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}{db_ops.ARCHIVE_EXTENSION}"
+        file_path, _ = QFileDialog.getSaveFileName(self, "حفظ النسخة الاحتياطية", default_filename, f"{db_ops.ARCHIVE_FILE_FILTER};;Native Dump (*.jsonl.gz);;Compressed SQL (*.sql.gz);;Zstandard SQL (*.sql.zst);;SQL Files (*.sql)")
         if file_path:
-            if not file_path.lower().endswith('.sql'):
-                file_path += '.sql'
+            if not file_path.lower().endswith((db_ops.ARCHIVE_EXTENSION, '.sql', '.sql.gz', '.sql.zst') + db_ops.NATIVE_DUMP_SUFFIXES):
+                file_path += db_ops.ARCHIVE_EXTENSION
             self.status_label.setText("الحالة: جاري إنشاء النسخة الاحتياطية...")
             self.log_message(f"بدء إنشاء النسخة الاحتياطية في: {file_path}")
-            success, msg = db_ops.backup_database(file_path)
-            if success:
-                self.status_label.setText("الحالة: تم الإنشاء بنجاح")
-                QMessageBox.information(self, "نجاح", msg)
-            else:
-                self.status_label.setText("الحالة: فشل")
-                QMessageBox.critical(self, "خطأ", msg)
-            self.log_message(msg)
+            self.start_backup_worker('backup', file_path)
+
+    def start_backup_worker(self, operation, file_path):
+        """Runs a backup or restore in the background so the dashboard stays responsive."""
+        self.btn_create_backup.setDisabled(True)
+        self.btn_select_restore_file.setDisabled(True)
+        self.btn_perform_restore.setDisabled(True)
+        self.backup_progress_bar.setRange(0, 0)
+        self.backup_progress_bar.setVisible(True)
+        self.backup_worker = BackupRestoreWorker(operation, file_path)
+        self.backup_worker.progress.connect(self.on_backup_progress)
+        self.backup_worker.finished.connect(self.on_backup_finished)
+        self.backup_worker.start()
+
+    def on_backup_progress(self, permille, text):
+        if permille >= 0:
+            self.backup_progress_bar.setRange(0, 1000)
+            self.backup_progress_bar.setValue(permille)
+        else:
+            self.backup_progress_bar.setRange(0, 0)
+        self.status_label.setText(f"الحالة: {text}")
+
+    def on_backup_finished(self, success, msg):
+        operation = self.backup_worker.operation
+        self.backup_worker = None
+        self.backup_progress_bar.setVisible(False)
+        self.btn_create_backup.setDisabled(False)
+        self.btn_select_restore_file.setDisabled(False)
+        if getattr(self, 'restore_file_path', None):
+            self.btn_perform_restore.setDisabled(False)
+        if success:
+            self.status_label.setText("الحالة: تم بنجاح")
+            QMessageBox.information(self, "نجاح", msg)
+            if operation == 'restore':
+                self.refresh_dashboard()
+        else:
+            self.status_label.setText("الحالة: فشل")
+            QMessageBox.critical(self, "خطأ", msg)
+        self.log_message(msg)
 
     def select_restore_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "اختر ملف النسخة الاحتياطية", "", "SQL Files (*.sql)")
+        file_path, _ = QFileDialog.getOpenFileName(self, "اختر ملف النسخة الاحتياطية", "", f"{db_ops.ARCHIVE_FILE_FILTER};;{db_ops.BACKUP_FILE_FILTER}")
         if file_path:
             self.restore_file_path = file_path
             self.btn_perform_restore.setDisabled(False)
@@ -240,12 +366,4 @@ class AdminDashboardWindow(QWidget):
         if reply == QMessageBox.Yes:
             self.status_label.setText("الحالة: جاري استعادة النسخة الاحتياطية...")
             self.log_message(f"بدء استعادة من: {self.restore_file_path}")
-            success, msg = db_ops.restore_database(self.restore_file_path)
-            if success:
-                self.status_label.setText("الحالة: تمت الاستعادة بنجاح")
-                QMessageBox.information(self, "نجاح", msg)
-                self.refresh_dashboard()
-            else:
-                self.status_label.setText("الحالة: فشل")
-                QMessageBox.critical(self, "خطأ", msg)
-            self.log_message(msg)
\ No newline at end of file
+            self.start_backup_worker('restore', self.restore_file_path)
\ No newline at end of file
@@ -0,0 +1,26 @@
+﻿# archive_activity_log.py
+import argparse
+import sys
+import db_ops
+
+# Command-line entry point for the activity log archival job, for cron / Task
+# Scheduler (monthly is enough). Uses the [activity_log] section of config.ini.
+
+def main(argv=None):
+    settings = db_ops.load_activity_archive_settings()
+    parser = argparse.ArgumentParser(description="Move closed months of activity_log into compressed archive files.")
+    parser.add_argument("--archive-dir", default=settings['archive_dir'], help="Directory for the archive files")
+    parser.add_argument("--keep-months", type=int, default=settings['keep_months'], help="Closed months to keep in the database")
+    args = parser.parse_args(argv)
+
+    success, msg = db_ops.check_schema_version()
+    if not success:
+        print(msg)
+        return 1
+
+    success, msg = db_ops.archive_activity_log(archive_dir=args.archive_dir, keep_months=args.keep_months)
+    print(msg)
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+﻿# archive_records.py
+import argparse
+import sys
+import db_ops
+
+# Command-line entry point for moving old maintenance records to the archive
+# table, for cron / Task Scheduler (monthly is enough). Uses the
+# [maintenance_archive] section of config.ini.
+
+def main(argv=None):
+    settings = db_ops.load_record_archive_settings()
+    parser = argparse.ArgumentParser(description="Move old maintenance records into the partitioned archive table.")
+    parser.add_argument("--archive-after-months", type=int, default=settings['archive_after_months'],
+                        help="Archive records dated before the start of the month this many months ago")
+    parser.add_argument("--batch-rows", type=int, default=settings['batch_rows'], help="Records moved per transaction")
+    args = parser.parse_args(argv)
+
+    success, msg = db_ops.check_schema_version()
+    if not success:
+        print(msg)
+        return 1
+
+    success, msg = db_ops.archive_old_records(archive_after_months=args.archive_after_months, batch_rows=args.batch_rows,
+                                              progress_callback=lambda moved: print(f"Archived {moved} records..."))
+    print(msg)
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+﻿# /database/attachment_index.py
+
+import os
+from .connection import get_cursor, named_lock
+
+try:
+    import fitz
+    pdf_text_available = True
+except ImportError:
+    pdf_text_available = False
+
+# The text of PDF and plain-text attachments is extracted into
+# attachment_text (one row per PDF page) under a FULLTEXT index, so searches
+# can find records by what their reports and manuals say. attachments with
+# text_indexed_at NULL are the queue: add_attachment leaves new files there
+# and index_pending_attachments works through it in the background.
+ATTACHMENT_TEXT_EXTENSIONS = {'.txt', '.log', '.csv', '.md', '.ini', '.xml', '.json', '.htm', '.html'}
+ATTACHMENT_TEXT_MAX_BYTES = 5 * 1024 * 1024
+ATTACHMENT_INDEX_BATCH = 20
+ATTACHMENT_INDEX_LOCK = 'attachment_text_index'
+ATTACHMENT_MATCH_LIMIT = 5
+_TEXT_ENCODINGS = ('utf-8-sig', 'cp1256')
+
+def extract_attachment_text(path):
+    """Returns [(page number, text)] for a PDF or text-like file; [] for other files."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.pdf':
+        if not pdf_text_available:
+            return []
+        with fitz.open(path) as doc:
+            pages = [(number, page.get_text()) for number, page in enumerate(doc, 1)]
+        return [(number, text) for number, text in pages if text.strip()]
+    if extension in ATTACHMENT_TEXT_EXTENSIONS and os.path.getsize(path) <= ATTACHMENT_TEXT_MAX_BYTES:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        for encoding in _TEXT_ENCODINGS:
+            try:
+                text = raw.decode(encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            text = raw.decode('utf-8', errors='replace')
+        return [(1, text)] if text.strip() else []
+    return []
+
+def _index_attachment(attachment_id, path):
+    try:
+        pages = extract_attachment_text(path)
+    except Exception as e:
+        # Unreadable or missing files are marked as done with no text rather than retried forever.
+        print(f"Could not extract text from attachment {attachment_id}: {e}")
+        pages = []
+    with get_cursor() as cur:
+        cur.execute("DELETE FROM attachment_text WHERE attachment_id = %s", (attachment_id,))
+        cur.executemany("INSERT INTO attachment_text (attachment_id, page, content) VALUES (%s, %s, %s)",
+                        [(attachment_id, number, text) for number, text in pages])
+        cur.execute("UPDATE attachments SET text_indexed_at = NOW(), text_pages = %s WHERE id = %s",
+                    (len(pages), attachment_id))
+
+def index_pending_attachments(should_stop=None):
+    """
+    Extracts and stores the text of queued attachments, ATTACHMENT_INDEX_BATCH
+    at a time, until the queue is empty. Only one client works on it at a
+    time. Returns the number indexed, or None if another client holds the lock.
+    """
+    indexed = 0
+    with named_lock(ATTACHMENT_INDEX_LOCK) as acquired:
+        if not acquired:
+            return None
+        while not (should_stop and should_stop()):
+            with get_cursor() as cur:
+                cur.execute("SELECT id, stored_filepath FROM attachments WHERE text_indexed_at IS NULL ORDER BY id LIMIT %s",
+                            (ATTACHMENT_INDEX_BATCH,))
+                pending = cur.fetchall()
+            if not pending:
+                break
+            for att in pending:
+                if should_stop and should_stop():
+                    break
+                _index_attachment(att['id'], att['stored_filepath'])
+                indexed += 1
+    return indexed
+
+ATTACHMENT_TEXT_MATCH_SQL = ("SELECT a.maintenance_id FROM attachments a JOIN attachment_text t ON t.attachment_id = a.id"
+                             " WHERE MATCH(t.content) AGAINST (%s)")
+
+def find_attachment_matches(keyword, record_ids):
+    """
+    Returns {maintenance id: [{'attachment_id', 'original_filename', 'page'}]}
+    for the attachments of record_ids whose text matches keyword, best page
+    first, at most ATTACHMENT_MATCH_LIMIT per record.
+    """
+    if not keyword or not record_ids:
+        return {}
+    placeholders = ", ".join(['%s'] * len(record_ids))
+    with get_cursor() as cur:
+        cur.execute(f"""
+            SELECT a.maintenance_id, a.id AS attachment_id, a.original_filename, t.page,
+                   MATCH(t.content) AGAINST (%s) AS score
+            FROM attachments a JOIN attachment_text t ON t.attachment_id = a.id
+            WHERE a.maintenance_id IN ({placeholders}) AND MATCH(t.content) AGAINST (%s)
+            ORDER BY score DESC
+        """, (keyword, *record_ids, keyword))
+        matches = {}
+        for row in cur.fetchall():
+            record_matches = matches.setdefault(row['maintenance_id'], [])
+            if len(record_matches) < ATTACHMENT_MATCH_LIMIT:
+                record_matches.append({k: row[k] for k in ('attachment_id', 'original_filename', 'page')})
+    return matches
@@ -0,0 +1,47 @@
+﻿# attachment_indexer.py
+import threading
+from PyQt5.QtCore import QThread
+import db_ops
+
+# Also picks up attachments added from other machines while this one idles.
+ATTACHMENT_INDEX_IDLE_SEC = 60
+
+class AttachmentIndexWorker(QThread):
+    """Works through the attachment text queue in the background (see index_pending_attachments)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.wake_event = threading.Event()
+
+    def wake(self):
+        """Called after attachments were added, so they are indexed without waiting for the next round."""
+        self.wake_event.set()
+
+    def stop(self):
+        self.requestInterruption()
+        self.wake_event.set()
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            self.wake_event.clear()
+            try:
+                indexed = db_ops.index_pending_attachments(should_stop=self.isInterruptionRequested)
+                if indexed:
+                    print(f"Indexed the text of {indexed} attachments.")
+            except Exception as e:
+                print(f"Attachment indexing stopped: {e}")
+            self.wake_event.wait(ATTACHMENT_INDEX_IDLE_SEC)
+
+_worker = None
+
+def start_attachment_indexer(app):
+    """Starts the process-wide indexer at low priority; it stops when app quits."""
+    global _worker
+    _worker = AttachmentIndexWorker()
+    app.aboutToQuit.connect(_worker.stop)
+    app.aboutToQuit.connect(_worker.wait)
+    _worker.start(QThread.LowestPriority)
+
+def wake_attachment_indexer():
+    if _worker is not None:
+        _worker.wake()
@@ -0,0 +1,95 @@
+﻿# attachment_ingest.py
+import os
+import uuid
+import shutil
+import db_ops
+
+try:
+    from PIL import Image, ImageOps
+    image_optimization_available = True
+except ImportError:
+    image_optimization_available = False
+
+OPTIMIZABLE_EXTENSIONS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+
+def load_ingest_settings():
+    """Reads the [attachments] section of config.ini, falling back to safe defaults."""
+    cfg = db_ops.config
+    section = 'attachments'
+    return {
+        'optimize_images': cfg.getboolean(section, 'optimize_images', fallback=True), # As shipped in config.ini.
+        'max_dimension': cfg.getint(section, 'max_dimension', fallback=2048),
+        'jpeg_quality': cfg.getint(section, 'jpeg_quality', fallback=85),
+        'keep_original': cfg.getboolean(section, 'keep_original', fallback=False),
+        'workers': cfg.getint(section, 'ingest_workers', fallback=4),
+    }
+
+def optimize_image(source_path, dest_path, max_dimension, quality):
+    """
+    Re-encodes an image so its longest side is at most max_dimension, dropping
+    EXIF, XMP and the ICC profile. The output keeps the source format. Returns
+    True if dest_path was written, False if the source should be stored as-is
+    (unsupported format, or neither oversized nor carrying metadata). An image
+    with metadata is always re-encoded, even if that makes it larger, so
+    location and camera data never reach storage.
+    """
+    fmt = OPTIMIZABLE_EXTENSIONS.get(os.path.splitext(source_path)[1].lower())
+    if not fmt:
+        return False
+    with Image.open(source_path) as img:
+        oversized = max(img.size) > max_dimension
+        has_metadata = bool(img.info.get('exif') or img.info.get('icc_profile') or img.info.get('xmp'))
+        if not oversized and not has_metadata:
+            return False
+        # Bake the camera orientation into the pixels before the EXIF tag is dropped.
+        img = ImageOps.exif_transpose(img)
+        if oversized:
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        # Writers fall back to img.info for metadata not passed explicitly.
+        img.info = {key: value for key, value in img.info.items() if key not in ('exif', 'icc_profile', 'xmp', 'XML:com.adobe.xmp')}
+        save_kwargs = {'optimize': True, 'exif': b'', 'icc_profile': None}
+        if fmt == 'JPEG':
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            save_kwargs.update(quality=quality, progressive=True)
+        elif fmt == 'WEBP':
+            save_kwargs.update(quality=quality, method=4)
+        img.save(dest_path, fmt, **save_kwargs)
+    return True
+
+def ingest_file(source_path, settings, storage_dir=db_ops.ATTACHMENT_DIR):
+    """
+    Copies a file into attachment storage under a unique name, optimizing
+    images on the way in when enabled. Safe to call from worker threads; it
+    does not touch the database.
+
+    Returns a dict with original_filename, stored_filepath, original_size and
+    stored_size.
+    """
+    original_filename = os.path.basename(source_path)
+    file_extension = os.path.splitext(original_filename)[1]
+    stored_filepath = os.path.join(storage_dir, f"{uuid.uuid4().hex}{file_extension}")
+    optimized = False
+    try:
+        if settings['optimize_images'] and image_optimization_available:
+            try:
+                optimized = optimize_image(source_path, stored_filepath, settings['max_dimension'], settings['jpeg_quality'])
+            except Exception as e:
+                print(f"Image optimization skipped for {original_filename}: {e}")
+                if os.path.exists(stored_filepath):
+                    os.remove(stored_filepath)
+        if not optimized:
+            shutil.copy(source_path, stored_filepath)
+        elif settings['keep_original']:
+            original_path = db_ops.original_copy_path(stored_filepath)
+            os.makedirs(os.path.dirname(original_path), exist_ok=True)
+            shutil.copy(source_path, original_path)
+    except Exception:
+        db_ops.remove_stored_file(stored_filepath)
+        raise
+    return {
+        'original_filename': original_filename,
+        'stored_filepath': stored_filepath,
+        'original_size': os.path.getsize(source_path),
+        'stored_size': os.path.getsize(stored_filepath),
+    }
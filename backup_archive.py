@@ -0,0 +1,325 @@
+﻿# /database/backup_archive.py
+
+import os
+import io
+import hashlib
+import json
+import shutil
+import tarfile
+import tempfile
+from datetime import datetime
+from .connection import get_cursor
+from .utility_queries import backup_database, restore_database
+from .native_backup import native_backup_database, native_restore_database, is_native_dump, backup_engine
+from .storage_queries import ATTACHMENT_DIR, ORIGINALS_SUBDIR, file_sha256, original_copy_path, HASH_CHUNK_SIZE
+
+# A backup archive is a plain (uncompressed) tar holding:
+#   manifest.json         - format version, kind, and every attachment with its hash
+#   database.jsonl.gz     - full compressed dump of the schema (database.sql.gz
+#                           when the mysqldump engine is configured)
+#   attachments/<name>    - attachment files stored by this archive
+#   originals/<name>      - untouched originals kept for optimized images
+#                           (keep_original), listed under 'originals'
+# The dump and most attachments are already compressed, so the tar itself is not.
+# An incremental archive stores only attachments that changed since the base
+# manifest; its manifest still lists every attachment and names the archive
+# that holds each one, so any archive can be restored from its directory.
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_EXTENSION = ".mbak"
+ARCHIVE_FILE_FILTER = "Maintenance Backup (*.mbak)"
+MANIFEST_NAME = "manifest.json"
+DUMP_NAME = "database.sql.gz"
+NATIVE_DUMP_NAME = "database.jsonl.gz"
+ATTACHMENTS_PREFIX = "attachments/"
+ORIGINALS_PREFIX = ORIGINALS_SUBDIR + "/"
+
+def manifest_sidecar_path(archive_path):
+    """The manifest is also written next to the archive so incremental runs need not open it."""
+    return archive_path + ".manifest.json"
+
+def _archive_path_for(archive_or_sidecar_path):
+    if archive_or_sidecar_path.endswith(".manifest.json"):
+        return archive_or_sidecar_path[:-len(".manifest.json")]
+    return archive_or_sidecar_path
+
+def load_manifest(archive_or_sidecar_path):
+    """Loads a manifest from a sidecar file, or from inside an archive."""
+    archive_path = _archive_path_for(archive_or_sidecar_path)
+    sidecar = manifest_sidecar_path(archive_path)
+    if os.path.exists(sidecar):
+        with open(sidecar, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    with tarfile.open(archive_path, 'r') as tar:
+        return json.load(tar.extractfile(MANIFEST_NAME))
+
+def find_latest_manifest(directory):
+    """Returns the path of the newest manifest sidecar in a directory, or None."""
+    latest_path, latest_created = None, ""
+    if not os.path.isdir(directory):
+        return None
+    for name in os.listdir(directory):
+        if not name.endswith(ARCHIVE_EXTENSION + ".manifest.json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                created = json.load(f).get('created_at', "")
+        except (OSError, ValueError):
+            continue
+        if created > latest_created and os.path.exists(_archive_path_for(path)):
+            latest_path, latest_created = path, created
+    return latest_path
+
+def _backup_dump(output_path, progress_callback=None, throttle=None):
+    """Runs the native or mysqldump engine; a .jsonl* path always uses the native one."""
+    if is_native_dump(output_path):
+        return native_backup_database(output_path, progress_callback=progress_callback, throttle=throttle)
+    return backup_database(output_path, progress_callback=progress_callback, throttle=throttle)
+
+def _restore_dump(input_path, progress_callback=None, table_progress_callback=None):
+    """Native dumps restore table-by-table in parallel; SQL dumps replay through the mysql client."""
+    if is_native_dump(input_path):
+        return native_restore_database(input_path, progress_callback=progress_callback,
+                                       table_progress_callback=table_progress_callback)
+    return restore_database(input_path, progress_callback=progress_callback)
+
+def _current_files():
+    """
+    Returns ({stored_name: (path, sha256 or None)} for every attachment whose
+    file exists, the same for their kept originals).
+    """
+    with get_cursor() as cur:
+        cur.execute("SELECT id, stored_filepath, sha256 FROM attachments")
+        rows = cur.fetchall()
+    attachments, originals = {}, {}
+    for row in rows:
+        name = os.path.basename(row['stored_filepath'])
+        if os.path.exists(row['stored_filepath']):
+            attachments[name] = (row['stored_filepath'], row['sha256'])
+        original_path = original_copy_path(row['stored_filepath'])
+        if os.path.exists(original_path):
+            originals[name] = (original_path, None)
+    return attachments, originals
+
+class _ThrottledReader:
+    """File wrapper that charges every read against an IoThrottle."""
+    def __init__(self, fileobj, throttle):
+        self._fileobj = fileobj
+        self._throttle = throttle
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._throttle.consume(len(data))
+        return data
+
+def _add_file(tar, path, arcname, throttle=None):
+    info = tar.gettarinfo(path, arcname=arcname)
+    with open(path, 'rb') as f:
+        tar.addfile(info, _ThrottledReader(f, throttle) if throttle else f)
+
+def _add_bytes(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(datetime.now().timestamp())
+    tar.addfile(info, io.BytesIO(data))
+
+def create_backup_archive(output_path, incremental=False, base_manifest_path=None, progress_callback=None, throttle=None):
+    """
+    Writes a unified backup archive with the database dump and attachment files.
+
+    With incremental=True, attachments whose size, modification time and hash
+    match the base manifest (by default the newest one next to output_path)
+    are referenced rather than copied. Falls back to a full archive when no
+    base manifest exists.
+
+    progress_callback(phase, done, total) is called with phase 'database'
+    (rows done / estimated rows) or 'attachments' (bytes done / bytes total).
+    An optional IoThrottle paces both the dump and the attachment copies.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="mbak_")
+    try:
+        archive_name = os.path.basename(output_path)
+        base = None
+        if incremental:
+            base_manifest_path = base_manifest_path or find_latest_manifest(os.path.dirname(os.path.abspath(output_path)))
+            if base_manifest_path:
+                base = load_manifest(base_manifest_path)
+
+        dump_name = NATIVE_DUMP_NAME if backup_engine() == 'native' else DUMP_NAME
+        dump_path = os.path.join(tmp_dir, dump_name)
+        db_progress = (lambda bytes_done, rows_total, rows_done: progress_callback('database', rows_done, rows_total)) if progress_callback else None
+        success, msg = _backup_dump(dump_path, progress_callback=db_progress, throttle=throttle)
+        if not success:
+            return False, msg
+
+        sections = {'attachments': {}, 'originals': {}}
+        to_store = []
+        for section, prefix, files in zip(sections, (ATTACHMENTS_PREFIX, ORIGINALS_PREFIX), _current_files()):
+            base_files = base.get(section, {}) if base else {}
+            for name, (path, known_sha256) in files.items():
+                st = os.stat(path)
+                previous = base_files.get(name)
+                unchanged = previous and previous['size'] == st.st_size and (
+                    (known_sha256 and known_sha256 == previous['sha256']) or
+                    (not known_sha256 and previous['mtime_ns'] == st.st_mtime_ns))
+                if unchanged:
+                    sections[section][name] = dict(previous)
+                else:
+                    to_store.append((section, prefix, name, path, known_sha256, st))
+
+        total_bytes = sum(st.st_size for *_, st in to_store)
+        done_bytes = 0
+        with tarfile.open(output_path, 'w') as tar:
+            tar.add(dump_path, arcname=dump_name)
+            for section, prefix, name, path, known_sha256, st in to_store:
+                digest = known_sha256 or file_sha256(path)
+                _add_file(tar, path, prefix + name, throttle)
+                sections[section][name] = {'sha256': digest, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'archive': archive_name}
+                done_bytes += st.st_size
+                if progress_callback:
+                    progress_callback('attachments', done_bytes, total_bytes)
+            manifest = {
+                'format_version': ARCHIVE_FORMAT_VERSION,
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'kind': 'incremental' if base else 'full',
+                'base': os.path.basename(_archive_path_for(base_manifest_path)) if base else None,
+                'database': dump_name,
+                'attachments': sections['attachments'],
+                'originals': sections['originals'],
+            }
+            manifest_bytes = json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+            _add_bytes(tar, MANIFEST_NAME, manifest_bytes)
+        with open(manifest_sidecar_path(output_path), 'wb') as f:
+            f.write(manifest_bytes)
+        kind = "تزايدية" if base else "كاملة"
+        return True, (f"تم إنشاء نسخة احتياطية {kind} في:\n{output_path}\n"
+                      f"({len(to_store)} ملف جديد أو معدل من أصل {len(sections['attachments']) + len(sections['originals'])})")
+    except Exception as e:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False, f"حدث استثناء أثناء النسخ الاحتياطي:\n{str(e)}"
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def create_backup(output_path, incremental=False, progress_callback=None, throttle=None):
+    """
+    Creates a backup in the format implied by the extension: a unified .mbak
+    archive, a native .jsonl/.jsonl.gz/.jsonl.zst dump, or a mysqldump
+    .sql/.sql.gz/.sql.zst dump.
+    progress_callback(phase, done, total) as for create_backup_archive.
+    """
+    if output_path.lower().endswith(ARCHIVE_EXTENSION):
+        return create_backup_archive(output_path, incremental=incremental, progress_callback=progress_callback, throttle=throttle)
+    db_progress = (lambda bytes_done, rows_total, rows_done: progress_callback('database', rows_done, rows_total)) if progress_callback else None
+    return _backup_dump(output_path, progress_callback=db_progress, throttle=throttle)
+
+def restore_backup(input_path, progress_callback=None, table_progress_callback=None):
+    """
+    Restores a .mbak archive or a database-only dump, chosen by extension.
+    table_progress_callback(table, state, rows_done, rows_total) is only
+    called for native dumps; see native_restore_database.
+    """
+    if input_path.lower().endswith(ARCHIVE_EXTENSION):
+        return restore_backup_archive(input_path, progress_callback=progress_callback,
+                                      table_progress_callback=table_progress_callback)
+    db_progress = (lambda done, total, rows_done: progress_callback('database', done, total)) if progress_callback else None
+    return _restore_dump(input_path, progress_callback=db_progress, table_progress_callback=table_progress_callback)
+
+def _safe_path(base_dir, name):
+    """
+    base_dir/name for a bare file name read from an archive manifest. Raises
+    ValueError for anything that could resolve outside base_dir (absolute
+    names, path separators, '..'), so a crafted archive cannot write or read
+    other files.
+    """
+    if (not isinstance(name, str) or not name or os.path.isabs(name) or '..' in name
+            or any(sep in name for sep in ('/', '\\', ':'))):
+        raise ValueError(f"اسم ملف غير صالح في النسخة الاحتياطية: {name!r}")
+    base = os.path.realpath(base_dir)
+    path = os.path.realpath(os.path.join(base, name))
+    if os.path.commonpath([base, path]) != base:
+        raise ValueError(f"اسم ملف غير صالح في النسخة الاحتياطية: {name!r}")
+    return path
+
+def _extract_verified(tar, member_name, dest_path, expected_sha256):
+    """Extracts one member to dest_path via a temp file, keeping it only if the hash matches."""
+    digest = hashlib.sha256()
+    tmp_path = dest_path + ".restoring"
+    with tar.extractfile(member_name) as src, open(tmp_path, 'wb') as dst:
+        for chunk in iter(lambda: src.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            dst.write(chunk)
+    if digest.hexdigest() != expected_sha256:
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, dest_path)
+    return True
+
+def restore_backup_archive(archive_path, storage_dir=ATTACHMENT_DIR, progress_callback=None, table_progress_callback=None):
+    """
+    Restores the database dump and every attachment (and kept original)
+    listed in the archive's manifest. Attachments held by earlier archives of an incremental chain are
+    read from those archives, which must sit in the same directory. Files
+    already present with the right size are left alone.
+
+    progress_callback(phase, done, total) mirrors create_backup_archive.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="mbak_")
+    try:
+        if not os.path.exists(archive_path):
+            return False, f"ملف النسخة الاحتياطية غير موجود: {archive_path}"
+        archive_dir = os.path.dirname(os.path.abspath(archive_path))
+        with tarfile.open(archive_path, 'r') as tar:
+            manifest = json.load(tar.extractfile(MANIFEST_NAME))
+            if manifest.get('format_version', 0) > ARCHIVE_FORMAT_VERSION:
+                return False, "صيغة النسخة الاحتياطية أحدث من هذا الإصدار من البرنامج."
+            dump_path = _safe_path(tmp_dir, manifest['database'])
+            # Check every name before anything is restored. Originals are missing from older manifests.
+            originals_dir = os.path.join(storage_dir, ORIGINALS_SUBDIR)
+            files = [(ATTACHMENTS_PREFIX, name, entry, _safe_path(storage_dir, name))
+                     for name, entry in manifest['attachments'].items()]
+            files += [(ORIGINALS_PREFIX, name, entry, _safe_path(originals_dir, name))
+                      for name, entry in manifest.get('originals', {}).items()]
+            for _, _, entry, _ in files:
+                _safe_path(archive_dir, entry['archive'])
+            with tar.extractfile(manifest['database']) as src, open(dump_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, HASH_CHUNK_SIZE)
+
+        db_progress = (lambda done, total, rows_done: progress_callback('database', done, total)) if progress_callback else None
+        success, msg = _restore_dump(dump_path, progress_callback=db_progress, table_progress_callback=table_progress_callback)
+        if not success:
+            return False, msg
+
+        os.makedirs(storage_dir, exist_ok=True)
+        if manifest.get('originals'):
+            os.makedirs(originals_dir, exist_ok=True)
+        by_archive = {}
+        for prefix, name, entry, dest in files:
+            if os.path.exists(dest) and os.path.getsize(dest) == entry['size']:
+                continue
+            by_archive.setdefault(entry['archive'], []).append((prefix, name, entry, dest))
+
+        total = sum(entry['size'] for items in by_archive.values() for _, _, entry, _ in items)
+        done, restored, failed = 0, 0, []
+        for source_name, items in by_archive.items():
+            source_path = _safe_path(archive_dir, source_name)
+            if not os.path.exists(source_path):
+                failed.extend(prefix + name for prefix, name, _, _ in items)
+                continue
+            with tarfile.open(source_path, 'r') as tar:
+                for prefix, name, entry, dest in items:
+                    if _extract_verified(tar, prefix + name, dest, entry['sha256']):
+                        restored += 1
+                    else:
+                        failed.append(prefix + name)
+                    done += entry['size']
+                    if progress_callback:
+                        progress_callback('attachments', done, total)
+        if failed:
+            return False, (f"تمت استعادة قاعدة البيانات و{restored} مرفق، لكن تعذرت استعادة {len(failed)} مرفق "
+                           f"(ملف نسخة سابق مفقود أو تالف):\n" + "\n".join(failed[:20]))
+        return True, f"تمت استعادة النسخة الاحتياطية بنجاح ({restored} مرفق)."
+    except Exception as e:
+        return False, f"حدث استثناء أثناء استعادة النسخة الاحتياطية:\n{str(e)}"
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -1,6 +1,7 @@
 ﻿# backup_restore_ui.py
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QFileDialog, QMessageBox, QTextEdit, QProgressBar
+    QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QFileDialog, QMessageBox, QTextEdit, QProgressBar,
+    QCheckBox, QTableWidget, QTableWidgetItem, QHeaderView
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 import db_ops
@@ -10,18 +11,33 @@ from datetime import datetime
 class BackupRestoreWorker(QThread):
     """Worker thread to perform backup/restore operations without freezing the UI."""
     finished = pyqtSignal(bool, str) # Signal emitted when operation finishes (success, message)
+    progress = pyqtSignal(int, str) # per-mille done (-1 if unknown), status text
+    table_progress = pyqtSignal(str, str, int, int) # table, state, rows done, rows total (emitted from restore threads)
 
-    def __init__(self, operation, file_path=None):
+    def __init__(self, operation, file_path=None, incremental=False):
         super().__init__()
         self.operation = operation # 'backup' or 'restore'
         self.file_path = file_path
+        self.incremental = incremental
+
+    def _emit_progress(self, phase, done, total):
+        permille = min(1000, int(done * 1000 / total)) if total > 0 else -1
+        if phase == 'attachments':
+            text = f"المرفقات: {done / (1024 * 1024):.1f} / {total / (1024 * 1024):.1f} MB"
+        elif self.operation == 'backup':
+            text = f"قاعدة البيانات: {done} صف"
+        else:
+            text = f"قاعدة البيانات: {done / (1024 * 1024):.1f} MB"
+        self.progress.emit(permille, text)
 
     def run(self):
         try:
             if self.operation == 'backup':
-                success, msg = db_ops.backup_database(self.file_path)
+                success, msg = db_ops.create_backup(self.file_path, incremental=self.incremental,
+                                                    progress_callback=self._emit_progress)
             elif self.operation == 'restore':
-                success, msg = db_ops.restore_database(self.file_path)
+                success, msg = db_ops.restore_backup(self.file_path, progress_callback=self._emit_progress,
+                                                     table_progress_callback=self.table_progress.emit)
             else:
                 success, msg = False, f"عملية غير معروفة: {self.operation}"
             self.finished.emit(success, msg)
@@ -29,6 +45,14 @@ class BackupRestoreWorker(QThread):
             self.finished.emit(False, f"استثناء في الخلفية:\n{str(e)}")
 
 
+TABLE_STATE_LABELS = {
+    'queued': "في الانتظار",
+    'loading': "جاري التحميل",
+    'indexing': "بناء الفهارس",
+    'done': "تم",
+    'failed': "فشل",
+}
+
 class BackupRestoreWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -36,6 +60,8 @@ class BackupRestoreWindow(QWidget):
         self.setGeometry(200, 200, 600, 400)
         self.setLayoutDirection(Qt.RightToLeft)
         self.worker = None # To hold the background worker thread
+        self.table_rows = {} # table name -> row in tables_view
+        self.table_counts = {} # table name -> (rows done, rows total)
         self.init_ui()
 
     def init_ui(self):
@@ -45,9 +71,12 @@ class BackupRestoreWindow(QWidget):
         backup_label = QLabel("<b>إنشاء نسخة احتياطية:</b>")
         layout.addWidget(backup_label)
 
-        self.backup_info_label = QLabel("سيتم حفظ النسخة الاحتياطية كملف .sql في الموقع الذي تختاره.")
+        self.backup_info_label = QLabel("سيتم حفظ قاعدة البيانات والمرفقات في ملف نسخة احتياطية واحد (.mbak) في الموقع الذي تختاره.")
         layout.addWidget(self.backup_info_label)
 
+        self.incremental_checkbox = QCheckBox("نسخة تزايدية (المرفقات الجديدة أو المعدلة فقط منذ آخر نسخة في نفس المجلد)")
+        layout.addWidget(self.incremental_checkbox)
+
         backup_btn_layout = QHBoxLayout()
         self.btn_create_backup = QPushButton("إنشاء نسخة احتياطية")
         self.btn_create_backup.clicked.connect(self.create_backup)
@@ -58,7 +87,7 @@ class BackupRestoreWindow(QWidget):
         restore_label = QLabel("<b>استعادة من نسخة احتياطية:</b>")
         layout.addWidget(restore_label)
 
-        self.restore_info_label = QLabel("اختر ملف .sql للاستعادة منه. تحذير: هذا سيستبدل البيانات الحالية!")
+        self.restore_info_label = QLabel("اختر ملف .mbak (أو ملف .sql قديم) للاستعادة منه. تحذير: هذا سيستبدل البيانات الحالية!")
         layout.addWidget(self.restore_info_label)
 
         restore_btn_layout = QHBoxLayout()
@@ -81,6 +110,14 @@ class BackupRestoreWindow(QWidget):
         self.progress_bar.setVisible(False) # Hide initially
         layout.addWidget(self.progress_bar)
 
+        # Per-table progress for parallel restores of native dumps
+        self.tables_view = QTableWidget(0, 3)
+        self.tables_view.setHorizontalHeaderLabels(["الجدول", "الحالة", "الصفوف"])
+        self.tables_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.tables_view.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.tables_view.setVisible(False)
+        layout.addWidget(self.tables_view)
+
         self.log_text = QTextEdit()
         self.log_text.setReadOnly(True)
         self.log_text.setMaximumHeight(150) # Limit height
@@ -103,10 +140,52 @@ class BackupRestoreWindow(QWidget):
         self.btn_perform_restore.setDisabled(True)
         self.log_message(f"بدء {operation}...")
 
-        self.worker = BackupRestoreWorker(operation, file_path)
+        self.progress_bar.setRange(0, 0)
+        self.tables_view.setRowCount(0)
+        self.tables_view.setVisible(False)
+        self.table_rows.clear()
+        self.table_counts.clear()
+        self.worker = BackupRestoreWorker(operation, file_path, incremental=self.incremental_checkbox.isChecked())
+        self.worker.progress.connect(self.on_operation_progress)
+        self.worker.table_progress.connect(self.on_table_progress)
         self.worker.finished.connect(self.on_operation_finished)
         self.worker.start()
 
+    def on_operation_progress(self, permille, text):
+        """Updates the progress bar; the worker reports per-mille so large byte counts fit in an int."""
+        if permille >= 0:
+            self.progress_bar.setRange(0, 1000)
+            self.progress_bar.setValue(permille)
+        else:
+            self.progress_bar.setRange(0, 0)
+        self.status_label.setText(f"الحالة: {text}")
+
+    def on_table_progress(self, table, state, done, total):
+        """Updates one table's row and the overall bar while tables load in parallel."""
+        row = self.table_rows.get(table)
+        if row is None:
+            row = self.tables_view.rowCount()
+            self.tables_view.insertRow(row)
+            self.tables_view.setItem(row, 0, QTableWidgetItem(table))
+            self.tables_view.setItem(row, 1, QTableWidgetItem())
+            self.tables_view.setItem(row, 2, QTableWidgetItem())
+            self.table_rows[table] = row
+            self.tables_view.setVisible(True)
+        self.tables_view.item(row, 1).setText(TABLE_STATE_LABELS.get(state, state))
+        self.tables_view.item(row, 2).setText(f"{done} / {total}")
+        if state == 'failed':
+            self.log_message(f"فشلت استعادة الجدول: {table}")
+        elif state == 'done':
+            self.log_message(f"تمت استعادة الجدول {table} ({total} صف)")
+
+        self.table_counts[table] = (done, total)
+        rows_done = sum(d for d, _ in self.table_counts.values())
+        rows_total = sum(t for _, t in self.table_counts.values())
+        if rows_total > 0:
+            self.progress_bar.setRange(0, 1000)
+            self.progress_bar.setValue(min(1000, int(rows_done * 1000 / rows_total)))
+        self.status_label.setText(f"الحالة: تحميل الجداول: {rows_done} / {rows_total} صف")
+
     def on_operation_finished(self, success, message):
         """Handles the result when the background operation finishes."""
         self.progress_bar.setVisible(False)
@@ -130,20 +209,22 @@ class BackupRestoreWindow(QWidget):
     def create_backup(self):
         """Handles the 'Create Backup' button click."""
         # Suggest a default filename with timestamp
-        default_filename = f"maintenance_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sql"
+        suffix = "_incr" if self.incremental_checkbox.isChecked() else ""
+        default_filename = f"maintenance_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}{db_ops.ARCHIVE_EXTENSION}"
         file_path, _ = QFileDialog.getSaveFileName(
-            self, "حفظ النسخة الاحتياطية", default_filename, "SQL Files (*.sql)"
+            self, "حفظ النسخة الاحتياطية", default_filename,
+            f"{db_ops.ARCHIVE_FILE_FILTER};;Native Dump (*.jsonl.gz);;Compressed SQL (*.sql.gz);;Zstandard SQL (*.sql.zst);;SQL Files (*.sql)"
         )
         if file_path:
-            # Ensure .sql extension
-            if not file_path.lower().endswith('.sql'):
-                file_path += '.sql'
+            # Ensure a backup extension; default to the unified archive
+            if not file_path.lower().endswith((db_ops.ARCHIVE_EXTENSION, '.sql', '.sql.gz', '.sql.zst') + db_ops.NATIVE_DUMP_SUFFIXES):
+                file_path += db_ops.ARCHIVE_EXTENSION
             self.start_operation('backup', file_path)
 
     def select_restore_file(self):
         """Handles the 'Select Restore File' button click."""
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "اختر ملف النسخة الاحتياطية", "", "SQL Files (*.sql)"
+            self, "اختر ملف النسخة الاحتياطية", "", f"{db_ops.ARCHIVE_FILE_FILTER};;{db_ops.BACKUP_FILE_FILTER}"
         )
         if file_path:
             self.restore_file_path = file_path
@@ -0,0 +1,171 @@
+﻿# /database/backup_schedule.py
+
+import os
+from datetime import datetime, timedelta
+from .connection import config, named_lock, get_cursor
+from .utility_queries import log_activity, IoThrottle
+from .activity_codes import ACTIVITY_ACTIONS, ACTIVITY_RECORD_TYPES
+from .backup_archive import (create_backup, load_manifest, manifest_sidecar_path,
+                             ARCHIVE_EXTENSION)
+
+# Scheduled backups are named maintenance_auto_<YYYYmmdd_HHMMSS>.mbak so the
+# retention policy can tell them apart from manual backups, which it never
+# touches. Outcomes are written to activity_log with record_type
+# 'scheduled_backup'; that table is shared by every client, so it also tells
+# each instance when the last scheduled run happened.
+SCHEDULED_BACKUP_PREFIX = "maintenance_auto_"
+SCHEDULED_BACKUP_LOCK = "maintenance_scheduled_backup"
+FULL_BACKUP_INTERVAL_DAYS = 7
+
+def load_backup_schedule_settings():
+    """Reads the schedule and retention options from the [backup] section of config.ini."""
+    section = 'backup'
+    times = config.get(section, 'schedule_times', fallback='02:00')
+    return {
+        'enabled': config.getboolean(section, 'schedule_enabled', fallback=False),
+        'times': sorted(t.strip() for t in times.split(',') if t.strip()),
+        'backup_dir': config.get(section, 'backup_dir', fallback='backups'),
+        'incremental': config.getboolean(section, 'incremental', fallback=True),
+        'throttle_mb_per_sec': config.getfloat(section, 'throttle_mb_per_sec', fallback=20.0),
+        'keep_daily': config.getint(section, 'keep_daily', fallback=7),
+        'keep_weekly': config.getint(section, 'keep_weekly', fallback=4),
+        'keep_monthly': config.getint(section, 'keep_monthly', fallback=6),
+    }
+
+def last_scheduled_backup_time():
+    """Returns when the last successful scheduled backup finished, from any client, or None."""
+    with get_cursor() as cur:
+        cur.execute("SELECT MAX(timestamp) AS last_run FROM activity_log WHERE action_code = %s AND record_type_code = %s",
+                    (ACTIVITY_ACTIONS['BACKUP'], ACTIVITY_RECORD_TYPES['scheduled_backup']))
+        return cur.fetchone()['last_run']
+
+def latest_due_slot(times, now):
+    """Returns the most recent configured HH:MM slot at or before now, or None if no times are set."""
+    slots = []
+    for day in (now.date() - timedelta(days=1), now.date()):
+        for hhmm in times:
+            hour, minute = (int(part) for part in hhmm.split(':'))
+            slots.append(datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute))
+    past = [slot for slot in slots if slot <= now]
+    return max(past) if past else None
+
+def is_backup_due(settings, now=None, last_run=None):
+    """True if a configured slot has passed since last_run (a missed slot is caught up once)."""
+    now = now or datetime.now()
+    slot = latest_due_slot(settings['times'], now)
+    return slot is not None and (last_run is None or last_run < slot)
+
+def list_scheduled_backups(backup_dir):
+    """Returns [(path, created_at)] for every scheduled archive in backup_dir."""
+    backups = []
+    if not os.path.isdir(backup_dir):
+        return backups
+    for name in os.listdir(backup_dir):
+        if not (name.startswith(SCHEDULED_BACKUP_PREFIX) and name.endswith(ARCHIVE_EXTENSION)):
+            continue
+        stamp = name[len(SCHEDULED_BACKUP_PREFIX):-len(ARCHIVE_EXTENSION)]
+        try:
+            created = datetime.strptime(stamp, "%Y%m%d_%H%M%S")
+        except ValueError:
+            continue
+        backups.append((os.path.join(backup_dir, name), created))
+    return backups
+
+def select_backups_to_keep(backups, keep_daily, keep_weekly, keep_monthly):
+    """
+    Grandfather-father-son retention: keeps the newest backup of each of the
+    last keep_daily days, keep_weekly ISO weeks and keep_monthly months that
+    have a backup. backups is [(path, created_at)]; returns a set of paths.
+    """
+    newest_first = sorted(backups, key=lambda b: b[1], reverse=True)
+    keep = set()
+    for bucket, limit in ((lambda d: d.date(), keep_daily),
+                          (lambda d: d.isocalendar()[:2], keep_weekly),
+                          (lambda d: (d.year, d.month), keep_monthly)):
+        seen = set()
+        for path, created in newest_first:
+            key = bucket(created)
+            if key in seen:
+                continue
+            if len(seen) >= limit:
+                break
+            seen.add(key)
+            keep.add(path)
+    return keep
+
+def prune_scheduled_backups(backup_dir, keep_daily, keep_weekly, keep_monthly):
+    """
+    Deletes scheduled archives that fall outside the retention policy.
+    Archives still referenced by a kept incremental archive are kept too,
+    since the incremental one cannot be restored without them.
+    Returns the list of deleted paths.
+    """
+    backups = list_scheduled_backups(backup_dir)
+    keep = select_backups_to_keep(backups, keep_daily, keep_weekly, keep_monthly)
+    for path in list(keep):
+        try:
+            manifest = load_manifest(path)
+            for entry in [*manifest['attachments'].values(), *manifest.get('originals', {}).values()]:
+                keep.add(os.path.join(backup_dir, entry['archive']))
+        except Exception as e:
+            print(f"Could not read manifest of {path}: {e}")
+    deleted = []
+    for path, _ in backups:
+        if path in keep:
+            continue
+        for victim in (path, manifest_sidecar_path(path)):
+            if os.path.exists(victim):
+                os.remove(victim)
+        deleted.append(path)
+    return deleted
+
+def _needs_full_backup(backup_dir, now):
+    """True unless a full scheduled archive newer than FULL_BACKUP_INTERVAL_DAYS exists."""
+    for path, created in list_scheduled_backups(backup_dir):
+        if now - created >= timedelta(days=FULL_BACKUP_INTERVAL_DAYS):
+            continue
+        try:
+            if load_manifest(path).get('kind') == 'full':
+                return False
+        except Exception:
+            continue
+    return True
+
+def run_scheduled_backup(settings=None, force_full=False, prune=True, progress_callback=None):
+    """
+    Runs one scheduled backup into settings['backup_dir'], throttled to
+    throttle_mb_per_sec, then applies the retention policy. Incremental runs
+    start a new full archive every FULL_BACKUP_INTERVAL_DAYS so chains stay
+    short. A MySQL named lock keeps two clients from running the same slot.
+    The outcome is recorded in activity_log. Returns (success, message).
+    """
+    settings = settings or load_backup_schedule_settings()
+    backup_dir = settings['backup_dir']
+    with named_lock(SCHEDULED_BACKUP_LOCK) as acquired:
+        if not acquired:
+            return False, "نسخة احتياطية مجدولة أخرى قيد التنفيذ حالياً."
+        try:
+            os.makedirs(backup_dir, exist_ok=True)
+            now = datetime.now()
+            incremental = settings['incremental'] and not force_full and not _needs_full_backup(backup_dir, now)
+            output_path = os.path.join(backup_dir, f"{SCHEDULED_BACKUP_PREFIX}{now.strftime('%Y%m%d_%H%M%S')}{ARCHIVE_EXTENSION}")
+            throttle = IoThrottle(int(settings['throttle_mb_per_sec'] * 1024 * 1024))
+            success, msg = create_backup(output_path, incremental=incremental,
+                                         progress_callback=progress_callback, throttle=throttle)
+            if not success:
+                log_activity(None, 'BACKUP_FAILED', 'scheduled_backup', None, {'error': msg})
+                return False, msg
+            deleted = []
+            if prune:
+                deleted = prune_scheduled_backups(backup_dir, settings['keep_daily'],
+                                                  settings['keep_weekly'], settings['keep_monthly'])
+            log_activity(None, 'BACKUP', 'scheduled_backup', None, {
+                'kind': "incremental" if incremental else "full",
+                'file': os.path.basename(output_path),
+                'size_mb': round(os.path.getsize(output_path) / (1024 * 1024), 1),
+                'pruned': len(deleted),
+            })
+            return True, msg + (f"\nتم حذف {len(deleted)} نسخة قديمة حسب سياسة الاحتفاظ." if deleted else "")
+        except Exception as e:
+            log_activity(None, 'BACKUP_FAILED', 'scheduled_backup', None, {'error': str(e)})
+            return False, f"حدث استثناء أثناء النسخ الاحتياطي المجدول:\n{str(e)}"
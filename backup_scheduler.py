@@ -0,0 +1,76 @@
+﻿# backup_scheduler.py
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal
+from datetime import datetime
+import db_ops
+
+SCHEDULE_CHECK_INTERVAL_MS = 60 * 1000
+
+class ScheduledBackupWorker(QThread):
+    """Runs one scheduled backup (create + prune + log) off the UI thread."""
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, settings):
+        super().__init__()
+        self.settings = settings
+
+    def run(self):
+        try:
+            success, msg = db_ops.run_scheduled_backup(self.settings)
+            self.finished.emit(success, msg)
+        except Exception as e:
+            self.finished.emit(False, f"استثناء في الخلفية:\n{str(e)}")
+
+
+class BackupScheduler(QObject):
+    """
+    In-app scheduler for installations without cron. Once a minute it checks
+    whether a [backup] schedule_times slot has passed since the last scheduled
+    backup recorded in activity_log by any client, and if so runs one in the
+    background. A slot that fails is not retried until the next slot.
+    """
+    backup_finished = pyqtSignal(bool, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.settings = db_ops.load_backup_schedule_settings()
+        self.worker = None
+        self.last_attempt = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(SCHEDULE_CHECK_INTERVAL_MS)
+        self.timer.timeout.connect(self.check_schedule)
+
+    def start(self):
+        """Starts checking if schedule_enabled is set in config.ini; returns whether it did."""
+        if not self.settings['enabled'] or not self.settings['times']:
+            return False
+        self.timer.start()
+        self.check_schedule()
+        return True
+
+    def stop(self):
+        self.timer.stop()
+
+    def check_schedule(self):
+        if self.worker is not None:
+            return
+        now = datetime.now()
+        slot = db_ops.latest_due_slot(self.settings['times'], now)
+        if slot is None or (self.last_attempt and self.last_attempt >= slot):
+            return
+        try:
+            last_run = db_ops.last_scheduled_backup_time()
+        except Exception as e:
+            print(f"Could not read the last scheduled backup time: {e}")
+            return
+        if not db_ops.is_backup_due(self.settings, now, last_run):
+            return
+        self.last_attempt = now
+        self.worker = ScheduledBackupWorker(self.settings)
+        self.worker.finished.connect(self.on_backup_finished)
+        # Keep the backup from competing with the UI thread for the CPU.
+        self.worker.start(QThread.LowestPriority)
+
+    def on_backup_finished(self, success, message):
+        print(f"Scheduled backup {'succeeded' if success else 'failed'}: {message}")
+        self.worker = None
+        self.backup_finished.emit(success, message)
@@ -24,25 +24,28 @@ config = configparser.ConfigParser()
 config.read(config_path, encoding='utf-8')
 
 # --- Database Connection Pool ---
+POOL_SIZE = 5
 _pool = None
 
+def _connection_args():
+    return dict(
+        host=config.get('database', 'host'),
+        user=config.get('database', 'user'),
+        password=config.get('database', 'password'),
+        database=config.get('database', 'database'),
+        charset=config.get('database', 'charset'),
+        collation=config.get('database', 'collation'),
+        use_pure=True
+    )
+
 def init_connection_pool():
     """Initializes the database connection pool."""
     global _pool
     if _pool is None:
         try:
-            db_config = dict(
-                host=config.get('database', 'host'),
-                user=config.get('database', 'user'),
-                password=config.get('database', 'password'),
-                database=config.get('database', 'database'),
-                charset=config.get('database', 'charset'),
-                collation=config.get('database', 'collation'),
-                use_pure=True
-            )
             _pool = pooling.MySQLConnectionPool(pool_name="mypool",
-                                                  pool_size=5,
-                                                  **db_config)
+                                                  pool_size=POOL_SIZE,
+                                                  **_connection_args())
             print("Database connection pool initialized successfully.")
         except mysql.connector.Error as err:
             print(f"Error creating connection pool: {err}")
@@ -56,6 +59,67 @@ def get_db_config():
     return dict(config.items('database'))
 
 
+@contextmanager
+def get_connection():
+    """
+    Provides a raw pooled connection for work that needs several cursors or
+    its own transaction boundaries. Commits on success, rolls back on error.
+    """
+    if _pool is None:
+        init_connection_pool()
+
+    if not _pool:
+        raise Exception("Database connection pool is not available. Check configuration.")
+
+    conn = _pool.get_connection()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@contextmanager
+def get_dedicated_connection():
+    """
+    Like get_connection, but opens a connection of its own outside the pool,
+    for long jobs that must not compete with the application for pooled
+    connections (the pool raises instead of waiting when it runs out).
+    """
+    conn = mysql.connector.connect(**_connection_args())
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@contextmanager
+def named_lock(name):
+    """
+    Tries to take the MySQL named lock name (GET_LOCK, no wait) and holds it
+    for the block, on a dedicated connection outside the pool so long jobs do
+    not tie up pooled connections. Yields True if the lock was taken, False
+    if another client holds it.
+    """
+    conn = mysql.connector.connect(**_connection_args())
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT GET_LOCK(%s, 0)", (name,))
+        acquired = cur.fetchone()[0] == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cur.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                cur.fetchall()
+    finally:
+        conn.close()
+
 @contextmanager
 def get_cursor():
     """
@@ -15,4 +15,16 @@ database-related function it needs.
 from database.connection import *
 from database.user_queries import *
 from database.record_queries import *
-from database.utility_queries import *
\ No newline at end of file
+from database.version_queries import *
+from database.lookup_queries import *
+from database.change_feed import *
+from database.activity_codes import *
+from database.utility_queries import *
+from database.native_backup import *
+from database.storage_queries import *
+from database.attachment_index import *
+from database.backup_archive import *
+from database.backup_schedule import *
+from database.activity_archive import *
+from database.record_archive import *
+from database.migrations import *
\ No newline at end of file
@@ -1,30 +1,36 @@
 ﻿# entry_ui.py
 import os
 import sys
-import shutil
-import uuid
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QTextEdit,
     QPushButton, QDateEdit, QMessageBox, QTableWidget, QTableWidgetItem, QFileDialog,
     QListWidget, QListWidgetItem, QGroupBox, QGraphicsView, QGraphicsScene, QComboBox, 
-    QCompleter, QStatusBar, QDialog, QFormLayout, QStyle, QTabWidget
+    QCompleter, QStatusBar, QDialog, QFormLayout, QStyle, QTabWidget, QCheckBox
 )
 from PyQt5.QtGui import QPixmap, QImage, QPainter, QTextDocument, QIcon
-from PyQt5.QtCore import Qt, QDate, QRectF, QSize
+from PyQt5.QtCore import Qt, QDate, QRectF, QSize, QThread, pyqtSignal
 from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
 import db_ops
 import utils
+import attachment_ingest
+from pdf_viewer import PdfPageNavigator, pdf_preview_enabled
+from record_sync import get_record_store, apply_record_delta, list_cell_text
+from lookup_completion import attach_lookup_completer, note_lookup_names
+from attachment_indexer import wake_attachment_indexer
+from record_grid import RecordFilterRow, RecordPager, DateWindowBar
 
-try:
-    import fitz
-    pdf_preview_enabled = True
-except ImportError:
-    pdf_preview_enabled = False
-
-ATTACHMENT_DIR = "attachments_storage"
+ATTACHMENT_DIR = db_ops.ATTACHMENT_DIR
+RECORD_COLUMNS = ["id", "date", "type", "device", "technician", "procedures", "materials", "notes", "warnings", "department"]
+VERSION_FIELD_LABELS = {
+    'date': "تاريخ الصيانة", 'type': "نوع الصيانة", 'device': "اسم الجهاز", 'technician': "اسم الفني",
+    'procedures': "الإجراءات", 'materials': "المواد", 'notes': "ملاحظات", 'warnings': "التحذيرات", 'department': "القسم",
+}
 
 class PhotoViewer(QGraphicsView):
+    zoom_changed = pyqtSignal()
+
     def __init__(self, parent):
         super(PhotoViewer, self).__init__(parent)
         self.setDragMode(QGraphicsView.ScrollHandDrag)
@@ -37,7 +43,49 @@ class PhotoViewer(QGraphicsView):
             factor = 1.25
         else:
             factor = 0.8
+        self.zoom_by(factor)
+
+    def zoom_by(self, factor):
         self.scale(factor, factor)
+        self.zoom_changed.emit()
+
+    def fit_item(self, item):
+        self.fitInView(item, Qt.KeepAspectRatio)
+        self.zoom_changed.emit()
+
+class AttachmentIngestWorker(QThread):
+    """Copies (and optionally optimizes) attachments in a thread pool, then registers them."""
+    progress = pyqtSignal(int, int) # done, total
+    finished = pyqtSignal(int, int, list) # maintenance_id, bytes_saved, error messages
+
+    def __init__(self, maintenance_id, source_paths, user_id):
+        super().__init__()
+        self.maintenance_id = maintenance_id
+        self.source_paths = source_paths
+        self.user_id = user_id
+
+    def run(self):
+        settings = attachment_ingest.load_ingest_settings()
+        bytes_saved = 0
+        errors = []
+        total = len(self.source_paths)
+        with ThreadPoolExecutor(max_workers=max(1, settings['workers'])) as pool:
+            futures = [pool.submit(attachment_ingest.ingest_file, path, settings) for path in self.source_paths]
+            # Files are processed in parallel but registered in the order they were chosen.
+            # Database writes stay on this thread so the pool never competes for connections.
+            for done, (path, future) in enumerate(zip(self.source_paths, futures), 1):
+                try:
+                    result = future.result()
+                    try:
+                        db_ops.add_attachment(self.maintenance_id, result['original_filename'], result['stored_filepath'], self.user_id)
+                    except Exception:
+                        db_ops.remove_stored_file(result['stored_filepath'])
+                        raise
+                    bytes_saved += result['original_size'] - result['stored_size']
+                except Exception as e:
+                    errors.append(f"{os.path.basename(path)}: {e}")
+                self.progress.emit(done, total)
+        self.finished.emit(self.maintenance_id, bytes_saved, errors)
 
 class EntryWindow(QWidget):
     def __init__(self, user_id, user_role="user", user_department=None):
@@ -52,6 +100,7 @@ class EntryWindow(QWidget):
         
         self.temp_attachments = []
         self._pixmap_item = None
+        self.ingest_workers = set()
         
         if not os.path.exists(ATTACHMENT_DIR):
             os.makedirs(ATTACHMENT_DIR)
@@ -75,6 +124,7 @@ class EntryWindow(QWidget):
         self.department_combo = QComboBox()
         self.department_combo.setEditable(True)
         self.populate_departments()
+        self.populate_lookup_completers()
         if self.user_department and self.user_role != "admin":
             self.department_combo.setCurrentText(self.user_department)
             self.department_combo.setDisabled(True)
@@ -117,9 +167,13 @@ class EntryWindow(QWidget):
         self.btn_print = QPushButton(" طباعة")
         self.btn_print.setIcon(self.style().standardIcon(QStyle.SP_FileDialogContentsView))
         self.btn_print.clicked.connect(self.print_record)
+
+        self.btn_reload = QPushButton(" تحديث القائمة")
+        self.btn_reload.setIcon(self.style().standardIcon(QStyle.SP_BrowserReload))
+        self.btn_reload.clicked.connect(self.reload_records)
         
         icon_size = QSize(24, 24)
-        for btn in [self.btn_add, self.btn_update, self.btn_delete, self.btn_export_pdf, self.btn_print]:
+        for btn in [self.btn_add, self.btn_update, self.btn_delete, self.btn_export_pdf, self.btn_print, self.btn_reload]:
             btn.setIconSize(icon_size)
             btn_layout.addWidget(btn)
 
@@ -131,6 +185,9 @@ class EntryWindow(QWidget):
         self.table.setHorizontalHeaderLabels(["ID", "تاريخ الصيانة", "نوع الصيانة", "اسم الجهاز", "اسم الفني", "الإجراءات", "المواد", "ملاحظات", "التحذيرات", "القسم"])
         self.table.setSelectionBehavior(QTableWidget.SelectRows)
         self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.filter_row = RecordFilterRow(self.table, RECORD_COLUMNS)
+        self.pager = RecordPager(self.table, RECORD_COLUMNS, self.filter_row, self.fetch_record_page, self.set_record_row, self)
+        right_side_layout.addWidget(self.filter_row)
         right_side_layout.addWidget(self.table)
         
         self.details_tabs = QTabWidget()
@@ -157,7 +214,15 @@ class EntryWindow(QWidget):
         self.scene = QGraphicsScene(self)
         self.preview_view = PhotoViewer(self.scene)
         preview_area_layout.addWidget(self.preview_view)
+        self.pdf_navigator = PdfPageNavigator(self.preview_view, self.scene, parent=self)
+        self.pdf_navigator.page_changed.connect(self.update_page_controls)
+        self.preview_view.zoom_changed.connect(self.pdf_navigator.schedule_refine)
         zoom_layout = QHBoxLayout()
+        self.btn_prev_page = QPushButton("الصفحة السابقة")
+        self.btn_next_page = QPushButton("الصفحة التالية")
+        self.page_label = QLabel()
+        self.btn_prev_page.clicked.connect(self.pdf_navigator.previous_page)
+        self.btn_next_page.clicked.connect(self.pdf_navigator.next_page)
         self.btn_zoom_in = QPushButton("تكبير (+)")
         self.btn_zoom_out = QPushButton("تصغير (-)")
         self.btn_zoom_reset = QPushButton("إعادة تعيين")
@@ -169,6 +234,10 @@ class EntryWindow(QWidget):
         zoom_layout.addWidget(self.btn_zoom_out)
         zoom_layout.addWidget(self.btn_zoom_reset)
         zoom_layout.addStretch()
+        zoom_layout.addWidget(self.btn_prev_page)
+        zoom_layout.addWidget(self.page_label)
+        zoom_layout.addWidget(self.btn_next_page)
+        self.update_page_controls(0, 0)
         preview_area_layout.addLayout(zoom_layout)
         attachments_main_layout.addLayout(list_layout, 1)
         attachments_main_layout.addLayout(preview_area_layout, 3)
@@ -178,8 +247,26 @@ class EntryWindow(QWidget):
         history_layout = QVBoxLayout(history_tab)
         self.history_list = QListWidget()
         history_layout.addWidget(self.history_list)
+        self.history_archive_checkbox = QCheckBox("تضمين السجل المؤرشف")
+        self.history_archive_checkbox.toggled.connect(self.reload_record_history)
+        history_layout.addWidget(self.history_archive_checkbox)
         self.details_tabs.addTab(history_tab, "سجل التاريخ")
 
+        versions_tab = QWidget()
+        versions_layout = QVBoxLayout(versions_tab)
+        versions_layout.addWidget(QLabel("اختر إصداراً لمقارنته بالسابق، أو إصدارين لمقارنتهما معاً:"))
+        self.versions_list = QListWidget()
+        self.versions_list.setSelectionMode(QListWidget.ExtendedSelection)
+        self.versions_list.itemSelectionChanged.connect(self.show_version_diff)
+        self.versions_list.verticalScrollBar().valueChanged.connect(self.on_versions_scroll)
+        versions_layout.addWidget(self.versions_list, 1)
+        self.version_diff_view = QTextEdit()
+        self.version_diff_view.setReadOnly(True)
+        versions_layout.addWidget(self.version_diff_view, 2)
+        self.details_tabs.addTab(versions_tab, "الإصدارات")
+        self.oldest_loaded_version = None
+        self.has_more_versions = False
+
         right_side_layout.addWidget(self.details_tabs)
 
         main_layout.addWidget(form_widget, 1)
@@ -190,16 +277,41 @@ class EntryWindow(QWidget):
         outer_layout.addWidget(self.status_bar)
         
         self.selected_id = None
+        self.store = get_record_store(self.department_filter())
+        self.store.records_changed.connect(self.on_records_changed)
+        self.store.records_reset.connect(self.load_data)
+        self.store.history_changed.connect(self.on_history_changed)
+        right_side_layout.insertWidget(right_side_layout.indexOf(self.filter_row), DateWindowBar(self.store))
+        self.filter_row.filters_changed.connect(self.load_data)
+        self.pager.query_changed.connect(self.load_data)
+        self.pager.failed.connect(lambda msg: self.status_bar.showMessage(msg, 8000))
         self.load_data()
         self.table.cellClicked.connect(self.load_selected_record)
         self.update_buttons_state()
         self.status_bar.showMessage("جاهز", 3000)
 
-    def zoom_in(self): self.preview_view.scale(1.2, 1.2)
-    def zoom_out(self): self.preview_view.scale(1/1.2, 1/1.2)
+    def zoom_in(self): self.preview_view.zoom_by(1.2)
+    def zoom_out(self): self.preview_view.zoom_by(1/1.2)
     def reset_view(self):
-        if self._pixmap_item:
-            self.preview_view.fitInView(self._pixmap_item, Qt.KeepAspectRatio)
+        if self.pdf_navigator.is_open() and self.pdf_navigator.item is not None:
+            # Through fit_item so zoom_changed reaches the navigator's refine debounce.
+            self.preview_view.fit_item(self.pdf_navigator.item)
+        elif self._pixmap_item:
+            self.preview_view.fit_item(self._pixmap_item)
+
+    def update_page_controls(self, page_index, page_count):
+        has_pages = page_count > 1
+        for widget in (self.btn_prev_page, self.page_label, self.btn_next_page):
+            widget.setVisible(has_pages)
+        self.page_label.setText(f"{page_index + 1} / {page_count}")
+        self.btn_prev_page.setEnabled(page_index > 0)
+        self.btn_next_page.setEnabled(page_index + 1 < page_count)
+
+    def clear_preview(self):
+        self.pdf_navigator.close()
+        self.scene.clear()
+        self._pixmap_item = None
+        self.update_page_controls(0, 0)
 
     def populate_departments(self):
         departments = db_ops.get_all_departments()
@@ -208,6 +320,11 @@ class EntryWindow(QWidget):
         completer.setCaseSensitivity(Qt.CaseInsensitive)
         self.department_combo.setCompleter(completer)
 
+    def populate_lookup_completers(self):
+        """Suggests the canonical type/device/technician names; what is saved is resolved to them anyway."""
+        for kind, line_edit in (('type', self.type_input), ('device', self.device_input), ('technician', self.technician_input)):
+            attach_lookup_completer(line_edit, kind)
+
     def update_buttons_state(self):
         is_record_selected = self.selected_id is not None
         is_admin = self.user_role == "admin"
@@ -216,16 +333,55 @@ class EntryWindow(QWidget):
         self.btn_delete.setEnabled(is_record_selected)
         self.btn_print.setEnabled(is_record_selected)
 
+    def department_filter(self):
+        return self.user_department if self.user_role != 'admin' else None
+
     def load_data(self):
-        department_filter = self.user_department if self.user_role != 'admin' else None
-        records = db_ops.fetch_records(department=department_filter)
-        self.table.setRowCount(len(records))
-        for row_idx, row_data in enumerate(records):
-            for col_idx, key in enumerate(["id", "date", "type", "device", "technician", "procedures", "materials", "notes", "warnings", "department"]):
-                value = row_data.get(key, "")
-                self.table.setItem(row_idx, col_idx, QTableWidgetItem(str(value) if value else ""))
+        """
+        Renders the list: newest first from the shared store, or, once a column
+        is sorted or filtered, page by page from the server. Changes arrive
+        through on_records_changed.
+        """
+        if self.pager.is_default():
+            self.pager.show_all(self.store.records())
+        else:
+            self.pager.reset()
         self.table.resizeColumnsToContents()
 
+    def fetch_record_page(self, sort, descending, after, limit, filters, record_ids):
+        return db_ops.fetch_record_page(department=self.department_filter(), filters=filters, sort=sort,
+                                        descending=descending, after=after, limit=limit, record_ids=record_ids,
+                                        date_from=self.store.since)
+
+    def on_history_changed(self):
+        """The store reached further back; server pages are re-read with the wider window."""
+        if not self.pager.is_default():
+            self.load_data()
+
+    def set_record_row(self, row_idx, row_data):
+        for col_idx, key in enumerate(RECORD_COLUMNS):
+            self.table.setItem(row_idx, col_idx, QTableWidgetItem(list_cell_text(row_data.get(key, ""))))
+
+    def reload_records(self):
+        """Explicit full reload; every window sharing the store re-renders."""
+        self.store.reload()
+
+    def refresh_record_rows(self, record_ids):
+        """Inserts, updates or removes the rows of record_ids from the store, without a query."""
+        records = [self.store.get(rec_id) for rec_id in record_ids]
+        apply_record_delta(self.table, record_ids, [r for r in records if r], self.set_record_row)
+
+    def on_records_changed(self, record_ids):
+        if self.pager.is_default():
+            self.refresh_record_rows(record_ids)
+        else:
+            self.pager.refresh(record_ids)
+        for rec_id in record_ids: # New values, saved here or elsewhere, become suggestions.
+            row = self.store.get(rec_id)
+            if row: note_lookup_names(row)
+        if self.selected_id in record_ids:
+            self.status_bar.showMessage("تم تعديل السجل المحدد. أعد اختياره لعرض آخر نسخة.", 8000)
+
     def get_form_data(self):
         return (
             self.date_edit.date().toString("yyyy-MM-dd"), self.type_input.text(), self.device_input.text(),
@@ -238,11 +394,14 @@ class EntryWindow(QWidget):
         if not data[2] or not data[8] or not data[4]:
             QMessageBox.warning(self, "بيانات ناقصة", "يرجى تعبئة الحقول المطلوبة (*): اسم الجهاز، القسم، والإجراءات المتبعة.")
             return
-        new_record_id = db_ops.insert_record(data, self.user_id)
+        try:
+            new_record_id = self.store.add_record(data, self.user_id)
+        except ValueError as e: # Unknown department typed into the combo.
+            QMessageBox.warning(self, "خطأ", str(e))
+            return
         if new_record_id:
             self.save_temp_attachments(new_record_id)
             self.status_bar.showMessage("تم إضافة السجل والمرفقات بنجاح.", 5000)
-            self.load_data()
             self.clear_inputs()
         else:
             QMessageBox.critical(self, "خطأ", "فشل في إضافة السجل.")
@@ -253,9 +412,12 @@ class EntryWindow(QWidget):
         if not data[2] or not data[8] or not data[4]:
             QMessageBox.warning(self, "بيانات ناقصة", "يرجى تعبئة الحقول المطلوبة (*): اسم الجهاز، القسم، والإجراءات المتبعة.")
             return
-        db_ops.update_record(self.selected_id, data, self.user_id)
+        try:
+            self.store.update_record(self.selected_id, data, self.user_id)
+        except ValueError as e: # Unknown department typed into the combo.
+            QMessageBox.warning(self, "خطأ", str(e))
+            return
         self.status_bar.showMessage("تم تحديث السجل بنجاح.", 5000)
-        self.load_data()
         self.clear_inputs()
         
     def delete_record(self):
@@ -264,9 +426,8 @@ class EntryWindow(QWidget):
             'هل أنت متأكد؟ سيتم نقل هذا السجل إلى سلة المحذوفات.',
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
-            db_ops.delete_record(self.selected_id, self.user_id)
+            self.store.trash_record(self.selected_id, self.user_id)
             self.status_bar.showMessage("تم نقل السجل إلى سلة المحذوفات.", 5000)
-            self.load_data()
             self.clear_inputs()
 
     def print_record(self):
@@ -286,18 +447,24 @@ class EntryWindow(QWidget):
         # ... (PDF generation code remains the same)
         
     def load_selected_record(self, row, col):
-        self.selected_id = int(self.table.item(row, 0).text())
-        self.date_edit.setDate(QDate.fromString(self.table.item(row, 1).text(), "yyyy-MM-dd"))
-        self.type_input.setText(self.table.item(row, 2).text())
-        self.device_input.setText(self.table.item(row, 3).text())
-        self.technician_input.setText(self.table.item(row, 4).text())
-        self.procedures_input.setPlainText(self.table.item(row, 5).text())
-        self.materials_input.setPlainText(self.table.item(row, 6).text())
-        self.notes_input.setPlainText(self.table.item(row, 7).text())
-        self.warnings_input.setPlainText(self.table.item(row, 8).text())
-        self.department_combo.setCurrentText(self.table.item(row, 9).text())
+        # The list only holds excerpts, so the full record is fetched when it is opened.
+        record = db_ops.fetch_record_details(int(self.table.item(row, 0).text()))
+        if not record:
+            QMessageBox.warning(self, "غير موجود", "لم يعد هذا السجل موجوداً.")
+            return
+        self.selected_id = record['id']
+        self.date_edit.setDate(QDate.fromString(str(record['date']), "yyyy-MM-dd"))
+        self.type_input.setText(record['type'] or "")
+        self.device_input.setText(record['device'] or "")
+        self.technician_input.setText(record['technician'] or "")
+        self.procedures_input.setPlainText(record['procedures'] or "")
+        self.materials_input.setPlainText(record['materials'] or "")
+        self.notes_input.setPlainText(record['notes'] or "")
+        self.warnings_input.setPlainText(record['warnings'] or "")
+        self.department_combo.setCurrentText(record['department'] or "")
         self.load_attachments(self.selected_id)
         self.load_record_history(self.selected_id)
+        self.load_record_versions(self.selected_id)
         self.update_buttons_state()
 
     def clear_inputs(self):
@@ -314,15 +481,15 @@ class EntryWindow(QWidget):
         self.selected_id = None
         self.attachment_list.clear()
         self.history_list.clear()
+        self.versions_list.clear()
+        self.version_diff_view.clear()
         self.temp_attachments = []
-        self.scene.clear()
-        self._pixmap_item = None
+        self.clear_preview()
         self.table.clearSelection()
         self.update_buttons_state()
 
     def preview_selected_attachment(self, current_item, previous_item):
-        self.scene.clear()
-        self._pixmap_item = None
+        self.clear_preview()
         if not current_item: return
         attachment_data = current_item.data(Qt.UserRole)
         is_temp = attachment_data is None
@@ -333,18 +500,12 @@ class EntryWindow(QWidget):
         if ext in ['.png', '.jpg', '.jpeg', '.bmp', '.gif']:
             pixmap = QPixmap(file_path)
         elif ext == '.pdf' and pdf_preview_enabled:
-            try:
-                doc = fitz.open(file_path)
-                page = doc.load_page(0)
-                matrix = fitz.Matrix(2, 2)
-                pix = page.get_pixmap(matrix=matrix)
-                img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
-                pixmap = QPixmap.fromImage(img)
-                doc.close()
-            except Exception: pass
+            # Pages are rendered lazily in the background by the navigator.
+            self.pdf_navigator.open(file_path)
+            return
         if pixmap and not pixmap.isNull():
             self._pixmap_item = self.scene.addPixmap(pixmap)
-            self.preview_view.fitInView(self._pixmap_item, Qt.KeepAspectRatio)
+            self.preview_view.fit_item(self._pixmap_item)
 
     def load_attachments(self, maintenance_id):
         self.attachment_list.clear()
@@ -354,10 +515,14 @@ class EntryWindow(QWidget):
             item.setData(Qt.UserRole, att)
             self.attachment_list.addItem(item)
             
+    def reload_record_history(self):
+        if self.selected_id is not None:
+            self.load_record_history(self.selected_id)
+
     def load_record_history(self, record_id):
         self.history_list.clear()
         try:
-            history_entries = db_ops.get_history_for_record(record_id)
+            history_entries = db_ops.get_history_for_record(record_id, include_archived=self.history_archive_checkbox.isChecked())
             if not history_entries:
                 self.history_list.addItem("لا يوجد تاريخ مسجل لهذا السجل.")
                 return
@@ -370,13 +535,65 @@ class EntryWindow(QWidget):
         except Exception as e:
             self.history_list.addItem(f"خطأ في تحميل السجل: {e}")
 
+    def load_record_versions(self, record_id):
+        self.versions_list.clear()
+        self.version_diff_view.clear()
+        self.oldest_loaded_version = None
+        self.has_more_versions = True
+        self.load_more_versions(record_id)
+
+    def on_versions_scroll(self, value):
+        if self.selected_id is not None and value == self.versions_list.verticalScrollBar().maximum():
+            self.load_more_versions(self.selected_id)
+
+    def load_more_versions(self, record_id):
+        """Appends the next page of older versions; only version metadata is fetched here."""
+        if not self.has_more_versions:
+            return
+        try:
+            versions = db_ops.get_record_versions(record_id, before_version=self.oldest_loaded_version)
+        except Exception as e:
+            self.has_more_versions = False
+            self.versions_list.addItem(f"خطأ في تحميل الإصدارات: {e}")
+            return
+        self.has_more_versions = len(versions) == db_ops.VERSION_PAGE_SIZE
+        for version in versions:
+            created_at = version['created_at'].strftime('%Y-%m-%d %H:%M:%S') if version['created_at'] else ""
+            user = version['username'] or ('النسخة الأصلية' if version['version'] == 1 else 'مستخدم محذوف')
+            fields = "، ".join(VERSION_FIELD_LABELS.get(f, f) for f in version['changed_fields'])
+            item = QListWidgetItem(f"إصدار {version['version']} - {created_at} - {user}" + (f": {fields}" if fields else ""))
+            item.setData(Qt.UserRole, version['version'])
+            self.versions_list.addItem(item)
+        if versions:
+            self.oldest_loaded_version = versions[-1]['version']
+
+    def show_version_diff(self):
+        """Diffs one selected version against the one before it, or two selected versions against each other."""
+        self.version_diff_view.clear()
+        selected = sorted(item.data(Qt.UserRole) for item in self.versions_list.selectedItems() if item.data(Qt.UserRole))
+        if self.selected_id is None or not selected or len(selected) > 2:
+            return
+        from_version, to_version = (selected[0] - 1, selected[0]) if len(selected) == 1 else selected
+        try:
+            changes = db_ops.diff_record_versions(self.selected_id, from_version, to_version)
+        except Exception as e:
+            self.version_diff_view.setPlainText(f"خطأ في تحميل الفروقات: {e}")
+            return
+        if not changes:
+            self.version_diff_view.setPlainText("لا توجد فروقات بين الإصدارين.")
+            return
+        lines = []
+        for field, (old, new) in changes.items():
+            lines.append(f"{VERSION_FIELD_LABELS.get(field, field)}:")
+            lines.append(f"  قبل (إصدار {from_version}): {old if old is not None else '-'}")
+            lines.append(f"  بعد (إصدار {to_version}): {new if new is not None else '-'}")
+        self.version_diff_view.setPlainText("\n".join(lines))
+
     def add_attachment(self):
         file_paths, _ = QFileDialog.getOpenFileNames(self, "اختر المرفقات", "", "All Files (*)")
         if not file_paths: return
         if self.selected_id is not None:
-            for path in file_paths:
-                self.save_single_attachment(self.selected_id, path)
-            self.load_attachments(self.selected_id)
+            self.start_attachment_ingest(self.selected_id, file_paths)
         else:
             for path in file_paths:
                 if path not in self.temp_attachments:
@@ -418,18 +635,26 @@ class EntryWindow(QWidget):
         else:
             QMessageBox.critical(self, "خطأ", f"لم يتم العثور على الملف:\n{file_path}")
 
-    def save_single_attachment(self, maintenance_id, source_path):
-        try:
-            original_filename = os.path.basename(source_path)
-            file_extension = os.path.splitext(original_filename)[1]
-            stored_filename = f"{uuid.uuid4().hex}{file_extension}"
-            stored_filepath = os.path.join(ATTACHMENT_DIR, stored_filename)
-            shutil.copy(source_path, stored_filepath)
-            db_ops.add_attachment(maintenance_id, original_filename, stored_filepath, self.user_id)
-        except Exception as e:
-            QMessageBox.critical(self, "خطأ في المرفق", f"فشل في حفظ المرفق '{original_filename}':\n{e}")
+    def start_attachment_ingest(self, maintenance_id, source_paths):
+        if not source_paths: return
+        worker = AttachmentIngestWorker(maintenance_id, list(source_paths), self.user_id)
+        worker.progress.connect(lambda done, total: self.status_bar.showMessage(f"جاري حفظ المرفقات... {done}/{total}"))
+        worker.finished.connect(self.on_attachment_ingest_finished)
+        worker.finished.connect(lambda *args, w=worker: self.ingest_workers.discard(w))
+        self.ingest_workers.add(worker)
+        worker.start()
+
+    def on_attachment_ingest_finished(self, maintenance_id, bytes_saved, errors):
+        wake_attachment_indexer()
+        if self.selected_id == maintenance_id:
+            self.load_attachments(maintenance_id)
+        message = "تم حفظ المرفقات."
+        if bytes_saved > 0:
+            message += f" تم توفير {bytes_saved / (1024 * 1024):.1f} MB."
+        self.status_bar.showMessage(message, 5000)
+        if errors:
+            QMessageBox.critical(self, "خطأ في المرفق", "فشل في حفظ بعض المرفقات:\n" + "\n".join(errors))
 
     def save_temp_attachments(self, maintenance_id):
-        for path in self.temp_attachments:
-            self.save_single_attachment(maintenance_id, path)
+        self.start_attachment_ingest(maintenance_id, self.temp_attachments)
         self.temp_attachments = []
\ No newline at end of file
@@ -0,0 +1,113 @@
+﻿# lookup_completion.py
+from bisect import bisect_left, insort
+from PyQt5.QtWidgets import QCompleter
+from PyQt5.QtCore import Qt, QStringListModel, QTimer
+import db_ops
+
+# Vocabularies larger than this are not loaded; suggestions come from
+# prefix queries on the word-start key index instead (same matches), sent
+# once typing pauses for SERVER_SUGGEST_DELAY_MS.
+LOOKUP_INDEX_MAX_VALUES = 20000
+SERVER_SUGGEST_DELAY_MS = 250
+
+class LookupPrefixIndex:
+    """
+    The canonical names of one lookup kind as a sorted array of search keys,
+    answered with bisect. Every word start of a name is a key, so "HP"
+    finds "طابعة HP". Loaded on first use and shared by all completers.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.loaded = False
+        self.server_side = False
+        self.keys = []  # sorted (search key, name)
+        self.names = set()
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        names = db_ops.get_lookup_names(self.kind, limit=LOOKUP_INDEX_MAX_VALUES)
+        self.loaded = True
+        if names is None:
+            self.server_side = True
+            return
+        for name in names:
+            self.names.add(name)
+            self.keys.extend(self._entries(name))
+        self.keys.sort()
+
+    @staticmethod
+    def _entries(name):
+        return [(key, name) for key in db_ops.word_start_keys(name)]
+
+    def add(self, name):
+        """Adds a name saved by this session or seen in a changed record."""
+        if not self.loaded or self.server_side or not name or name in self.names:
+            return
+        self.names.add(name)
+        for entry in self._entries(name):
+            insort(self.keys, entry)
+
+    def suggest(self, text, limit=db_ops.LOOKUP_SUGGESTION_LIMIT):
+        self.ensure_loaded()
+        prefix = db_ops.search_key(text)
+        if not prefix:
+            return []
+        if self.server_side:
+            return db_ops.search_lookup_prefix(self.kind, prefix, limit)
+        suggestions = []
+        i = bisect_left(self.keys, (prefix,))
+        while i < len(self.keys) and len(suggestions) < limit and self.keys[i][0].startswith(prefix):
+            if self.keys[i][1] not in suggestions:
+                suggestions.append(self.keys[i][1])
+            i += 1
+        return suggestions
+
+_indexes = {}
+
+def get_lookup_index(kind):
+    if kind not in _indexes:
+        _indexes[kind] = LookupPrefixIndex(kind)
+    return _indexes[kind]
+
+def note_lookup_names(row):
+    """Adds the type/device/technician names of a record row to the indexes already loaded."""
+    for kind in db_ops.LOOKUP_TABLES:
+        if kind in _indexes:
+            _indexes[kind].add(row.get(kind))
+
+def reset_lookup_indexes():
+    """Drops the loaded indexes, e.g. after values were merged; they reload on next use."""
+    _indexes.clear()
+
+def attach_lookup_completer(line_edit, kind):
+    """Gives line_edit suggestions from the shared index of kind, refreshed per keystroke."""
+    model = QStringListModel(line_edit)
+    completer = QCompleter(model, line_edit)
+    completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+    completer.setCaseSensitivity(Qt.CaseInsensitive)
+    line_edit.setCompleter(completer)
+
+    server_timer = QTimer(line_edit)
+    server_timer.setSingleShot(True)
+    server_timer.setInterval(SERVER_SUGGEST_DELAY_MS)
+
+    def show_suggestions():
+        model.setStringList(get_lookup_index(kind).suggest(line_edit.text()))
+        if model.rowCount():
+            completer.complete()
+        else:
+            completer.popup().hide()
+
+    def on_text_edited(text):
+        index = get_lookup_index(kind)
+        index.ensure_loaded()
+        if index.server_side: # A database query: wait until typing pauses.
+            server_timer.start()
+        else:
+            show_suggestions()
+
+    server_timer.timeout.connect(show_suggestions)
+    line_edit.textEdited.connect(on_text_edited)
+    return completer
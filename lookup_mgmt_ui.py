@@ -0,0 +1,107 @@
+﻿# lookup_mgmt_ui.py
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QMessageBox,
+    QInputDialog, QComboBox, QLabel, QAbstractItemView
+)
+from PyQt5.QtCore import Qt, QThread
+import db_ops
+from lookup_completion import reset_lookup_indexes
+
+LOOKUP_KIND_LABELS = {'type': "نوع الصيانة", 'device': "الجهاز", 'technician': "الفني"}
+
+class LookupBackfillWorker(QThread):
+    """Gives existing records their type/device/technician keys in the background (see backfill_lookup_ids)."""
+
+    def run(self):
+        try:
+            updated = db_ops.backfill_lookup_ids(should_stop=self.isInterruptionRequested)
+            if updated:
+                print(f"Linked {updated} maintenance records to lookup values.")
+        except Exception as e:
+            print(f"Lookup backfill stopped: {e}")
+
+class LookupManagementWindow(QDialog):
+    def __init__(self, current_user_id, parent=None):
+        super().__init__(parent)
+        self.current_user_id = current_user_id
+        self.setWindowTitle("إدارة القيم المرجعية")
+        self.setLayoutDirection(Qt.RightToLeft)
+        self.setMinimumSize(600, 500)
+        layout = QVBoxLayout(self)
+
+        kind_layout = QHBoxLayout()
+        kind_layout.addWidget(QLabel("الحقل:"))
+        self.kind_combo = QComboBox()
+        for kind, label in LOOKUP_KIND_LABELS.items():
+            self.kind_combo.addItem(label, kind)
+        self.kind_combo.currentIndexChanged.connect(self.load_values)
+        kind_layout.addWidget(self.kind_combo)
+        kind_layout.addStretch()
+        layout.addLayout(kind_layout)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(3)
+        self.table.setHorizontalHeaderLabels(["القيمة", "عدد السجلات", "أسماء بديلة"])
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        layout.addWidget(self.table)
+
+        btn_layout = QHBoxLayout()
+        self.btn_merge = QPushButton("دمج المحدد")
+        self.btn_alias = QPushButton("إضافة اسم بديل")
+        btn_layout.addWidget(self.btn_merge)
+        btn_layout.addWidget(self.btn_alias)
+        layout.addLayout(btn_layout)
+        self.btn_merge.clicked.connect(self.merge_selected)
+        self.btn_alias.clicked.connect(self.add_alias)
+        self.load_values()
+
+    def current_kind(self):
+        return self.kind_combo.currentData()
+
+    def load_values(self):
+        values = db_ops.get_lookup_values(self.current_kind())
+        self.table.setRowCount(len(values))
+        for i, value in enumerate(values):
+            name_item = QTableWidgetItem(value['name'])
+            name_item.setData(Qt.UserRole, value['id'])
+            self.table.setItem(i, 0, name_item)
+            self.table.setItem(i, 1, QTableWidgetItem(str(value['count'])))
+            self.table.setItem(i, 2, QTableWidgetItem("، ".join(value['aliases'])))
+        self.table.resizeColumnsToContents()
+
+    def selected_values(self):
+        rows = sorted({index.row() for index in self.table.selectedIndexes()})
+        return [(self.table.item(r, 0).data(Qt.UserRole), self.table.item(r, 0).text()) for r in rows]
+
+    def merge_selected(self):
+        selected = self.selected_values()
+        if len(selected) < 2:
+            QMessageBox.warning(self, "خطأ", "حدد قيمتين أو أكثر لدمجها.")
+            return
+        names = [name for _, name in selected]
+        target_name, ok = QInputDialog.getItem(self, "دمج القيم", "الاسم المعتمد بعد الدمج:", names, 0, False)
+        if not ok:
+            return
+        target_id = dict((name, value_id) for value_id, name in selected)[target_name]
+        success, msg = db_ops.merge_lookup_values(self.current_kind(), [value_id for value_id, _ in selected],
+                                                  target_id, self.current_user_id)
+        QMessageBox.information(self, "نتيجة", msg)
+        if success:
+            reset_lookup_indexes()
+            self.load_values()
+
+    def add_alias(self):
+        selected = self.selected_values()
+        if len(selected) != 1:
+            QMessageBox.warning(self, "خطأ", "حدد قيمة واحدة لإضافة اسم بديل لها.")
+            return
+        target_id, target_name = selected[0]
+        text, ok = QInputDialog.getText(self, "إضافة اسم بديل", f"اسم بديل لـ '{target_name}':")
+        if ok and text.strip():
+            success, msg = db_ops.add_lookup_alias(self.current_kind(), text.strip(), target_id, self.current_user_id)
+            QMessageBox.information(self, "نتيجة", msg)
+            if success:
+                reset_lookup_indexes()
+                self.load_values()
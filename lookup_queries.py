@@ -0,0 +1,267 @@
+﻿# /database/lookup_queries.py
+
+import re
+from .connection import get_cursor, named_lock
+from .utility_queries import log_activity
+
+# maintenance.type, device and technician are resolved to rows of small lookup
+# tables and stored as integer keys (type_id, device_id, technician_id), so
+# reports group and join on integers. The text columns are kept as a copy of
+# the canonical name for display. Names are matched on name_key (case and
+# whitespace folded); a value merged into another keeps its row with
+# merged_into set and acts as an alias from then on.
+LOOKUP_TABLES = {
+    'type': 'maintenance_types',
+    'device': 'devices',
+    'technician': 'technicians',
+}
+LOOKUP_SUGGESTION_LIMIT = 15
+FUZZY_MIN_SIMILARITY = 0.3
+LOOKUP_BACKFILL_BATCH_ROWS = 2000
+LOOKUP_BACKFILL_LOCK = 'maintenance_lookup_backfill'
+_MAX_ALIAS_DEPTH = 10
+
+def lookup_key(name):
+    return " ".join(str(name).split()).casefold()[:191]
+
+# Autocomplete matches on search_key: name_key with Arabic letter variants
+# folded (hamza forms of alef, alef maqsura, taa marbuta), diacritics and
+# tatweel removed and Arabic-Indic digits made ASCII, so what is typed
+# without them still finds the value. Stored in an indexed column for
+# prefix queries.
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u0640\u064b-\u065f\u0670\u06d6-\u06ed]')
+_ARABIC_FOLDS = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ى': 'ي', 'ة': 'ه',
+                               **{chr(0x0660 + d): str(d) for d in range(10)}})
+
+def search_key(name):
+    return lookup_key(_ARABIC_MARKS.sub('', str(name)).translate(_ARABIC_FOLDS))
+
+def word_start_keys(name):
+    """The search_key of name from each word start on, so a prefix query finds "طابعة HP" by "HP"."""
+    words = search_key(name).split()
+    return [" ".join(words[i:])[:191] for i in range(len(words))]
+
+def _index_word_keys(cur, table, value_id, name):
+    cur.executemany(f"INSERT IGNORE INTO {table}_words (word_key, value_id) VALUES (%s, %s)",
+                    [(key, value_id) for key in word_start_keys(name)])
+
+# Fuzzy matching: each value's search_key is split into trigrams, stored in
+# {table}_trigrams when the value is created. Similarity is the Jaccard
+# index of the trigram sets, so a typo costs a few trigrams out of many.
+def name_trigrams(name):
+    key = search_key(name)
+    if not key:
+        return set()
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _index_trigrams(cur, table, value_id, name):
+    trigrams = name_trigrams(name)
+    cur.executemany(f"INSERT IGNORE INTO {table}_trigrams (trigram, value_id) VALUES (%s, %s)",
+                    [(trigram, value_id) for trigram in trigrams])
+    cur.execute(f"UPDATE {table} SET trigram_count = %s WHERE id = %s", (len(trigrams), value_id))
+
+def resolve_lookup(cur, kind, name, create=True):
+    """
+    Returns (id, canonical name) for a typed value, following aliases, and
+    creates the value if it is new (unless create is False). Empty values
+    resolve to (None, None).
+    """
+    if name is None or not str(name).strip():
+        return None, None
+    table = LOOKUP_TABLES[kind]
+    key = lookup_key(name)
+    cur.execute(f"SELECT id, name, merged_into FROM {table} WHERE name_key = %s", (key,))
+    row = cur.fetchone()
+    if row is None:
+        if not create:
+            return None, None
+        # INSERT IGNORE + re-read: another client may create the same value concurrently.
+        cur.execute(f"INSERT IGNORE INTO {table} (name, name_key, search_key) VALUES (%s, %s, %s)",
+                    (" ".join(str(name).split()), key, search_key(name)))
+        created = cur.rowcount == 1
+        cur.execute(f"SELECT id, name, merged_into FROM {table} WHERE name_key = %s", (key,))
+        row = cur.fetchone()
+        if created:
+            _index_trigrams(cur, table, row['id'], row['name'])
+            _index_word_keys(cur, table, row['id'], row['name'])
+    for _ in range(_MAX_ALIAS_DEPTH):
+        if not row['merged_into']:
+            break
+        cur.execute(f"SELECT id, name, merged_into FROM {table} WHERE id = %s", (row['merged_into'],))
+        row = cur.fetchone()
+    return row['id'], row['name']
+
+def get_lookup_names(kind, limit=None):
+    """Canonical names of one kind, for completers; None if there are more than limit."""
+    sql = f"SELECT name FROM {LOOKUP_TABLES[kind]} WHERE merged_into IS NULL ORDER BY name"
+    with get_cursor() as cur:
+        if limit is None:
+            cur.execute(sql)
+        else:
+            cur.execute(sql + " LIMIT %s", (limit + 1,))
+        names = [row['name'] for row in cur.fetchall()]
+    if limit is not None and len(names) > limit:
+        return None
+    return names
+
+def search_lookup_prefix(kind, prefix, limit=LOOKUP_SUGGESTION_LIMIT):
+    """
+    Canonical names with a word starting with prefix (see word_start_keys),
+    via the {table}_words index; matches what the in-memory completion index
+    finds.
+    """
+    key = search_key(prefix).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    if not key:
+        return []
+    table = LOOKUP_TABLES[kind]
+    with get_cursor() as cur:
+        cur.execute(f"""
+            SELECT l.name FROM {table}_words w JOIN {table} l ON l.id = w.value_id
+            WHERE w.word_key LIKE %s AND l.merged_into IS NULL
+            GROUP BY l.id, l.name ORDER BY MIN(w.word_key) LIMIT %s
+        """, (key + '%', limit))
+        return [row['name'] for row in cur.fetchall()]
+
+def find_similar_lookup_values(cur, kind, text, min_similarity=FUZZY_MIN_SIMILARITY, limit=50):
+    """
+    Returns {canonical id: similarity} for the values of kind that look like
+    text, best first. Aliases count for the value they were merged into.
+    """
+    trigrams = name_trigrams(text)
+    if not trigrams:
+        return {}
+    table = LOOKUP_TABLES[kind]
+    cur.execute(f"""
+        SELECT COALESCE(l.merged_into, l.id) AS id, MAX(t.shared / (l.trigram_count + %s - t.shared)) AS similarity
+        FROM (
+            SELECT value_id, COUNT(*) AS shared FROM {table}_trigrams
+            WHERE trigram IN ({', '.join(['%s'] * len(trigrams))}) GROUP BY value_id
+        ) t JOIN {table} l ON l.id = t.value_id
+        GROUP BY COALESCE(l.merged_into, l.id) HAVING similarity >= %s
+        ORDER BY similarity DESC LIMIT %s
+    """, (len(trigrams), *trigrams, min_similarity, limit))
+    return {row['id']: float(row['similarity']) for row in cur.fetchall()}
+
+def get_lookup_values(kind):
+    """Canonical values of one kind with their usage count (archived records included) and aliases, most used first."""
+    table = LOOKUP_TABLES[kind]
+    with get_cursor() as cur:
+        cur.execute(f"""
+            SELECT l.id, l.name, COALESCE(u.count, 0) AS count FROM {table} l
+            LEFT JOIN (
+                SELECT value_id, COUNT(*) AS count FROM (
+                    SELECT {kind}_id AS value_id FROM maintenance
+                    UNION ALL SELECT {kind}_id FROM maintenance_archive
+                ) r GROUP BY value_id
+            ) u ON u.value_id = l.id
+            WHERE l.merged_into IS NULL ORDER BY count DESC, l.name
+        """)
+        values = cur.fetchall()
+        cur.execute(f"SELECT name, merged_into FROM {table} WHERE merged_into IS NOT NULL ORDER BY name")
+        aliases = {}
+        for row in cur.fetchall():
+            aliases.setdefault(row['merged_into'], []).append(row['name'])
+    for value in values:
+        value['aliases'] = aliases.get(value['id'], [])
+    return values
+
+def merge_lookup_values(kind, source_ids, target_id, user_id):
+    """
+    Merges source values into target: records using them are repointed (and
+    renamed) and the source names become aliases of target.
+    """
+    table = LOOKUP_TABLES[kind]
+    source_ids = [sid for sid in source_ids if sid != target_id]
+    if not source_ids:
+        return False, "اختر قيمة واحدة على الأقل غير القيمة الهدف."
+    try:
+        with get_cursor() as cur:
+            cur.execute(f"SELECT id, name FROM {table} WHERE id = %s AND merged_into IS NULL", (target_id,))
+            target = cur.fetchone()
+            if not target:
+                return False, "القيمة الهدف غير موجودة."
+            placeholders = ", ".join(['%s'] * len(source_ids))
+            cur.execute(f"SELECT name FROM {table} WHERE id IN ({placeholders})", source_ids)
+            source_names = [row['name'] for row in cur.fetchall()]
+            cur.execute(f"UPDATE {table} SET merged_into = %s WHERE id IN ({placeholders}) OR merged_into IN ({placeholders})",
+                        [target_id] + source_ids + source_ids)
+            moved = 0
+            for records_table in ('maintenance', 'maintenance_archive'):
+                cur.execute(f"UPDATE {records_table} SET {kind}_id = %s, {kind} = %s WHERE {kind}_id IN ({placeholders})",
+                            [target_id, target['name']] + source_ids)
+                moved += cur.rowcount
+            log_activity(user_id, 'MERGE', 'lookup', target_id,
+                         {'kind': kind, 'sources': source_names, 'target': target['name'], 'records': moved})
+        return True, f"تم الدمج بنجاح وتحديث {moved} سجل."
+    except Exception as e:
+        return False, f"فشل الدمج: {str(e)}"
+
+def add_lookup_alias(kind, alias, target_id, user_id):
+    """Makes alias (new or existing) resolve to target from now on."""
+    with get_cursor() as cur:
+        alias_id, _ = resolve_lookup(cur, kind, alias)
+    if alias_id is None:
+        return False, "الاسم البديل فارغ."
+    if alias_id == target_id:
+        return False, "هذا الاسم يشير بالفعل إلى القيمة المحددة."
+    return merge_lookup_values(kind, [alias_id], target_id, user_id)
+
+def fill_lookup_trigrams(cur):
+    """Migration step: indexes the trigrams of the existing lookup values."""
+    for table in LOOKUP_TABLES.values():
+        cur.execute(f"SELECT id, name FROM {table}")
+        for row in cur.fetchall():
+            _index_trigrams(cur, table, row['id'], row['name'])
+
+def fill_lookup_word_keys(cur):
+    """Migration step: indexes the word-start keys of the existing lookup values."""
+    for table in LOOKUP_TABLES.values():
+        cur.execute(f"SELECT id, name FROM {table}")
+        for row in cur.fetchall():
+            _index_word_keys(cur, table, row['id'], row['name'])
+
+def fill_lookup_search_keys(cur):
+    """Migration step: computes search_key for the existing lookup values."""
+    for table in LOOKUP_TABLES.values():
+        cur.execute(f"SELECT id, name FROM {table}")
+        cur.executemany(f"UPDATE {table} SET search_key = %s WHERE id = %s",
+                        [(search_key(row['name']), row['id']) for row in cur.fetchall()])
+
+def backfill_lookup_ids(progress_callback=None, should_stop=None):
+    """
+    Fills type_id, device_id and technician_id of existing records, and
+    rewrites their text to the canonical name, LOOKUP_BACKFILL_BATCH_ROWS rows
+    per transaction. Meant to run in the background; only one client works
+    on it at a time, and it resumes where it stopped. Returns the number of
+    records updated, or None if another client holds the lock.
+    """
+    updated = 0
+    with named_lock(LOOKUP_BACKFILL_LOCK) as acquired:
+        if not acquired:
+            return None
+        for kind in LOOKUP_TABLES:
+            cache = {}
+            last_id = 0
+            while not (should_stop and should_stop()):
+                with get_cursor() as cur:
+                    cur.execute(f"""
+                        SELECT id, {kind} AS name FROM maintenance
+                        WHERE id > %s AND {kind}_id IS NULL AND {kind} IS NOT NULL AND {kind} <> ''
+                        ORDER BY id LIMIT %s
+                    """, (last_id, LOOKUP_BACKFILL_BATCH_ROWS))
+                    rows = cur.fetchall()
+                    if not rows:
+                        break
+                    updates = []
+                    for row in rows:
+                        key = lookup_key(row['name'])
+                        if key not in cache:
+                            cache[key] = resolve_lookup(cur, kind, row['name'])
+                        updates.append((*cache[key], row['id']))
+                    cur.executemany(f"UPDATE maintenance SET {kind}_id = %s, {kind} = %s WHERE id = %s", updates)
+                    last_id = rows[-1]['id']
+                    updated += len(rows)
+                if progress_callback:
+                    progress_callback(kind, updated)
+    return updated
@@ -5,13 +5,39 @@ if sys.executable.endswith('pythonw.exe'):
     
 # main.py
 import sys
-from PyQt5.QtWidgets import QApplication
+from PyQt5.QtWidgets import QApplication, QMessageBox
+from PyQt5.QtCore import QThread
 from login_ui import LoginWindow
+from lookup_mgmt_ui import LookupBackfillWorker
+from attachment_indexer import start_attachment_indexer
 from stylesheet import STYLE_SHEET
+import db_ops
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setStyleSheet(STYLE_SHEET)
+
+    # Migrations are applied by an administrator (migrate_schema.py), not on start-up.
+    success, msg = db_ops.check_schema_version()
+    if not success:
+        QMessageBox.critical(None, "قاعدة البيانات", msg)
+        sys.exit(1)
+    try:
+        db_ops.ensure_activity_log_partitions()
+    except Exception as e:
+        print(f"Could not extend activity log partitions: {e}")
+    try:
+        db_ops.prune_record_changes()
+    except Exception as e:
+        print(f"Could not prune the change feed: {e}")
+
+    # Links records saved before the lookup tables existed; a no-op once done.
+    lookup_backfill = LookupBackfillWorker()
+    app.aboutToQuit.connect(lookup_backfill.requestInterruption)
+    app.aboutToQuit.connect(lookup_backfill.wait)
+    lookup_backfill.start(QThread.LowestPriority)
+    # Extracts the text of new (and not yet indexed) attachments for search.
+    start_attachment_indexer(app)
     
     login = LoginWindow()
     login.show()
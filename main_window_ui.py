@@ -9,6 +9,7 @@ from search_ui import SearchWindow
 from admin_dashboard_ui import AdminDashboardWindow
 from reports_ui import ReportWindow
 from activity_log_ui import ActivityLogWindow
+from backup_scheduler import BackupScheduler
 
 class MainWindow(QMainWindow):
     def __init__(self, user_info):
@@ -42,6 +43,10 @@ class MainWindow(QMainWindow):
 
         self.populate_sidebar()
 
+        # Scheduled backups, if enabled for this machine in config.ini
+        self.backup_scheduler = BackupScheduler(self)
+        self.backup_scheduler.start()
+
     def populate_sidebar(self):
         # --- Create instances of all panels ---
         self.entry_panel = EntryWindow(
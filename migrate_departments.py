@@ -0,0 +1,31 @@
+﻿# migrate_departments.py
+import argparse
+import sys
+import db_ops
+
+# Moves maintenance and users to department_id without a long table lock:
+# adds the columns (migration 11) and fills them in small batches while the
+# application keeps running. Afterwards, close the older clients and run
+# migrate_schema.py --offline, which applies migration 12 and drops the name
+# columns.
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill department_id on maintenance and users in batches.")
+    parser.add_argument("--batch-rows", type=int, default=db_ops.DEPARTMENT_BATCH_ROWS, help="Rows per transaction")
+    args = parser.parse_args(argv)
+
+    success, msg = db_ops.apply_migrations(target_version=11)
+    print(msg)
+    if not success:
+        return 1
+
+    db_ops.backfill_department_ids(
+        batch_rows=args.batch_rows,
+        progress_callback=lambda table, last_id: print(f"{table}: up to id {last_id}", end="\r")
+    )
+    print()
+    print("Department ids filled. Close older clients, then run migrate_schema.py --offline to finish the migration.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+﻿# migrate_schema.py
+import argparse
+import sys
+import db_ops
+
+# Administrator entry point for schema migrations. The application and the
+# scheduled jobs only check the schema version and refuse to run while it is
+# behind; this applies the pending steps. Migrations that drop columns or
+# rebuild large tables (db_ops.OFFLINE_MIGRATIONS) need --offline, given only
+# once every other client is closed.
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply pending database schema migrations.")
+    parser.add_argument("--target-version", type=int, default=None, help="Stop after this migration version")
+    parser.add_argument("--offline", action="store_true",
+                        help="Also apply migrations that require every other client to be closed")
+    parser.add_argument("--list", action="store_true", help="Only list the pending migrations")
+    args = parser.parse_args(argv)
+
+    pending = db_ops.pending_migrations(args.target_version)
+    if not pending:
+        print("Schema is up to date.")
+        return 0
+    for version, description in pending:
+        marker = " (offline)" if version in db_ops.OFFLINE_MIGRATIONS else ""
+        print(f"{version}: {description}{marker}")
+    if args.list:
+        return 0
+
+    success, msg = db_ops.apply_migrations(target_version=args.target_version, offline=args.offline)
+    print(msg)
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
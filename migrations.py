@@ -0,0 +1,296 @@
+﻿# /database/migrations.py
+
+from .connection import get_cursor
+from .activity_archive import partition_activity_log
+from .activity_codes import backfill_activity_codes
+from .record_queries import split_maintenance_text
+from .lookup_queries import LOOKUP_TABLES, fill_lookup_search_keys, fill_lookup_trigrams, fill_lookup_word_keys
+from .utility_queries import backfill_department_ids, add_department_foreign_keys
+from .record_archive import create_maintenance_archive
+
+# Each migration is (version, description, statements). Statements run in order,
+# each in its own transaction, and each one is recorded in schema_migration_steps
+# as soon as it succeeds: MySQL commits DDL implicitly, so a step that fails
+# halfway cannot be rolled back, and a rerun resumes at the statement that
+# failed instead of repeating the ones already applied. The version is recorded
+# once all of them succeed. Never edit a released step; append a new one.
+#
+# Migrations are applied by an administrator with migrate_schema.py, never by
+# the application itself: it refuses to start while the schema is behind (see
+# check_schema_version). Versions in OFFLINE_MIGRATIONS drop columns older
+# clients still write or rebuild a large table, and are only applied with
+# --offline, once every other client is closed.
+MIGRATIONS = [
+    (1, "Add checksum column to attachments", [
+        "ALTER TABLE attachments ADD COLUMN sha256 CHAR(64) NULL",
+    ]),
+    # Keyset pagination of the activity log: each index ends in (timestamp, id)
+    # so a filtered page is a single index range scan in ORDER BY order.
+    (2, "Add activity log pagination indexes", [
+        "ALTER TABLE activity_log"
+        " ADD INDEX idx_activity_ts_id (timestamp, id),"
+        " ADD INDEX idx_activity_user_ts (user_id, timestamp, id),"
+        " ADD INDEX idx_activity_action_ts (action, timestamp, id),"
+        " ADD INDEX idx_activity_record_ts (record_type, record_id, timestamp, id)",
+    ]),
+    (3, "Partition activity log by month", [
+        partition_activity_log,
+    ]),
+    # Compact activity log: integer codes plus a JSON payload instead of
+    # repeated strings and a prose description (see activity_codes).
+    (4, "Add compact activity log columns", [
+        "ALTER TABLE activity_log"
+        " ADD COLUMN action_code TINYINT UNSIGNED NULL,"
+        " ADD COLUMN record_type_code TINYINT UNSIGNED NULL,"
+        " ADD COLUMN payload JSON NULL",
+    ]),
+    (5, "Convert activity log rows to compact encoding", [
+        backfill_activity_codes,
+    ]),
+    (6, "Drop legacy activity log columns", [
+        backfill_activity_codes, # Catch rows written by older clients since version 5.
+        "ALTER TABLE activity_log"
+        " DROP INDEX idx_activity_action_ts,"
+        " DROP INDEX idx_activity_record_ts,"
+        " DROP COLUMN action,"
+        " DROP COLUMN record_type,"
+        " DROP COLUMN description,"
+        " MODIFY action_code TINYINT UNSIGNED NOT NULL,"
+        " MODIFY record_type_code TINYINT UNSIGNED NOT NULL,"
+        " ADD INDEX idx_activity_action_ts (action_code, timestamp, id),"
+        " ADD INDEX idx_activity_record_ts (record_type_code, record_id, timestamp, id)",
+    ]),
+    # Field-level history of maintenance records (see version_queries).
+    (7, "Add maintenance record versions", [
+        """
+        CREATE TABLE maintenance_versions (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            maintenance_id INT NOT NULL,
+            version INT NOT NULL,
+            user_id INT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_snapshot TINYINT(1) NOT NULL,
+            changed_mask SMALLINT UNSIGNED NOT NULL,
+            data JSON NOT NULL,
+            UNIQUE KEY uq_maintenance_version (maintenance_id, version)
+        )
+        """,
+    ]),
+    # Change feed for open windows on other machines (see change_feed).
+    (8, "Add maintenance change feed", [
+        """
+        CREATE TABLE maintenance_changes (
+            seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+            maintenance_id INT NOT NULL,
+            changed_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+            INDEX idx_changes_time (changed_at)
+        )
+        """,
+        "CREATE TRIGGER trg_maintenance_changes_ins AFTER INSERT ON maintenance FOR EACH ROW"
+        " INSERT INTO maintenance_changes (maintenance_id) VALUES (NEW.id)",
+        "CREATE TRIGGER trg_maintenance_changes_upd AFTER UPDATE ON maintenance FOR EACH ROW"
+        " INSERT INTO maintenance_changes (maintenance_id) VALUES (NEW.id)",
+        "CREATE TRIGGER trg_maintenance_changes_del AFTER DELETE ON maintenance FOR EACH ROW"
+        " INSERT INTO maintenance_changes (maintenance_id) VALUES (OLD.id)",
+    ]),
+    # Vertical split: long text fields move to maintenance_text (see record_queries).
+    # Close older clients first; they still write the dropped columns.
+    (9, "Move maintenance text fields to maintenance_text", [
+        split_maintenance_text,
+        "ALTER TABLE maintenance DROP COLUMN procedures, DROP COLUMN materials, DROP COLUMN notes, DROP COLUMN warnings",
+        "CREATE TRIGGER trg_maintenance_text_changes_ins AFTER INSERT ON maintenance_text FOR EACH ROW"
+        " INSERT INTO maintenance_changes (maintenance_id) VALUES (NEW.maintenance_id)",
+        "CREATE TRIGGER trg_maintenance_text_changes_upd AFTER UPDATE ON maintenance_text FOR EACH ROW"
+        " INSERT INTO maintenance_changes (maintenance_id) VALUES (NEW.maintenance_id)",
+    ]),
+    # Lookup tables for type, device and technician (see lookup_queries). Existing
+    # records get their keys from backfill_lookup_ids in the background.
+    (10, "Add type, device and technician lookup tables", [
+        *(f"""
+        CREATE TABLE {table} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            name_key VARCHAR(191) NOT NULL,
+            merged_into INT NULL,
+            UNIQUE KEY uq_{table}_key (name_key),
+            CONSTRAINT fk_{table}_merged FOREIGN KEY (merged_into) REFERENCES {table} (id)
+        )
+        """ for table in LOOKUP_TABLES.values()),
+        "ALTER TABLE maintenance"
+        + ",".join(f" ADD COLUMN {kind}_id INT NULL" for kind in LOOKUP_TABLES)
+        + "".join(f", ADD CONSTRAINT fk_maintenance_{kind} FOREIGN KEY ({kind}_id) REFERENCES {table} (id)"
+                  for kind, table in LOOKUP_TABLES.items()),
+    ]),
+    # Departments by id (see utility_queries). On a large database run
+    # migrate_departments.py first: it adds the columns and fills them in
+    # batches while the application stays up, so 12 only drops the old
+    # columns. 12 is offline: older clients still write the names.
+    # The foreign keys are added in 12, after the backfill: adding one together
+    # with the column would copy the whole table under a write lock.
+    (11, "Add department_id to maintenance and users", [
+        "ALTER TABLE maintenance ADD COLUMN department_id INT NULL, ALGORITHM=INSTANT",
+        "ALTER TABLE users ADD COLUMN department_id INT NULL, ALGORITHM=INSTANT",
+    ]),
+    (12, "Drop department name columns", [
+        lambda cur: backfill_department_ids(),
+        add_department_foreign_keys,
+        "ALTER TABLE maintenance DROP COLUMN department",
+        "ALTER TABLE users DROP COLUMN department",
+    ]),
+    # Normalised key for autocomplete prefix queries (see lookup_queries.search_key).
+    (13, "Add search_key to lookup tables", [
+        *(f"ALTER TABLE {table} ADD COLUMN search_key VARCHAR(191) NOT NULL DEFAULT '',"
+          f" ADD INDEX idx_{table}_search (search_key)" for table in LOOKUP_TABLES.values()),
+        fill_lookup_search_keys,
+    ]),
+    # Trigram index for fuzzy search (see lookup_queries.find_similar_lookup_values).
+    (14, "Add trigram index for lookup values", [
+        *(f"""
+        CREATE TABLE {table}_trigrams (
+            trigram CHAR(3) NOT NULL,
+            value_id INT NOT NULL,
+            PRIMARY KEY (trigram, value_id),
+            KEY idx_{table}_trigrams_value (value_id),
+            CONSTRAINT fk_{table}_trigrams_value FOREIGN KEY (value_id) REFERENCES {table} (id) ON DELETE CASCADE
+        )
+        """ for table in LOOKUP_TABLES.values()),
+        *(f"ALTER TABLE {table} ADD COLUMN trigram_count SMALLINT NOT NULL DEFAULT 0" for table in LOOKUP_TABLES.values()),
+        fill_lookup_trigrams,
+    ]),
+    # Attachment text index (see attachment_index). Existing attachments are
+    # queued by their NULL text_indexed_at.
+    (15, "Add full-text index of attachment contents", [
+        "ALTER TABLE attachments ADD COLUMN text_indexed_at DATETIME NULL, ADD COLUMN text_pages INT NULL,"
+        " ADD INDEX idx_attachments_text_pending (text_indexed_at)",
+        """
+        CREATE TABLE attachment_text (
+            attachment_id INT NOT NULL,
+            page INT NOT NULL,
+            content MEDIUMTEXT NOT NULL,
+            PRIMARY KEY (attachment_id, page),
+            FULLTEXT KEY ft_attachment_text (content),
+            CONSTRAINT fk_attachment_text FOREIGN KEY (attachment_id) REFERENCES attachments (id) ON DELETE CASCADE
+        )
+        """,
+    ]),
+    # Server-side sorting of the record grids (see record_queries.RECORD_SORT_COLUMNS).
+    (16, "Add sort indexes for record lists", [
+        "ALTER TABLE maintenance"
+        " ADD INDEX idx_maintenance_list_date (is_deleted, date),"
+        " ADD INDEX idx_maintenance_list_type (is_deleted, type),"
+        " ADD INDEX idx_maintenance_list_device (is_deleted, device),"
+        " ADD INDEX idx_maintenance_list_technician (is_deleted, technician)",
+    ]),
+    # Archive tier for old records (see record_archive); archive_records.py
+    # moves them. Drops the attachments foreign key to maintenance.
+    (17, "Add maintenance record archive", [
+        create_maintenance_archive,
+    ]),
+    # Lookup merges repoint archived records too (see lookup_queries.merge_lookup_values).
+    (18, "Add lookup indexes to maintenance archive", [
+        "ALTER TABLE maintenance_archive"
+        " ADD INDEX idx_maintenance_archive_type (type_id),"
+        " ADD INDEX idx_maintenance_archive_device (device_id),"
+        " ADD INDEX idx_maintenance_archive_technician (technician_id)",
+    ]),
+    # Word-start autocomplete for large vocabularies (see lookup_queries.search_lookup_prefix).
+    (19, "Add word-start keys for lookup autocomplete", [
+        *(f"""
+        CREATE TABLE IF NOT EXISTS {table}_words (
+            word_key VARCHAR(191) NOT NULL,
+            value_id INT NOT NULL,
+            PRIMARY KEY (word_key, value_id),
+            KEY idx_{table}_words_value (value_id),
+            CONSTRAINT fk_{table}_words_value FOREIGN KEY (value_id) REFERENCES {table} (id) ON DELETE CASCADE
+        )
+        """ for table in LOOKUP_TABLES.values()),
+        fill_lookup_word_keys,
+    ]),
+]
+
+OFFLINE_MIGRATIONS = (3, 6, 9, 12)
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def _ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migration_steps (
+            version INT NOT NULL,
+            step INT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (version, step)
+        )
+    """)
+
+def get_schema_version():
+    """Returns the highest applied migration version (0 for a fresh database)."""
+    with get_cursor() as cur:
+        _ensure_version_table(cur)
+        cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+        return cur.fetchone()['version']
+
+def check_schema_version():
+    """
+    Checks that the database schema matches this version of the program.
+    Returns (success, message); the message says what to do when it does not.
+    """
+    try:
+        current = get_schema_version()
+    except Exception as e:
+        return False, f"تعذر التحقق من إصدار قاعدة البيانات:\n{str(e)}"
+    if current < LATEST_SCHEMA_VERSION:
+        return False, (f"قاعدة البيانات بحاجة إلى تحديث (الإصدار {current} من {LATEST_SCHEMA_VERSION}).\n"
+                       "يرجى من مسؤول النظام تشغيل migrate_schema.py قبل استخدام البرنامج.")
+    if current > LATEST_SCHEMA_VERSION:
+        return False, (f"قاعدة البيانات أحدث من هذا الإصدار من البرنامج (الإصدار {current}).\n"
+                       "يرجى تثبيت آخر إصدار من البرنامج.")
+    return True, "Schema is up to date."
+
+def pending_migrations(target_version=None):
+    """(version, description) of the migrations not yet applied, up to target_version if given."""
+    current = get_schema_version()
+    return [(version, description) for version, description, _ in MIGRATIONS
+            if version > current and (target_version is None or version <= target_version)]
+
+def apply_migrations(target_version=None, offline=False):
+    """
+    Applies pending schema migrations, up to target_version if given. Stops
+    before a version in OFFLINE_MIGRATIONS unless offline is True (every
+    other client closed). Returns (success, message).
+    """
+    try:
+        current = get_schema_version()
+        applied = []
+        for version, description, statements in MIGRATIONS:
+            if version <= current or (target_version is not None and version > target_version):
+                continue
+            if version in OFFLINE_MIGRATIONS and not offline:
+                done = f"Applied schema migrations: {', '.join(map(str, applied))}\n" if applied else ""
+                return False, (f"{done}Migration {version} ({description}) needs every other client closed;"
+                               " close them and run migrate_schema.py --offline.")
+            with get_cursor() as cur:
+                cur.execute("SELECT step FROM schema_migration_steps WHERE version = %s", (version,))
+                done = {row['step'] for row in cur.fetchall()}
+            for step, statement in enumerate(statements):
+                if step in done:
+                    continue
+                with get_cursor() as cur:
+                    if callable(statement):
+                        statement(cur)
+                    else:
+                        cur.execute(statement)
+                    cur.execute("INSERT INTO schema_migration_steps (version, step) VALUES (%s, %s)", (version, step))
+            with get_cursor() as cur:
+                cur.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)", (version, description))
+            applied.append(version)
+        if applied:
+            return True, f"Applied schema migrations: {', '.join(map(str, applied))}"
+        return True, "Schema is up to date."
+    except Exception as e:
+        return False, f"Schema migration failed: {str(e)}"
@@ -0,0 +1,328 @@
+﻿# /database/native_backup.py
+
+import io
+import os
+import json
+import base64
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+from datetime import datetime, date, time, timedelta
+from .connection import config, get_connection, get_dedicated_connection, get_db_config
+from .utility_queries import _open_backup_writer, _open_backup_reader, estimate_database_rows
+
+# Native logical dumps are JSON lines, optionally gzip/zstd compressed:
+#   {"type": "header", ...}                       once
+#   {"type": "table", "name", "create", "columns"} then one JSON array per row
+#   {"type": "end_table", "name", "rows"}
+#   {"type": "view" | "trigger", "name", "create"}
+#   {"type": "end"}
+# Metadata lines are objects and row lines are arrays, so the reader can tell
+# them apart from the first character. No mysql/mysqldump binaries are needed
+# and the password never appears on a command line.
+NATIVE_FORMAT = "maintenance-native-v1"
+NATIVE_DUMP_SUFFIXES = ('.jsonl', '.jsonl.gz', '.jsonl.zst')
+FETCH_CHUNK_ROWS = 2000
+INSERT_BATCH_ROWS = 1000
+COMMIT_EVERY_ROWS = 20000
+RESTORE_WORKERS = 3
+DEFERRED_INDEX_PREFIXES = ('KEY ', 'UNIQUE KEY ', 'FULLTEXT KEY ', 'SPATIAL KEY ')
+
+def is_native_dump(path):
+    return path.lower().endswith(NATIVE_DUMP_SUFFIXES)
+
+def backup_engine():
+    """
+    Returns the engine configured in [backup] engine: 'native' (default) or
+    'mysqldump'. Falls back to native when the mysqldump binary is not on PATH.
+    """
+    engine = config.get('backup', 'engine', fallback='native').strip().lower()
+    if engine == 'mysqldump' and shutil.which('mysqldump'):
+        return 'mysqldump'
+    return 'native'
+
+def _quote_ident(name):
+    return "`" + name.replace("`", "``") + "`"
+
+def _encode_value(value):
+    """Maps a column value to JSON. MySQL accepts the string forms back for dates and decimals."""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return {"b64": base64.b64encode(bytes(value)).decode('ascii')}
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        # TIME columns come back as timedelta and may be negative or exceed 24h.
+        sign = "-" if value < timedelta(0) else ""
+        total = abs(value)
+        hours, rem = divmod(total.days * 86400 + total.seconds, 3600)
+        minutes, seconds = divmod(rem, 60)
+        fraction = f".{total.microseconds:06d}" if total.microseconds else ""
+        return f"{sign}{hours:02d}:{minutes:02d}:{seconds:02d}{fraction}"
+    if isinstance(value, set):
+        return ",".join(sorted(value))
+    return str(value)
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return base64.b64decode(value['b64'])
+    return value
+
+def _write_json_line(out, obj):
+    data = (json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+    out.write(data)
+    return len(data)
+
+def native_backup_database(output_path, progress_callback=None, throttle=None):
+    """
+    Dumps the database in-process from a single consistent snapshot. Rows are
+    streamed with an unbuffered cursor in chunks of FETCH_CHUNK_ROWS, so memory
+    stays flat regardless of table size.
+    progress_callback(bytes_written, rows_total_estimate, rows_done) matches backup_database.
+    An optional IoThrottle paces the fetch loop, which also eases the load on the server.
+    """
+    try:
+        rows_total = estimate_database_rows() if progress_callback else 0
+        rows_done = 0
+        bytes_done = 0
+        with get_connection() as conn, _open_backup_writer(output_path) as out:
+            conn.start_transaction(consistent_snapshot=True, isolation_level='REPEATABLE READ', readonly=True)
+            meta = conn.cursor()
+            meta.execute("SHOW FULL TABLES")
+            objects = meta.fetchall()
+            tables = [name for name, kind in objects if kind == 'BASE TABLE']
+            views = [name for name, kind in objects if kind == 'VIEW']
+            bytes_done += _write_json_line(out, {"type": "header", "format": NATIVE_FORMAT,
+                                                 "database": get_db_config()['database'],
+                                                 "created_at": datetime.now().isoformat(timespec='seconds')})
+            for table in tables:
+                meta.execute(f"SHOW CREATE TABLE {_quote_ident(table)}")
+                create_sql = meta.fetchall()[0][1]
+                stream = conn.cursor()
+                stream.execute(f"SELECT * FROM {_quote_ident(table)}")
+                columns = [d[0] for d in stream.description]
+                bytes_done += _write_json_line(out, {"type": "table", "name": table, "create": create_sql, "columns": columns})
+                table_rows = 0
+                while True:
+                    rows = stream.fetchmany(FETCH_CHUNK_ROWS)
+                    if not rows:
+                        break
+                    chunk = "".join(json.dumps([_encode_value(v) for v in row], ensure_ascii=False, separators=(',', ':')) + "\n"
+                                    for row in rows).encode('utf-8')
+                    out.write(chunk)
+                    bytes_done += len(chunk)
+                    if throttle:
+                        throttle.consume(len(chunk))
+                    table_rows += len(rows)
+                    rows_done += len(rows)
+                    if progress_callback:
+                        progress_callback(bytes_done, rows_total, rows_done)
+                stream.close()
+                bytes_done += _write_json_line(out, {"type": "end_table", "name": table, "rows": table_rows})
+            for view in views:
+                meta.execute(f"SHOW CREATE VIEW {_quote_ident(view)}")
+                bytes_done += _write_json_line(out, {"type": "view", "name": view, "create": meta.fetchall()[0][1]})
+            meta.execute("SHOW TRIGGERS")
+            for trigger in [row[0] for row in meta.fetchall()]:
+                meta.execute(f"SHOW CREATE TRIGGER {_quote_ident(trigger)}")
+                bytes_done += _write_json_line(out, {"type": "trigger", "name": trigger, "create": meta.fetchall()[0][2]})
+            _write_json_line(out, {"type": "end"})
+            meta.close()
+        return True, f"تم إنشاء النسخة الاحتياطية بنجاح في:\n{output_path}\n({rows_done} صف)"
+    except Exception as e:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False, f"حدث استثناء أثناء النسخ الاحتياطي:\n{str(e)}"
+
+def split_create_table(create_sql):
+    """
+    Splits a SHOW CREATE TABLE statement into (create_without_secondary_keys,
+    index_clauses, foreign_key_clauses) so the bulk load runs against the
+    clustered primary key only. Keys covering an AUTO_INCREMENT column stay
+    inline, because InnoDB requires such a column to be indexed.
+    """
+    lines = create_sql.split("\n")
+    # Table options (and any PARTITION clause) follow the line that closes the column list.
+    close_index = max(i for i, line in enumerate(lines) if line.startswith(")"))
+    header, body, footer = lines[0], lines[1:close_index], "\n".join(lines[close_index:])
+    auto_increment_columns = [line.strip().split("`")[1] for line in body
+                              if line.strip().startswith("`") and " AUTO_INCREMENT" in line]
+    kept, indexes, foreign_keys = [], [], []
+    for line in body:
+        clause = line.strip().rstrip(",")
+        if clause.startswith(DEFERRED_INDEX_PREFIXES) and not any(f"`{col}`" in clause.split("(", 1)[1] for col in auto_increment_columns):
+            indexes.append(clause)
+        elif clause.startswith("CONSTRAINT ") and " FOREIGN KEY " in clause:
+            foreign_keys.append(clause)
+        else:
+            kept.append("  " + clause)
+    return "\n".join([header, ",\n".join(kept), footer]), indexes, foreign_keys
+
+def _resolve_restore_workers(workers):
+    if workers is None:
+        workers = config.getint('backup', 'restore_workers', fallback=RESTORE_WORKERS)
+    # Each worker opens a dedicated connection, so the pool used by the running application is not touched.
+    return max(1, workers)
+
+def _load_table(spec, table_progress_callback=None):
+    """
+    Loads one spooled table over its own dedicated connection, then builds its
+    secondary indexes in a single ALTER and checks the final row count.
+    Runs on a restore worker thread.
+    """
+    def report(state, done):
+        if table_progress_callback:
+            table_progress_callback(spec['name'], state, done, spec['rows'])
+
+    loaded = 0
+    with get_dedicated_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SET FOREIGN_KEY_CHECKS = 0")
+        cur.execute("SET UNIQUE_CHECKS = 0")
+        report('loading', 0)
+        batch, uncommitted = [], 0
+        with open(spec['spool'], 'r', encoding='utf-8', newline='\n') as rows:
+            for line in rows:
+                batch.append(tuple(_decode_value(v) for v in json.loads(line)))
+                if len(batch) >= INSERT_BATCH_ROWS:
+                    cur.executemany(spec['insert_sql'], batch)
+                    loaded += len(batch)
+                    uncommitted += len(batch)
+                    batch = []
+                    if uncommitted >= COMMIT_EVERY_ROWS:
+                        conn.commit()
+                        uncommitted = 0
+                    report('loading', loaded)
+        if batch:
+            cur.executemany(spec['insert_sql'], batch)
+            loaded += len(batch)
+        conn.commit()
+        if spec['indexes']:
+            report('indexing', loaded)
+            cur.execute(f"ALTER TABLE {_quote_ident(spec['name'])} " + ", ".join("ADD " + clause for clause in spec['indexes']))
+        cur.execute(f"SELECT COUNT(*) FROM {_quote_ident(spec['name'])}")
+        actual = cur.fetchone()[0]
+        cur.execute("SET UNIQUE_CHECKS = 1")
+        cur.execute("SET FOREIGN_KEY_CHECKS = 1")
+    if actual != spec['rows']:
+        raise ValueError(f"عدد الصفوف بعد الاستعادة {actual} من {spec['rows']}")
+    report('done', loaded)
+    return loaded
+
+def native_restore_database(input_path, progress_callback=None, table_progress_callback=None, workers=None):
+    """
+    Restores a native dump in three steps:
+
+    1. Read the dump once, spooling each table's rows to a per-table file and
+       checking its row counts and completeness. Only a dump that passes is
+       applied: every table is then recreated without its secondary indexes
+       and foreign keys. Nothing is dropped for a truncated or corrupt file.
+    2. Load the tables concurrently, each over its own dedicated connection with
+       relaxed checks, largest first. Every worker rebuilds its table's
+       indexes and verifies the row count as soon as its load finishes.
+    3. Add foreign keys, views and triggers once all data is in.
+
+    progress_callback(archive_bytes_read, archive_size, rows_read) reports
+    step 1 and matches restore_database. table_progress_callback(table, state,
+    rows_done, rows_total) reports step 2 from worker threads, with state one
+    of 'queued', 'loading', 'indexing', 'done' or 'failed'. workers defaults to
+    [backup] restore_workers in config.ini; 1 restores sequentially.
+    """
+    spool_dir = tempfile.mkdtemp(prefix="restore_")
+    try:
+        if not os.path.exists(input_path):
+            return False, f"ملف النسخة الاحتياطية غير موجود: {input_path}"
+        archive_size = os.path.getsize(input_path)
+        workers = _resolve_restore_workers(workers)
+        tables, deferred_foreign_keys, deferred_objects = [], [], []
+        rows_read, spec, spool, complete = 0, None, None, False
+        with open(input_path, 'rb') as raw:
+            lines = io.TextIOWrapper(_open_backup_reader(raw, input_path), encoding='utf-8', newline='\n')
+            try:
+                for line in lines:
+                    if line.startswith("["):
+                        spool.write(line)
+                        spec['spooled'] += 1
+                        rows_read += 1
+                        if progress_callback and rows_read % INSERT_BATCH_ROWS == 0:
+                            progress_callback(raw.tell(), archive_size, rows_read)
+                        continue
+                    record = json.loads(line)
+                    kind = record['type']
+                    if kind == 'header':
+                        if record.get('format') != NATIVE_FORMAT:
+                            raise ValueError(f"صيغة نسخة احتياطية غير مدعومة: {record.get('format')}")
+                    elif kind == 'table':
+                        create_sql, indexes, foreign_keys = split_create_table(record['create'])
+                        deferred_foreign_keys.extend((record['name'], clause) for clause in foreign_keys)
+                        columns = ", ".join(_quote_ident(c) for c in record['columns'])
+                        placeholders = ", ".join(["%s"] * len(record['columns']))
+                        spec = {'name': record['name'], 'create_sql': create_sql, 'indexes': indexes, 'spooled': 0,
+                                'insert_sql': f"INSERT INTO {_quote_ident(record['name'])} ({columns}) VALUES ({placeholders})",
+                                'spool': os.path.join(spool_dir, f"{len(tables):04d}.jsonl")}
+                        spool = open(spec['spool'], 'w', encoding='utf-8', newline='\n')
+                    elif kind == 'end_table':
+                        spool.close()
+                        spool = None
+                        if spec['spooled'] != record['rows']:
+                            raise ValueError(f"عدد الصفوف غير مطابق في الجدول {record['name']}: {spec['spooled']} من {record['rows']}")
+                        spec['rows'] = record['rows']
+                        tables.append(spec)
+                    elif kind in ('view', 'trigger'):
+                        deferred_objects.append(record)
+                    elif kind == 'end':
+                        complete = True
+            finally:
+                if spool:
+                    spool.close()
+            if not complete:
+                raise ValueError("ملف النسخة الاحتياطية غير مكتمل (انتهى قبل نهايته المتوقعة).")
+        with get_dedicated_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for spec in tables:
+                cur.execute(f"DROP TABLE IF EXISTS {_quote_ident(spec['name'])}")
+                cur.execute(spec['create_sql'])
+            cur.execute("SET FOREIGN_KEY_CHECKS = 1")
+        if progress_callback:
+            progress_callback(archive_size, archive_size, rows_read)
+
+        # Largest tables first, so the longest load does not start last.
+        tables.sort(key=lambda t: t['rows'], reverse=True)
+        if table_progress_callback:
+            for spec in tables:
+                table_progress_callback(spec['name'], 'queued', 0, spec['rows'])
+        failures = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_load_table, spec, table_progress_callback): spec for spec in tables}
+            for future in as_completed(futures):
+                spec = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failures.append(f"{spec['name']}: {e}")
+                    if table_progress_callback:
+                        table_progress_callback(spec['name'], 'failed', 0, spec['rows'])
+        if failures:
+            return False, "فشلت استعادة بعض الجداول:\n" + "\n".join(failures)
+
+        with get_dedicated_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for table, clause in deferred_foreign_keys:
+                cur.execute(f"ALTER TABLE {_quote_ident(table)} ADD {clause}")
+            for record in deferred_objects:
+                cur.execute(f"DROP {record['type'].upper()} IF EXISTS {_quote_ident(record['name'])}")
+                cur.execute(record['create'])
+            cur.execute("SET FOREIGN_KEY_CHECKS = 1")
+        return True, f"تمت استعادة النسخة الاحتياطية بنجاح ({rows_read} صف في {len(tables)} جدول، {workers} عمليات متوازية)."
+    except Exception as e:
+        return False, f"حدث استثناء أثناء استعادة النسخة الاحتياطية:\n{str(e)}"
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
@@ -0,0 +1,257 @@
+﻿# pdf_viewer.py
+import math
+from collections import OrderedDict
+from PyQt5.QtWidgets import QGraphicsPixmapItem
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtCore import Qt, QObject, QThread, QTimer, QRectF, pyqtSignal
+
+try:
+    import fitz
+    pdf_preview_enabled = True
+except ImportError:
+    pdf_preview_enabled = False
+
+# Render resolutions (pixels per PDF point) are snapped to these steps so that
+# small zoom changes reuse a cached page instead of triggering a new render.
+RENDER_SCALES = (0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 6.0, 8.0)
+CACHE_BUDGET_BYTES = 96 * 1024 * 1024
+# A render never exceeds MAX_RENDER_PIXELS (about 48MB as RGB888), so one page
+# cannot fill the cache: past that, large drawings just stop getting sharper.
+# The next page is only prefetched while it stays under PREFETCH_MAX_PIXELS.
+MAX_RENDER_PIXELS = 16 * 1000 * 1000
+PREFETCH_MAX_PIXELS = 4 * 1000 * 1000
+REFINE_DELAY_MS = 150
+
+
+def render_pixels(page_size, scale):
+    width, height = page_size
+    return width * height * scale * scale
+
+
+def pick_render_scale(required_scale, page_size=None):
+    """
+    Returns the smallest render step that is at least as sharp as
+    required_scale, capped so a page of page_size (in PDF points) stays
+    within MAX_RENDER_PIXELS.
+    """
+    limit = RENDER_SCALES[-1]
+    if page_size is not None and render_pixels(page_size, 1.0) > 0:
+        limit = min(limit, math.sqrt(MAX_RENDER_PIXELS / render_pixels(page_size, 1.0)))
+    allowed = [scale for scale in RENDER_SCALES if scale <= limit]
+    if not allowed:
+        return limit # Even the smallest step is too large for this page.
+    for scale in allowed:
+        if scale >= required_scale:
+            return scale
+    return allowed[-1]
+
+
+class PdfPageCache:
+    """Bounded LRU of rendered pages keyed by (file_path, page_index, scale)."""
+
+    def __init__(self, budget_bytes=CACHE_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self._images = OrderedDict()
+
+    @staticmethod
+    def _image_size(image):
+        return image.bytesPerLine() * image.height()
+
+    def get(self, key):
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+        return image
+
+    def best_available(self, file_path, page_index):
+        """Returns (scale, image) of the sharpest cached render of a page, or (None, None)."""
+        best_scale, best_image = None, None
+        for (path, index, scale), image in self._images.items():
+            if path == file_path and index == page_index and (best_scale is None or scale > best_scale):
+                best_scale, best_image = scale, image
+        return best_scale, best_image
+
+    def put(self, key, image):
+        if key in self._images:
+            self.used_bytes -= self._image_size(self._images.pop(key))
+        self._images[key] = image
+        self.used_bytes += self._image_size(image)
+        while self.used_bytes > self.budget_bytes and len(self._images) > 1:
+            _, evicted = self._images.popitem(last=False)
+            self.used_bytes -= self._image_size(evicted)
+
+    def clear(self):
+        self._images.clear()
+        self.used_bytes = 0
+
+
+class PdfRenderWorker(QThread):
+    """Renders a single PDF page to a QImage without blocking the UI."""
+    rendered = pyqtSignal(int, str, int, float, QImage) # generation, file_path, page_index, scale, image
+
+    def __init__(self, generation, file_path, page_index, scale):
+        super().__init__()
+        self.generation = generation
+        self.file_path = file_path
+        self.page_index = page_index
+        self.scale = scale
+
+    def run(self):
+        try:
+            # Each worker opens its own handle: fitz documents are not thread-safe.
+            doc = fitz.open(self.file_path)
+            try:
+                page = doc.load_page(self.page_index)
+                pix = page.get_pixmap(matrix=fitz.Matrix(self.scale, self.scale), alpha=False)
+                # copy() detaches the image from the pixmap buffer, which is freed with the document.
+                image = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888).copy()
+            finally:
+                doc.close()
+            self.rendered.emit(self.generation, self.file_path, self.page_index, self.scale, image)
+        except Exception as e:
+            print(f"Error rendering page {self.page_index} of {self.file_path}: {e}")
+
+
+class PdfPageNavigator(QObject):
+    """
+    Shows a PDF one page at a time inside an existing zoomable QGraphicsView.
+
+    The page item always occupies the page size in PDF points in scene
+    coordinates; only its pixmap resolution changes. Pages are rendered on
+    demand in background threads, kept in a PdfPageCache, and re-rendered at a
+    sharper resolution only once the view is zoomed past the current one.
+    """
+    page_changed = pyqtSignal(int, int) # page_index, page_count
+
+    def __init__(self, view, scene, cache=None, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.scene = scene
+        self.cache = cache if cache is not None else PdfPageCache()
+        self.file_path = None
+        self.page_index = 0
+        self.page_count = 0
+        self.page_sizes = []
+        self.item = None
+        self._item_scale = None
+        self._generation = 0
+        self._workers = set()
+        self._pending = set()
+        self._refine_timer = QTimer(self)
+        self._refine_timer.setSingleShot(True)
+        self._refine_timer.setInterval(REFINE_DELAY_MS)
+        self._refine_timer.timeout.connect(self.refine)
+
+    def is_open(self):
+        return self.file_path is not None
+
+    def open(self, file_path):
+        """Opens a document and shows its first page. Returns False if it cannot be read."""
+        self.close()
+        try:
+            doc = fitz.open(file_path)
+            try:
+                self.page_sizes = [(page.rect.width, page.rect.height) for page in doc]
+            finally:
+                doc.close()
+        except Exception as e:
+            print(f"Error opening PDF {file_path}: {e}")
+            return False
+        if not self.page_sizes:
+            return False
+        self.file_path = file_path
+        self.page_count = len(self.page_sizes)
+        self.show_page(0)
+        return True
+
+    def close(self):
+        """Forgets the current document. The scene itself is cleared by the owner."""
+        self._generation += 1
+        self._refine_timer.stop()
+        self._pending.clear()
+        self.file_path = None
+        self.page_index = 0
+        self.page_count = 0
+        self.page_sizes = []
+        self.item = None
+        self._item_scale = None
+        self.scene.setSceneRect(QRectF()) # back to an automatically sized scene
+
+    def show_page(self, page_index):
+        if not self.is_open() or not 0 <= page_index < self.page_count:
+            return
+        self._generation += 1
+        self._pending.clear()
+        self.page_index = page_index
+        if self.item is None:
+            self.item = QGraphicsPixmapItem()
+            self.item.setTransformationMode(Qt.SmoothTransformation)
+            self.scene.addItem(self.item)
+        self._item_scale = None
+        self.item.setPixmap(QPixmap())
+        width, height = self.page_sizes[page_index]
+        self.scene.setSceneRect(0, 0, width, height)
+
+        scale, image = self.cache.best_available(self.file_path, page_index)
+        if image is not None:
+            self._apply_image(scale, image)
+        self.view.fitInView(0, 0, width, height, Qt.KeepAspectRatio)
+        self.page_changed.emit(self.page_index, self.page_count)
+        self.refine()
+
+    def next_page(self):
+        self.show_page(self.page_index + 1)
+
+    def previous_page(self):
+        self.show_page(self.page_index - 1)
+
+    def schedule_refine(self):
+        """Debounces resolution checks while the user is still zooming."""
+        if self.is_open():
+            self._refine_timer.start()
+
+    def required_scale(self):
+        return self.view.transform().m11() * self.view.devicePixelRatioF()
+
+    def refine(self):
+        """Makes sure the current page is rendered at least as sharply as the view needs."""
+        if not self.is_open():
+            return
+        target = pick_render_scale(self.required_scale(), self.page_sizes[self.page_index])
+        if self._item_scale is not None and self._item_scale >= target:
+            return
+        cached = self.cache.get((self.file_path, self.page_index, target))
+        if cached is not None:
+            self._apply_image(target, cached)
+            return
+        self._request(self.page_index, target)
+        # Warm the next page at the same resolution so paging forward is instant,
+        # unless that render is large enough to compete with the current one.
+        next_index = self.page_index + 1
+        if next_index < self.page_count and render_pixels(self.page_sizes[next_index], target) <= PREFETCH_MAX_PIXELS:
+            self._request(next_index, target)
+
+    def _request(self, page_index, scale):
+        key = (self.file_path, page_index, scale)
+        if key in self._pending or self.cache.get(key) is not None:
+            return
+        self._pending.add(key)
+        worker = PdfRenderWorker(self._generation, self.file_path, page_index, scale)
+        worker.rendered.connect(self._on_rendered)
+        worker.finished.connect(lambda w=worker: self._workers.discard(w))
+        self._workers.add(worker)
+        worker.start()
+
+    def _on_rendered(self, generation, file_path, page_index, scale, image):
+        self.cache.put((file_path, page_index, scale), image)
+        if generation != self._generation or file_path != self.file_path:
+            return
+        self._pending.discard((file_path, page_index, scale))
+        if page_index == self.page_index and (self._item_scale is None or scale > self._item_scale):
+            self._apply_image(scale, image)
+
+    def _apply_image(self, scale, image):
+        self.item.setPixmap(QPixmap.fromImage(image))
+        self.item.setScale(1.0 / scale)
+        self._item_scale = scale
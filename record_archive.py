@@ -0,0 +1,194 @@
+﻿# /database/record_archive.py
+
+from datetime import date
+from .connection import config, get_cursor
+
+# Active maintenance records dated before a cutoff (archive_after_months back)
+# are moved in batches to maintenance_archive, which is RANGE-partitioned by
+# year (pYYYY holds the records of YYYY and, for the first partition, any
+# earlier ones) and keeps the text fields inline. The hot table only grows
+# with the configured window. maintenance_archive_state.archived_before is
+# the latest cutoff used: every archived record is dated before it, so a
+# query whose date range starts on or after it never touches the archive.
+# Attachments and versions keep pointing at the record id. Writing to an
+# archived record (see unarchive_record) moves it back first.
+ARCHIVE_FUTURE_PARTITION = "p_future"
+ARCHIVE_HOT_COLUMNS = ('id', 'date', 'type', 'device', 'technician', 'type_id', 'device_id', 'technician_id', 'department_id')
+ARCHIVE_TEXT_COLUMNS = ('procedures', 'materials', 'notes', 'warnings')
+
+def load_record_archive_settings():
+    """Reads the [maintenance_archive] section of config.ini."""
+    section = 'maintenance_archive'
+    return {
+        'archive_after_months': config.getint(section, 'archive_after_months', fallback=36),
+        'batch_rows': config.getint(section, 'batch_rows', fallback=1000),
+    }
+
+def create_maintenance_archive(cur):
+    """
+    Migration step: creates maintenance_archive with the column types of
+    maintenance and maintenance_text, and drops foreign keys from attachments
+    to maintenance so archived records keep their attachments.
+    """
+    cur.execute("""
+        SELECT TABLE_NAME AS tbl, COLUMN_NAME AS name, COLUMN_TYPE AS type FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ('maintenance', 'maintenance_text')
+    """)
+    types = {row['name']: row['type'] for row in cur.fetchall() if row['name'] != 'maintenance_id'}
+    columns = ",\n".join(f"{column} {types.get(column, 'TEXT')} {'NOT NULL' if column in ('id', 'date') else 'NULL'}"
+                         for column in ARCHIVE_HOT_COLUMNS + ARCHIVE_TEXT_COLUMNS)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS maintenance_archive (
+            {columns},
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, date),
+            KEY idx_maintenance_archive_date (date),
+            KEY idx_maintenance_archive_department (department_id, date)
+        ) PARTITION BY RANGE (YEAR(date)) (PARTITION {ARCHIVE_FUTURE_PARTITION} VALUES LESS THAN MAXVALUE)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_archive_state (
+            id TINYINT PRIMARY KEY,
+            archived_before DATE NULL
+        )
+    """)
+    cur.execute("INSERT IGNORE INTO maintenance_archive_state (id, archived_before) VALUES (1, NULL)")
+    cur.execute("""
+        SELECT CONSTRAINT_NAME AS name FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'attachments' AND REFERENCED_TABLE_NAME = 'maintenance'
+    """)
+    for row in cur.fetchall():
+        cur.execute(f"ALTER TABLE attachments DROP FOREIGN KEY `{row['name']}`")
+
+def get_archive_boundary(cur):
+    """The date before which records may be archived, or None if nothing was ever archived."""
+    cur.execute("SELECT archived_before FROM maintenance_archive_state WHERE id = 1")
+    row = cur.fetchone()
+    return row['archived_before'] if row else None
+
+def archive_reached(cur, date_from):
+    """True if a query for records dated on or after date_from (None = all) has to include the archive."""
+    boundary = get_archive_boundary(cur)
+    return boundary is not None and (not date_from or date.fromisoformat(str(date_from)[:10]) < boundary)
+
+def _date_range_condition(date_from, date_to):
+    # Inlined (from parsed dates) into each arm, so the hot arm uses its date
+    # index and the archive's partitions are pruned inside the derived table.
+    conditions = [f"date {op} '{date.fromisoformat(str(value)[:10]).isoformat()}'"
+                  for op, value in ((">=", date_from), ("<=", date_to)) if value]
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+def maintenance_source(cur, date_from, date_to=None):
+    """
+    FROM-clause source for reports over maintenance rows dated from date_from
+    to date_to (inclusive, either may be None): the maintenance table, or,
+    once the range reaches the archive, a union of the hot columns of both
+    limited to the range (archived rows count as not deleted).
+    """
+    if not archive_reached(cur, date_from):
+        return "maintenance"
+    hot = ", ".join(ARCHIVE_HOT_COLUMNS)
+    condition = _date_range_condition(date_from, date_to)
+    return (f"(SELECT {hot}, is_deleted FROM maintenance{condition} UNION ALL"
+            f" SELECT {hot}, 0 AS is_deleted FROM maintenance_archive{condition})")
+
+def fetch_archived_record(cur, rec_id):
+    """Every column of an archived record, or None."""
+    cur.execute("""
+        SELECT a.*, d.name AS department, 1 AS archived FROM maintenance_archive a
+        LEFT JOIN departments d ON d.id = a.department_id WHERE a.id = %s
+    """, (rec_id,))
+    return cur.fetchone()
+
+def get_oldest_archived_date(cur, department=None):
+    sql = "SELECT MIN(a.date) AS oldest FROM maintenance_archive a"
+    params = []
+    if department:
+        sql += " JOIN departments d ON d.id = a.department_id WHERE d.name = %s"
+        params.append(department)
+    cur.execute(sql, params)
+    return cur.fetchone()['oldest']
+
+def unarchive_record(cur, rec_id):
+    """
+    Moves an archived record back into maintenance and maintenance_text, in
+    the caller's transaction, before it is written to. Returns True if it
+    was archived.
+    """
+    columns = ", ".join(ARCHIVE_HOT_COLUMNS)
+    text = ", ".join(ARCHIVE_TEXT_COLUMNS)
+    cur.execute(f"INSERT INTO maintenance ({columns}, is_deleted) SELECT {columns}, 0 FROM maintenance_archive WHERE id = %s",
+                (rec_id,))
+    if cur.rowcount == 0:
+        return False
+    cur.execute(f"INSERT INTO maintenance_text (maintenance_id, {text}) SELECT id, {text} FROM maintenance_archive WHERE id = %s",
+                (rec_id,))
+    cur.execute("DELETE FROM maintenance_archive WHERE id = %s", (rec_id,))
+    return True
+
+def _archive_partition_years(cur):
+    cur.execute("""
+        SELECT PARTITION_NAME AS name FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'maintenance_archive' AND PARTITION_NAME IS NOT NULL
+    """)
+    return sorted(int(row['name'][1:]) for row in cur.fetchall() if row['name'] != ARCHIVE_FUTURE_PARTITION)
+
+def ensure_archive_partitions(cur, first_year, last_year):
+    """Splits p_future so yearly partitions exist through last_year (starting at first_year for a new table)."""
+    years = _archive_partition_years(cur)
+    start = years[-1] + 1 if years else first_year
+    if start > last_year:
+        return
+    partitions = [f"PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in range(start, last_year + 1)]
+    partitions.append(f"PARTITION {ARCHIVE_FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+    cur.execute(f"ALTER TABLE maintenance_archive REORGANIZE PARTITION {ARCHIVE_FUTURE_PARTITION} INTO ({', '.join(partitions)})")
+
+def archive_old_records(archive_after_months=None, batch_rows=None, progress_callback=None, user_id=None):
+    """
+    Moves active records dated before the first day of the month
+    archive_after_months ago into maintenance_archive, batch_rows per
+    transaction, oldest first. The boundary is raised before the first row
+    moves, so queries include the archive as soon as it may be needed. An
+    interrupted run is simply resumed. Returns (success, message).
+    """
+    from .utility_queries import log_activity
+    settings = load_record_archive_settings()
+    months = settings['archive_after_months'] if archive_after_months is None else archive_after_months
+    batch_rows = batch_rows or settings['batch_rows']
+    today = date.today()
+    total_months = today.year * 12 + today.month - 1 - months
+    cutoff = date(total_months // 12, total_months % 12 + 1, 1)
+    hot = ", ".join(f"m.{column}" for column in ARCHIVE_HOT_COLUMNS)
+    text = ", ".join(f"t.{column}" for column in ARCHIVE_TEXT_COLUMNS)
+    try:
+        with get_cursor() as cur:
+            cur.execute("SELECT MIN(date) AS oldest FROM maintenance WHERE is_deleted = 0 AND date < %s", (cutoff,))
+            oldest = cur.fetchone()['oldest']
+            if oldest is None:
+                return True, "لا توجد سجلات صيانة قديمة تحتاج إلى أرشفة."
+            ensure_archive_partitions(cur, oldest.year, cutoff.year)
+            cur.execute("UPDATE maintenance_archive_state SET archived_before = GREATEST(COALESCE(archived_before, %s), %s)"
+                        " WHERE id = 1", (cutoff, cutoff))
+        moved = 0
+        while True:
+            with get_cursor() as cur:
+                cur.execute("SELECT id FROM maintenance WHERE is_deleted = 0 AND date < %s ORDER BY date, id LIMIT %s FOR UPDATE",
+                            (cutoff, batch_rows))
+                ids = [row['id'] for row in cur.fetchall()]
+                if not ids:
+                    break
+                placeholders = ", ".join(['%s'] * len(ids))
+                cur.execute(f"""
+                    INSERT INTO maintenance_archive ({', '.join(ARCHIVE_HOT_COLUMNS + ARCHIVE_TEXT_COLUMNS)})
+                    SELECT {hot}, {text} FROM maintenance m LEFT JOIN maintenance_text t ON t.maintenance_id = m.id
+                    WHERE m.id IN ({placeholders})
+                """, ids)
+                cur.execute(f"DELETE FROM maintenance WHERE id IN ({placeholders})", ids)
+                moved += len(ids)
+            if progress_callback:
+                progress_callback(moved)
+        if moved:
+            log_activity(user_id, 'ARCHIVE', 'maintenance', None, {'rows': moved, 'before': cutoff.isoformat()})
+        return True, f"تمت أرشفة {moved} سجل صيانة مؤرخ قبل {cutoff.isoformat()}."
+    except Exception as e:
+        return False, f"حدث استثناء أثناء أرشفة سجلات الصيانة:\n{str(e)}"
@@ -0,0 +1,188 @@
+﻿# record_grid.py
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QLineEdit, QLabel, QPushButton
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+import db_ops
+from record_sync import apply_record_delta
+
+FILTER_DELAY_MS = 300
+
+class RecordFilterRow(QWidget):
+    """One filter input under each column of a record table, kept as wide as its column."""
+    filters_changed = pyqtSignal()
+
+    def __init__(self, table, columns, parent=None):
+        super().__init__(parent)
+        self.table = table
+        self.columns = columns
+        self.inputs = []
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        self.delay = QTimer(self)
+        self.delay.setSingleShot(True)
+        self.delay.setInterval(FILTER_DELAY_MS)
+        self.delay.timeout.connect(self.filters_changed)
+        for column in columns:
+            line_edit = QLineEdit()
+            if column in db_ops.RECORD_FILTER_COLUMNS:
+                line_edit.setPlaceholderText("تصفية...")
+                line_edit.textChanged.connect(self.delay.start)
+            else:
+                line_edit.setEnabled(False)
+            layout.addWidget(line_edit)
+            self.inputs.append(line_edit)
+        layout.addStretch()
+        table.horizontalHeader().sectionResized.connect(self.sync_widths)
+        self.sync_widths()
+
+    def sync_widths(self, *args):
+        for col_idx, line_edit in enumerate(self.inputs):
+            line_edit.setFixedWidth(self.table.columnWidth(col_idx))
+
+    def filters(self):
+        return {column: line_edit.text().strip() for column, line_edit in zip(self.columns, self.inputs)
+                if line_edit.text().strip()}
+
+class DateWindowBar(QWidget):
+    """Says which dates a record list covers, with a button that extends it to all history."""
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.label = QLabel()
+        self.btn_all_history = QPushButton("عرض كل السجلات")
+        self.btn_all_history.clicked.connect(self.load_all_history)
+        layout.addWidget(self.label)
+        layout.addStretch()
+        layout.addWidget(self.btn_all_history)
+        store.history_changed.connect(self.update_text)
+        self.update_text()
+
+    def load_all_history(self):
+        self.store.load_all_history()
+        self.update_text()
+
+    def update_text(self):
+        since = self.store.since
+        self.btn_all_history.setVisible(since is not None)
+        self.btn_all_history.setEnabled(not self.store.is_loading_history())
+        if since is None:
+            self.label.setText("يعرض جميع السجلات.")
+        elif self.store.is_loading_history():
+            self.label.setText(f"جاري تحميل السجلات الأقدم... (حتى الآن منذ {since.isoformat()})")
+        else:
+            self.label.setText(f"يعرض السجلات منذ {since.isoformat()} (آخر {self.store.window_months} شهر).")
+
+class RecordPager(QObject):
+    """
+    Shows records in a table page by page as fetch_page returns them, in the
+    order picked by clicking a column header (RECORD_SORT_COLUMNS only) and
+    narrowed by a RecordFilterRow; further pages load as the table is
+    scrolled to the bottom. fetch_page(sort, descending, after, limit,
+    filters, record_ids) wraps db_ops.fetch_record_page with the caller's
+    own conditions. Column 0 of the table is the record id. query_changed
+    asks the owner to reload after the order changed.
+    """
+    failed = pyqtSignal(str)
+    query_changed = pyqtSignal()
+
+    def __init__(self, table, columns, filter_row, fetch_page, set_row, parent=None):
+        super().__init__(parent)
+        self.table = table
+        self.columns = columns
+        self.filter_row = filter_row
+        self.fetch_page = fetch_page
+        self.set_row = set_row
+        self.sort = 'id'
+        self.descending = True
+        self.after = None
+        self.has_more = False
+        header = table.horizontalHeader()
+        header.setSectionsClickable(True)
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(0, self.sort_order())
+        header.sectionClicked.connect(self.on_header_clicked)
+        table.verticalScrollBar().valueChanged.connect(self.on_scroll)
+
+    def sort_order(self):
+        return Qt.DescendingOrder if self.descending else Qt.AscendingOrder
+
+    def is_default(self):
+        """True for the plain newest-first order with no column filters."""
+        return self.sort == 'id' and self.descending and not self.filter_row.filters()
+
+    def on_header_clicked(self, col_idx):
+        column = self.columns[col_idx]
+        if column in db_ops.RECORD_SORT_COLUMNS:
+            if column == self.sort:
+                self.descending = not self.descending
+            else:
+                self.sort, self.descending = column, column in ('id', 'date')
+            self.query_changed.emit()
+        self.table.horizontalHeader().setSortIndicator(self.columns.index(self.sort), self.sort_order())
+
+    def reset(self):
+        """Drops the loaded rows and shows the first page of the current order and filters."""
+        self.table.setRowCount(0)
+        self.after = None
+        self.has_more = True
+        self.load_more()
+
+    def show_all(self, rows):
+        """Shows rows the owner already holds in full (no paging)."""
+        self.has_more = False
+        self.after = None
+        self.table.setRowCount(len(rows))
+        for row_idx, row in enumerate(rows):
+            self.set_row(row_idx, row)
+
+    def on_scroll(self, value):
+        if self.has_more and value == self.table.verticalScrollBar().maximum():
+            self.load_more()
+
+    def load_more(self):
+        if not self.has_more:
+            return
+        try:
+            rows = self.fetch_page(self.sort, self.descending, self.after, db_ops.RECORD_PAGE_SIZE,
+                                   self.filter_row.filters(), None)
+        except Exception as e:
+            self.has_more = False
+            self.failed.emit(str(e))
+            return
+        self.has_more = len(rows) == db_ops.RECORD_PAGE_SIZE
+        start = self.table.rowCount()
+        self.table.setRowCount(start + len(rows))
+        for offset, row in enumerate(rows):
+            self.set_row(start + offset, row)
+        if rows:
+            self.after = (rows[-1][self.sort], rows[-1]['id'])
+
+    def refresh(self, record_ids):
+        """
+        Re-checks changed records against the current order and filters:
+        shown rows are updated or removed. New matches are inserted only in
+        the default newest-first order, where their place is known; in other
+        orders they appear on the next reset.
+        """
+        try:
+            rows = self.fetch_page(self.sort, self.descending, None, None, self.filter_row.filters(), list(record_ids))
+        except Exception:
+            return
+        if self.sort == 'id' and self.descending:
+            oldest_shown = self.after[1] if self.after and self.has_more else 0
+            shown = [row for row in rows if row['id'] > oldest_shown]
+            apply_record_delta(self.table, record_ids, shown, self.set_row)
+            return
+        record_ids = set(record_ids)
+        rows_by_id = {row['id']: row for row in rows}
+        for row_idx in reversed(range(self.table.rowCount())):
+            rec_id = int(self.table.item(row_idx, 0).text())
+            if rec_id not in record_ids:
+                continue
+            if rec_id in rows_by_id:
+                self.set_row(row_idx, rows_by_id[rec_id])
+            else:
+                self.table.removeRow(row_idx)
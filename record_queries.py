@@ -1,53 +1,387 @@
 # /database/record_queries.py
 
 import os
+from datetime import date, timedelta
 from .connection import get_cursor
-from .utility_queries import log_activity # Import from our new utility module
+from .utility_queries import log_activity, resolve_department_id # Import from our new utility module
+from .storage_queries import file_sha256, remove_stored_file
+from .version_queries import VERSIONED_FIELDS, fields_from_data, record_version
+from .lookup_queries import LOOKUP_TABLES, resolve_lookup, find_similar_lookup_values
+from .attachment_index import ATTACHMENT_TEXT_MATCH_SQL
+from .record_archive import archive_reached, fetch_archived_record, get_oldest_archived_date, unarchive_record
+
+SEARCHABLE_FIELDS = ('type', 'device', 'technician', 'procedures', 'materials', 'notes', 'warnings', 'department')
+FUZZY_FIELDS = ('device', 'technician', 'type')
+FUZZY_RESULT_LIMIT = 200
+
+# The long free-text fields live in maintenance_text (1:1 with maintenance,
+# keyed by maintenance_id), so scans, counts and GROUP BYs over maintenance
+# read narrow rows. The functions below hide the split from their callers.
+TEXT_FIELDS = ('procedures', 'materials', 'notes', 'warnings')
+HOT_FIELDS = tuple(f for f in VERSIONED_FIELDS if f not in TEXT_FIELDS)
+TEXT_COPY_BATCH_ROWS = 2000
+# The department is stored as department_id; its name comes from the join.
+RECORD_FROM = ("maintenance LEFT JOIN maintenance_text ON maintenance_text.maintenance_id = maintenance.id"
+               " LEFT JOIN departments ON departments.id = maintenance.department_id")
+# Archived records keep the text fields inline (see record_archive); aliased
+# so the same conditions apply to both.
+ARCHIVE_RECORD_FROM = "maintenance_archive AS maintenance LEFT JOIN departments ON departments.id = maintenance.department_id"
+_FIELD_SQL = {'department': 'departments.name'}
+
+def _field_sql(field):
+    return _FIELD_SQL.get(field, field)
+
+def _select_records(cur, columns, where, params, date_from, order, limit=None, column_params=()):
+    """
+    Runs SELECT columns over the active records matching where (conditions
+    on the RECORD_FROM names, each starting with AND), ordered by order
+    ([(output column, 'ASC' or 'DESC')]). When date_from (None = all)
+    reaches the archive, the archive gets the same conditions, order and
+    limit as a second UNION arm, so each arm reads only its matching rows.
+    """
+    limit_sql, limit_params = (" LIMIT %s", [limit]) if limit is not None else ("", [])
+    arm_order = " ORDER BY " + ", ".join(f"{'maintenance.' + column if column in RECORD_SORT_COLUMNS else column} {direction}"
+                                         for column, direction in order)
+    hot = f"SELECT {columns} FROM {RECORD_FROM} WHERE maintenance.is_deleted = 0{where}"
+    if not archive_reached(cur, date_from):
+        cur.execute(hot + arm_order + limit_sql, [*column_params, *params, *limit_params])
+        return cur.fetchall()
+    archived = f"SELECT {columns} FROM {ARCHIVE_RECORD_FROM} WHERE TRUE{where}"
+    if limit is None:
+        sql = f"{hot} UNION ALL {archived}"
+    else:
+        sql = f"({hot}{arm_order}{limit_sql}) UNION ALL ({archived}{arm_order}{limit_sql})"
+    sql += " ORDER BY " + ", ".join(f"{column} {direction}" for column, direction in order) + limit_sql
+    arm_params = [*column_params, *params, *limit_params]
+    cur.execute(sql, [*arm_params, *arm_params, *limit_params])
+    return cur.fetchall()
+
+# List views get the short columns plus an excerpt of each long text field
+# (one character longer than LIST_EXCERPT_LENGTH, so the view can tell it was
+# cut); the full text is fetched by id with fetch_record_details when a record
+# is opened.
+LIST_EXCERPT_LENGTH = 50
+LIST_TEXT_FIELDS = TEXT_FIELDS
+RECORD_LIST_COLUMNS = "maintenance.id, date, type, device, technician, departments.name AS department, " + ", ".join(
+    f"LEFT({field}, {LIST_EXCERPT_LENGTH + 1}) AS {field}" for field in LIST_TEXT_FIELDS)
+
+def is_excerpt_truncated(value):
+    return value is not None and len(value) > LIST_EXCERPT_LENGTH
+
+def _record_ids_clause(record_ids, params):
+    """Restricts a query to record_ids (used to re-fetch only the rows the change feed reported)."""
+    if record_ids is None:
+        return ""
+    if not record_ids:
+        return " AND FALSE"
+    params.extend(record_ids)
+    return f" AND maintenance.id IN ({', '.join(['%s'] * len(record_ids))})"
+
+def _date_range_clause(date_from, date_before, params):
+    """Limits a query to records dated on or after date_from and before date_before (either may be None)."""
+    sql = ""
+    if date_from:
+        sql += " AND maintenance.date >= %s"
+        params.append(date_from)
+    if date_before:
+        sql += " AND maintenance.date < %s"
+        params.append(date_before)
+    return sql
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _keyword_clause(keyword, include_attachments, params):
+    """The search_all_fields condition: keyword in any text field, or in the indexed attachment text."""
+    if not keyword:
+        return ""
+    conditions = [f"{_field_sql(field)} LIKE %s" for field in SEARCHABLE_FIELDS]
+    params.extend([f"%{keyword}%"] * len(SEARCHABLE_FIELDS))
+    if include_attachments:
+        conditions.append(f"maintenance.id IN ({ATTACHMENT_TEXT_MATCH_SQL})")
+        params.append(keyword)
+    return " AND (" + " OR ".join(conditions) + ")"
+
+# Record grids sort and filter on the server and load a page at a time
+# (fetch_record_page). Sorting is limited to columns with an
+# (is_deleted, column) index, so the first page of any order is read from
+# the index. Filters on short columns match by prefix so they can use the
+# same indexes; the long text fields match anywhere.
+RECORD_PAGE_SIZE = 100
+RECORD_SORT_COLUMNS = ('id', 'date', 'type', 'device', 'technician')
+RECORD_FILTER_COLUMNS = ('id', 'date', 'type', 'device', 'technician', 'procedures', 'materials', 'notes', 'warnings', 'department')
+
+def _date_prefix_range(text):
+    """'2024', '2024-05' or '2024-05-17' as a [start, end) range of dates."""
+    try:
+        parts = [int(part) for part in text.split('-')]
+        if len(parts) == 1:
+            return date(parts[0], 1, 1), date(parts[0] + 1, 1, 1)
+        if len(parts) == 2:
+            return date(parts[0], parts[1], 1), date(parts[0] + parts[1] // 12, parts[1] % 12 + 1, 1)
+        if len(parts) == 3:
+            start = date(*parts)
+            return start, start + timedelta(days=1)
+    except ValueError:
+        pass
+    raise ValueError(f"تاريخ غير صالح: '{text}'. استخدم السنة أو السنة-الشهر أو السنة-الشهر-اليوم.")
+
+def _filters_clause(filters, params):
+    sql = ""
+    for column, text in (filters or {}).items():
+        text = str(text).strip()
+        if not text:
+            continue
+        if column == 'id':
+            if not text.isdigit():
+                raise ValueError(f"رقم السجل غير صالح: '{text}'.")
+            sql += " AND maintenance.id = %s"
+            params.append(int(text))
+        elif column == 'date':
+            sql += " AND maintenance.date >= %s AND maintenance.date < %s"
+            params.extend(_date_prefix_range(text))
+        elif column in TEXT_FIELDS:
+            sql += f" AND {column} LIKE %s"
+            params.append(f"%{_like_escape(text)}%")
+        elif column in RECORD_FILTER_COLUMNS:
+            sql += f" AND {_field_sql(column) if column == 'department' else 'maintenance.' + column} LIKE %s"
+            params.append(f"{_like_escape(text)}%")
+    return sql
+
+def _after_clause(sort_sql, descending, after, params):
+    """Keyset condition for the rows after (sort value, id), NULLs sorting first ascending and last descending."""
+    value, last_id = after
+    cmp = '<' if descending else '>'
+    if sort_sql == 'maintenance.id':
+        params.append(last_id)
+        return f" AND maintenance.id {cmp} %s"
+    if value is None:
+        params.append(last_id)
+        if descending:
+            return f" AND {sort_sql} IS NULL AND maintenance.id < %s"
+        return f" AND (({sort_sql} IS NULL AND maintenance.id > %s) OR {sort_sql} IS NOT NULL)"
+    params.extend([value, value, last_id])
+    sql = f"{sort_sql} {cmp} %s OR ({sort_sql} = %s AND maintenance.id {cmp} %s)"
+    if descending:
+        sql += f" OR {sort_sql} IS NULL"
+    return f" AND ({sql})"
+
+def fetch_record_page(department=None, filters=None, sort='id', descending=True, after=None, limit=RECORD_PAGE_SIZE,
+                      keyword=None, include_attachments=False, record_ids=None, date_from=None):
+    """
+    Fetches one page of the list columns of active records for the record
+    grids: filtered per column ({column: text}, see RECORD_FILTER_COLUMNS),
+    ordered by sort (one of RECORD_SORT_COLUMNS, then id) and, with keyword,
+    limited to what search_all_fields would find; date_from limits it to a
+    recent window. Pass (sort value, id) of the last row shown as after to
+    get the next page. Raises ValueError for a filter that cannot be applied.
+    """
+    if sort not in RECORD_SORT_COLUMNS:
+        raise ValueError(f"Cannot sort records by {sort}")
+    sort_sql = f"maintenance.{sort}"
+    direction = "DESC" if descending else "ASC"
+    sql = ""
+    params = []
+    if department:
+        sql += " AND departments.name = %s"
+        params.append(department)
+    sql += _date_range_clause(date_from, None, params)
+    sql += _filters_clause(filters, params)
+    sql += _keyword_clause(keyword, include_attachments, params)
+    sql += _record_ids_clause(record_ids, params)
+    if after is not None:
+        sql += _after_clause(sort_sql, descending, after, params)
+    with get_cursor() as cur:
+        return _select_records(cur, RECORD_LIST_COLUMNS, sql, params, date_from, [(sort, direction), ('id', direction)], limit)
+
+def _resolve_record_lookups(cur, fields):
+    """Replaces type/device/technician with their canonical names and returns the matching *_id columns."""
+    lookup_ids = {}
+    for kind in LOOKUP_TABLES:
+        lookup_id, canonical = resolve_lookup(cur, kind, fields[kind])
+        if lookup_id is not None:
+            fields[kind] = canonical
+        lookup_ids[f"{kind}_id"] = lookup_id
+    return lookup_ids
+
+def _hot_columns(cur, fields):
+    """The maintenance columns for fields: lookup and department keys plus the remaining short fields."""
+    columns = _resolve_record_lookups(cur, fields)
+    columns.update((f, fields[f]) for f in HOT_FIELDS if f != 'department')
+    columns['department_id'] = resolve_department_id(cur, fields['department'])
+    return columns
 
 # --- CRUD maintenance ---
 def insert_record(data, user_id):
     """Inserts a new maintenance record."""
-    sql = "INSERT INTO maintenance (date, type, device, technician, procedures, materials, notes, warnings, department) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+    fields = fields_from_data(data)
     with get_cursor() as cur:
-        cur.execute(sql, data)
+        columns = _hot_columns(cur, fields)
+        cur.execute(f"INSERT INTO maintenance ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                    list(columns.values()))
         new_record_id = cur.lastrowid
-        log_activity(user_id, 'INSERT', 'maintenance', new_record_id, f"Added record for device: {data[2]}")
+        _save_record_text(cur, new_record_id, fields)
+        record_version(cur, new_record_id, user_id, None, fields)
+        log_activity(user_id, 'INSERT', 'maintenance', new_record_id, {'device': fields['device']})
         return new_record_id
 
-def fetch_records(department=None):
-    """Fetches active maintenance records, optionally filtered by department."""
-    sql = "SELECT * FROM maintenance WHERE is_deleted = 0"
+def fetch_records(department=None, record_ids=None, date_from=None, date_before=None):
+    """
+    Fetches the list columns of active records, optionally filtered by
+    department, to record_ids and/or to dates in [date_from, date_before).
+    """
+    sql = ""
+    params = []
+    if department:
+        sql += " AND departments.name = %s"
+        params.append(department)
+    sql += _date_range_clause(date_from, date_before, params)
+    sql += _record_ids_clause(record_ids, params)
+    with get_cursor() as cur:
+        return _select_records(cur, RECORD_LIST_COLUMNS, sql, params, date_from, [('id', 'DESC')])
+
+def get_oldest_record_date(department=None):
+    """Date of the oldest active or archived record (None if there are none), to know how far back history goes."""
+    sql = f"SELECT MIN(maintenance.date) AS oldest FROM {RECORD_FROM} WHERE maintenance.is_deleted = 0"
     params = []
     if department:
-        sql += " AND department = %s"
+        sql += " AND departments.name = %s"
         params.append(department)
-    sql += " ORDER BY id DESC"
     with get_cursor() as cur:
         cur.execute(sql, params)
-        return cur.fetchall()
+        dates = [cur.fetchone()['oldest'], get_oldest_archived_date(cur, department)]
+    dates = [d for d in dates if d is not None]
+    return min(dates) if dates else None
+
+def search_all_fields(keyword, department=None, record_ids=None, include_attachments=False, date_from=None):
+    """
+    Fetches the list columns of active records with keyword in any text field
+    (all records for an empty keyword), or, with include_attachments, in the
+    indexed text of one of their attachments. date_from limits the search to
+    records dated on or after it.
+    """
+    params = []
+    sql = _keyword_clause(keyword, include_attachments, params)
+    sql += _date_range_clause(date_from, None, params)
+    if department:
+        sql += " AND departments.name = %s"
+        params.append(department)
+    sql += _record_ids_clause(record_ids, params)
+    with get_cursor() as cur:
+        return _select_records(cur, RECORD_LIST_COLUMNS, sql, params, date_from, [('id', 'DESC')])
+
+def fuzzy_search_records(text, department=None, record_ids=None, limit=FUZZY_RESULT_LIMIT, date_from=None):
+    """
+    Fetches the list columns of active records whose device, technician or
+    type looks like text (typos and spelling variants included), best match
+    first, with the match score in 'similarity'. Works on the lookup keys,
+    so records the lookup backfill has not reached yet are not found.
+    """
+    with get_cursor() as cur:
+        similar = {kind: find_similar_lookup_values(cur, kind, text) for kind in FUZZY_FIELDS}
+        scores, score_params, conditions, params = [], [], [], []
+        for kind, values in similar.items():
+            if values:
+                scores.append(f"CASE maintenance.{kind}_id" + " WHEN %s THEN %s" * len(values) + " ELSE 0 END")
+                score_params.extend(item for pair in values.items() for item in pair)
+                conditions.append(f"maintenance.{kind}_id IN ({', '.join(['%s'] * len(values))})")
+        if not conditions:
+            return []
+        for values in similar.values():
+            params.extend(values)
+        similarity = scores[0] if len(scores) == 1 else f"GREATEST({', '.join(scores)})"
+        sql = f" AND ({' OR '.join(conditions)})"
+        if department:
+            sql += " AND departments.name = %s"
+            params.append(department)
+        sql += _date_range_clause(date_from, None, params)
+        sql += _record_ids_clause(record_ids, params)
+        return _select_records(cur, f"{RECORD_LIST_COLUMNS}, {similarity} AS similarity", sql, params, date_from,
+                               [('similarity', 'DESC'), ('id', 'DESC')], limit, column_params=score_params)
+
+def search_records_advanced(filters):
+    """Performs an advanced search for maintenance records (list columns only)."""
+    base_sql = ""
+    params = []
+    date_from = None
+    
+    if filters.get('date_from') and filters.get('date_to'):
+        date_from = filters['date_from']
+        base_sql += " AND date BETWEEN %s AND %s"
+        params.extend([filters['date_from'], filters['date_to']])
+
+    if filters.get('department'):
+        base_sql += " AND departments.name = %s"
+        params.append(filters['department'])
+
+    if filters.get('keyword'):
+        kw = f"%{filters['keyword']}%"
+        keyword_sql = "device LIKE %s OR procedures LIKE %s OR materials LIKE %s OR notes LIKE %s OR warnings LIKE %s"
+        params.extend([kw] * 5)
+        if filters.get('include_attachments'):
+            keyword_sql += f" OR maintenance.id IN ({ATTACHMENT_TEXT_MATCH_SQL})"
+            params.append(filters['keyword'])
+        base_sql += f" AND ({keyword_sql})"
+
+    with get_cursor() as cur:
+        return _select_records(cur, RECORD_LIST_COLUMNS, base_sql, params, date_from, [('id', 'DESC')])
+
+def fetch_record_details(rec_id):
+    """Fetches every column of one maintenance record (full text included), archived or not, or None."""
+    with get_cursor() as cur:
+        cur.execute(f"SELECT maintenance.*, {', '.join(TEXT_FIELDS)}, departments.name AS department"
+                    f" FROM {RECORD_FROM} WHERE maintenance.id = %s", (rec_id,))
+        return cur.fetchone() or fetch_archived_record(cur, rec_id)
+
+def _save_record_text(cur, rec_id, fields):
+    columns = ", ".join(TEXT_FIELDS)
+    updates = ", ".join(f"{f} = VALUES({f})" for f in TEXT_FIELDS)
+    cur.execute(f"""
+        INSERT INTO maintenance_text (maintenance_id, {columns}) VALUES (%s, {', '.join(['%s'] * len(TEXT_FIELDS))})
+        ON DUPLICATE KEY UPDATE {updates}
+    """, [rec_id] + [fields[f] for f in TEXT_FIELDS])
 
 def update_record(rec_id, data, user_id):
-    """Updates an existing maintenance record."""
-    sql = "UPDATE maintenance SET date=%s, type=%s, device=%s, technician=%s, procedures=%s, materials=%s, notes=%s, warnings=%s, department=%s WHERE id=%s"
+    """Updates an existing maintenance record and records the changed fields as a new version."""
+    fields = fields_from_data(data)
+    select_sql = (f"SELECT {', '.join(f'{_field_sql(f)} AS {f}' for f in VERSIONED_FIELDS)} FROM {RECORD_FROM}"
+                  " WHERE maintenance.id=%s FOR UPDATE OF maintenance, maintenance_text")
     with get_cursor() as cur:
-        cur.execute(sql, (*data, rec_id))
-        if cur.rowcount > 0:
-            log_activity(user_id, 'UPDATE', 'maintenance', rec_id, f"Updated record for device: {data[2]}")
+        # Lock the row so concurrent edits get consecutive versions.
+        cur.execute(select_sql, (rec_id,))
+        old_row = cur.fetchone()
+        if not old_row and unarchive_record(cur, rec_id):
+            cur.execute(select_sql, (rec_id,))
+            old_row = cur.fetchone()
+        if not old_row:
+            return
+        old_fields = fields_from_data([old_row[field] for field in VERSIONED_FIELDS])
+        columns = _hot_columns(cur, fields)
+        if any(old_fields[f] != fields[f] for f in HOT_FIELDS):
+            cur.execute(f"UPDATE maintenance SET {', '.join(f'{c}=%s' for c in columns)} WHERE id=%s",
+                        list(columns.values()) + [rec_id])
+        if any(old_fields[f] != fields[f] for f in TEXT_FIELDS):
+            _save_record_text(cur, rec_id, fields)
+        version, changed = record_version(cur, rec_id, user_id, old_fields, fields)
+        if changed:
+            log_activity(user_id, 'UPDATE', 'maintenance', rec_id, {'device': fields['device'], 'fields': changed, 'version': version})
 
 def delete_record(rec_id, user_id):
     """Soft-deletes a maintenance record by setting is_deleted = 1."""
     sql = "UPDATE maintenance SET is_deleted = 1 WHERE id = %s"
     with get_cursor() as cur:
+        unarchive_record(cur, rec_id) # A no-op unless the record was archived.
         cur.execute(sql, (rec_id,))
         if cur.rowcount > 0:
-            log_activity(user_id, 'TRASH', 'maintenance', rec_id, f"Moved record to trash ID: {rec_id}")
+            log_activity(user_id, 'TRASH', 'maintenance', rec_id)
 
 # --- TRASH MANAGEMENT (Maintenance Records) ---
-def fetch_deleted_records():
-    """Fetches all soft-deleted maintenance records."""
-    sql = "SELECT * FROM maintenance WHERE is_deleted = 1 ORDER BY id DESC"
+def fetch_deleted_records(record_ids=None):
+    """Fetches all soft-deleted maintenance records, or only those among record_ids."""
+    params = []
+    sql = f"SELECT {RECORD_LIST_COLUMNS} FROM {RECORD_FROM} WHERE maintenance.is_deleted = 1" + _record_ids_clause(record_ids, params) + " ORDER BY maintenance.id DESC"
     with get_cursor() as cur:
-        cur.execute(sql)
+        cur.execute(sql, params)
         return cur.fetchall()
 
 def restore_record(rec_id, user_id):
@@ -56,27 +390,36 @@ def restore_record(rec_id, user_id):
     with get_cursor() as cur:
         cur.execute(sql, (rec_id,))
         if cur.rowcount > 0:
-            log_activity(user_id, 'RESTORE', 'maintenance', rec_id, f"Restored record from trash ID: {rec_id}")
+            log_activity(user_id, 'RESTORE', 'maintenance', rec_id)
 
 def permanently_delete_record(rec_id, user_id):
     """Permanently deletes a maintenance record and its attachments."""
     with get_cursor() as cur:
+        cur.execute("SELECT stored_filepath FROM attachments WHERE maintenance_id=%s", (rec_id,))
+        stored_paths = [row['stored_filepath'] for row in cur.fetchall()]
         # First, delete associated attachments to prevent orphaned files
         cur.execute("DELETE FROM attachments WHERE maintenance_id=%s", (rec_id,))
-        # Then, delete the record itself
+        # Then, delete the record itself (its maintenance_text row goes with it, ON DELETE CASCADE)
         cur.execute("DELETE FROM maintenance WHERE id=%s AND is_deleted = 1", (rec_id,))
-        if cur.rowcount > 0:
-            log_activity(user_id, 'DELETE', 'maintenance', rec_id, f"Permanently deleted record ID: {rec_id}")
+        deleted = cur.rowcount > 0
+        if deleted:
+            cur.execute("DELETE FROM maintenance_versions WHERE maintenance_id=%s", (rec_id,))
+            log_activity(user_id, 'DELETE', 'maintenance', rec_id)
+    # Files are removed only after the transaction has committed.
+    if deleted:
+        for path in stored_paths:
+            remove_stored_file(path)
 
 
 # --- ATTACHMENT MANAGEMENT ---
 def add_attachment(maintenance_id, original_filename, stored_filepath, user_id):
-    """Adds an attachment record to the database."""
-    sql = "INSERT INTO attachments (maintenance_id, original_filename, stored_filepath) VALUES (%s, %s, %s)"
+    """Adds an attachment record to the database, with the checksum of the stored file."""
+    sha256 = file_sha256(stored_filepath)
+    sql = "INSERT INTO attachments (maintenance_id, original_filename, stored_filepath, sha256) VALUES (%s, %s, %s, %s)"
     with get_cursor() as cur:
-        cur.execute(sql, (maintenance_id, original_filename, stored_filepath))
+        cur.execute(sql, (maintenance_id, original_filename, stored_filepath, sha256))
         new_attachment_id = cur.lastrowid
-        log_activity(user_id, 'INSERT', 'attachment', new_attachment_id, f"Added attachment '{original_filename}' to record {maintenance_id}")
+        log_activity(user_id, 'INSERT', 'attachment', new_attachment_id, {'filename': original_filename, 'maintenance_id': maintenance_id})
         return new_attachment_id
 
 def get_attachments_for_record(maintenance_id):
@@ -94,14 +437,51 @@ def delete_attachment(attachment_id, user_id):
             attachment = cur.fetchone()
             if not attachment: return False, "Attachment not found."
 
-            if os.path.exists(attachment['stored_filepath']):
-                os.remove(attachment['stored_filepath'])
+            remove_stored_file(attachment['stored_filepath'])
 
             cur.execute("DELETE FROM attachments WHERE id = %s", (attachment_id,))
             if cur.rowcount > 0:
-                log_activity(user_id, 'DELETE', 'attachment', attachment_id, f"Removed attachment '{attachment['original_filename']}' from record {attachment['maintenance_id']}")
+                log_activity(user_id, 'DELETE', 'attachment', attachment_id, {'filename': attachment['original_filename'], 'maintenance_id': attachment['maintenance_id']})
                 return True, "Attachment deleted successfully."
             else:
                 return False, "Failed to delete attachment record from database."
     except Exception as e:
-        return False, f"An error occurred: {str(e)}"
\ No newline at end of file
+        return False, f"An error occurred: {str(e)}"
+
+# --- MIGRATION STEP ---
+def split_maintenance_text(cur):
+    """
+    Migration step: creates maintenance_text with the same column types as the
+    text fields in maintenance and copies them over TEXT_COPY_BATCH_ROWS rows
+    per transaction. Idempotent, so an interrupted run is simply repeated; the
+    migration drops the old columns afterwards.
+    """
+    cur.execute("""
+        SELECT COLUMN_NAME AS name, COLUMN_TYPE AS type FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'maintenance'
+    """)
+    types = {row['name']: row['type'] for row in cur.fetchall()}
+    columns = ", ".join(f"{field} {types.get(field, 'TEXT')} NULL" for field in TEXT_FIELDS)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS maintenance_text (
+            maintenance_id {types['id']} NOT NULL PRIMARY KEY,
+            {columns},
+            CONSTRAINT fk_maintenance_text FOREIGN KEY (maintenance_id) REFERENCES maintenance (id) ON DELETE CASCADE
+        )
+    """)
+    field_list = ", ".join(TEXT_FIELDS)
+    updates = ", ".join(f"{f} = VALUES({f})" for f in TEXT_FIELDS)
+    last_id = 0
+    while True:
+        with get_cursor() as batch_cur:
+            batch_cur.execute("SELECT MAX(id) AS upto FROM (SELECT id FROM maintenance WHERE id > %s ORDER BY id LIMIT %s) AS batch",
+                              (last_id, TEXT_COPY_BATCH_ROWS))
+            upto = batch_cur.fetchone()['upto']
+            if upto is None:
+                return
+            batch_cur.execute(f"""
+                INSERT INTO maintenance_text (maintenance_id, {field_list})
+                SELECT id, {field_list} FROM maintenance WHERE id > %s AND id <= %s
+                ON DUPLICATE KEY UPDATE {updates}
+            """, (last_id, upto))
+            last_id = upto
\ No newline at end of file
@@ -0,0 +1,226 @@
+# record_sync.py
+from PyQt5.QtCore import QObject, QTimer, QDate, QSettings, pyqtSignal
+import db_ops
+
+def default_window_months():
+    """How many recent months record lists and searches show by default (set in SettingsWindow)."""
+    return QSettings("MyCompany", "MaintenanceApp").value("default_date_range_months", 12, type=int)
+
+class RecordChangePoller(QObject):
+    """
+    Polls the maintenance change feed. records_changed carries the ids changed
+    by any client since the last poll; resync_needed means the poller fell
+    too far behind and its subscribers must reload in full.
+    """
+    records_changed = pyqtSignal(list)
+    resync_needed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.settings = db_ops.load_change_feed_settings()
+        self.token = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.poll)
+
+    def start(self):
+        """Takes the sync token; call it before the first load that relies on the feed."""
+        if self.token is not None:
+            return
+        try:
+            self.token = db_ops.get_change_token()
+        except Exception as e:
+            print(f"Change feed unavailable: {e}")
+            return
+        self.timer.start(int(self.settings['poll_interval_sec'] * 1000))
+
+    def poll(self):
+        try:
+            self.token, record_ids = db_ops.fetch_changed_record_ids(self.token)
+        except Exception:
+            return # The database may be briefly unreachable; try again next tick.
+        if record_ids is None:
+            self.resync_needed.emit()
+        elif record_ids:
+            self.records_changed.emit(record_ids)
+
+class RecordStore(QObject):
+    """
+    The active maintenance records visible to this session, loaded once and
+    shared by every open window. Writes go through the store, which then
+    re-fetches the written row from the database into every store (the server
+    rewrites lookup values to their canonical names) and emits
+    records_changed(ids) so each view patches its rows; changes made on other
+    machines arrive the same way from the change feed. records_reset means the whole set was reloaded.
+
+    Only records dated on or after since are held (the default window from
+    the settings); load_all_history moves since back a window at a time,
+    emitting history_changed after each step, until it is None (everything).
+    """
+    records_changed = pyqtSignal(list)
+    records_reset = pyqtSignal()
+    history_changed = pyqtSignal()
+
+    def __init__(self, department=None):
+        super().__init__()
+        self.department = department
+        self.rows = None # {id: row}, loaded on first use
+        self.window_months = default_window_months()
+        self.since = QDate.currentDate().addMonths(-self.window_months).toPyDate()
+        self.oldest_date = None
+        self.history_timer = QTimer(self)
+        self.history_timer.setSingleShot(True)
+        self.history_timer.timeout.connect(self.load_older_step)
+        poller = shared_change_poller()
+        poller.records_changed.connect(self.refresh)
+        poller.resync_needed.connect(self.reload)
+
+    def watch(self):
+        """
+        Follows the change feed without loading the records, for views that
+        page from the server: until the store is loaded, records_changed
+        passes the changed ids on unfetched and the views re-check them.
+        """
+        shared_change_poller().start()
+
+    def ensure_loaded(self):
+        if self.rows is None:
+            shared_change_poller().start()
+            self.rows = {row['id']: row for row in db_ops.fetch_records(department=self.department, date_from=self.since)}
+
+    def records(self):
+        """All records, newest id first."""
+        self.ensure_loaded()
+        return [self.rows[rec_id] for rec_id in sorted(self.rows, reverse=True)]
+
+    def get(self, rec_id):
+        self.ensure_loaded()
+        return self.rows.get(rec_id)
+
+    def reload(self):
+        """Full reload from the database; only on explicit request or when the feed has lost track."""
+        loaded = self.rows is not None
+        self.rows = None
+        if loaded:
+            self.ensure_loaded()
+        self.records_reset.emit()
+
+    def refresh(self, record_ids):
+        """Re-fetches record_ids (changed elsewhere) and notifies the views."""
+        if self.rows is None:
+            self.records_changed.emit(list(record_ids))
+            return
+        fetched = {row['id']: row for row in db_ops.fetch_records(department=self.department, record_ids=record_ids,
+                                                                  date_from=self.since)}
+        for rec_id in record_ids:
+            if rec_id in fetched:
+                self.rows[rec_id] = fetched[rec_id]
+            else:
+                self.rows.pop(rec_id, None)
+        self.records_changed.emit(list(record_ids))
+
+    def is_loading_history(self):
+        return self.history_timer.isActive() or self.oldest_date is not None
+
+    def load_all_history(self):
+        """Starts extending the store back to the oldest record; views fill in step by step."""
+        if self.since is None or self.is_loading_history():
+            return
+        if self.rows is None: # Only paging views: they drop the date limit, nothing is held here.
+            self.since = None
+            self.history_changed.emit()
+            return
+        self.oldest_date = db_ops.get_oldest_record_date(self.department)
+        if self.oldest_date is None:
+            self.since = None
+            self.history_changed.emit()
+            return
+        self.history_timer.start(0)
+
+    def load_older_step(self):
+        """Loads the next older window (one step of load_all_history)."""
+        if self.since is None or self.rows is None:
+            self.oldest_date = None
+            return
+        new_since = QDate(self.since).addMonths(-self.window_months).toPyDate()
+        if new_since <= self.oldest_date:
+            new_since = None
+        older = db_ops.fetch_records(department=self.department, date_from=new_since, date_before=self.since)
+        self.rows.update((row['id'], row) for row in older)
+        self.since = new_since
+        if self.since is None:
+            self.oldest_date = None
+        else:
+            self.history_timer.start(0)
+        self.records_reset.emit()
+        self.history_changed.emit()
+
+    def add_record(self, data, user_id):
+        self.ensure_loaded()
+        new_record_id = db_ops.insert_record(data, user_id)
+        if new_record_id:
+            notify_records_changed([new_record_id])
+        return new_record_id
+
+    def update_record(self, rec_id, data, user_id):
+        self.ensure_loaded()
+        db_ops.update_record(rec_id, data, user_id)
+        notify_records_changed([rec_id])
+
+    def trash_record(self, rec_id, user_id):
+        self.ensure_loaded()
+        db_ops.delete_record(rec_id, user_id)
+        notify_records_changed([rec_id])
+
+_shared_poller = None
+_stores = {}
+
+def shared_change_poller():
+    """The one change-feed poller of this process."""
+    global _shared_poller
+    if _shared_poller is None:
+        _shared_poller = RecordChangePoller()
+    return _shared_poller
+
+def get_record_store(department=None):
+    """The shared store for a department (None = all departments)."""
+    if department not in _stores:
+        _stores[department] = RecordStore(department)
+    return _stores[department]
+
+def notify_records_changed(record_ids):
+    """Tells every loaded store about a write made outside it (e.g. a restore from the trash)."""
+    for store in _stores.values():
+        store.refresh(record_ids)
+
+def list_cell_text(value):
+    """Display text of a list cell; list queries return text fields as excerpts."""
+    text = str(value) if value else ""
+    if db_ops.is_excerpt_truncated(text):
+        text = text[:db_ops.LIST_EXCERPT_LENGTH] + "..."
+    return text
+
+def apply_record_delta(table, record_ids, rows, set_row):
+    """
+    Brings a table whose column 0 is the record id (ordered by id descending)
+    up to date for record_ids: rows holds the ones that still belong in the
+    view; the rest are removed. set_row(row_idx, row) fills one table row.
+    """
+    rows_by_id = {row['id']: row for row in rows}
+    existing = {}
+    for row_idx in range(table.rowCount()):
+        item = table.item(row_idx, 0)
+        if item:
+            existing[int(item.text())] = row_idx
+    for rec_id in sorted(record_ids, key=lambda rid: existing.get(rid, -1), reverse=True):
+        if rec_id in existing and rec_id not in rows_by_id:
+            table.removeRow(existing[rec_id])
+    for rec_id in sorted(rows_by_id, reverse=True):
+        row_idx = 0
+        while row_idx < table.rowCount():
+            current_id = int(table.item(row_idx, 0).text())
+            if current_id <= rec_id:
+                break
+            row_idx += 1
+        if row_idx == table.rowCount() or int(table.item(row_idx, 0).text()) != rec_id:
+            table.insertRow(row_idx)
+        set_row(row_idx, rows_by_id[rec_id])
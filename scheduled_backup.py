@@ -0,0 +1,39 @@
+﻿# scheduled_backup.py
+import argparse
+import os
+import sys
+import db_ops
+
+# Command-line entry point for scheduled backups, for cron / Task Scheduler on
+# the database server. Uses the [backup] section of config.ini; run it at the
+# configured times, or every few minutes with --if-due.
+
+def main(argv=None):
+    settings = db_ops.load_backup_schedule_settings()
+    parser = argparse.ArgumentParser(description="Create a scheduled backup archive and prune old ones.")
+    parser.add_argument("--backup-dir", default=settings['backup_dir'], help="Directory for scheduled archives")
+    parser.add_argument("--if-due", action="store_true", help="Only run if a schedule_times slot has passed since the last scheduled backup")
+    parser.add_argument("--full", action="store_true", help="Force a full archive instead of an incremental one")
+    parser.add_argument("--no-prune", action="store_true", help="Skip the retention policy")
+    parser.add_argument("--throttle", type=float, default=settings['throttle_mb_per_sec'], help="I/O limit in MB/s (0 = unlimited)")
+    args = parser.parse_args(argv)
+    settings.update(backup_dir=args.backup_dir, throttle_mb_per_sec=args.throttle)
+
+    if hasattr(os, 'nice'):
+        os.nice(10) # Yield CPU to interactive work on the same machine.
+
+    success, msg = db_ops.check_schema_version()
+    if not success:
+        print(msg)
+        return 1
+
+    if args.if_due and not db_ops.is_backup_due(settings, last_run=db_ops.last_scheduled_backup_time()):
+        print("No scheduled backup is due.")
+        return 0
+
+    success, msg = db_ops.run_scheduled_backup(settings, force_full=args.full, prune=not args.no_prune)
+    print(msg)
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,17 @@
 ﻿# search_ui.py
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem,
-    QMessageBox, QDialog, QTextEdit, QStatusBar, QHBoxLayout
+    QMessageBox, QDialog, QTextEdit, QStatusBar, QHBoxLayout, QCheckBox
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 import db_ops
 import utils
+from record_sync import get_record_store, list_cell_text
+from record_grid import RecordFilterRow, RecordPager, DateWindowBar
 
-class SearchWindow(QWidget):
-    MAX_CELL_TEXT_LENGTH = 50
+RESULT_COLUMNS = ["id", "date", "type", "device", "technician", "procedures", "materials", "notes", "warnings", "department", "attachments"]
 
+class SearchWindow(QWidget):
     def __init__(self, user_role="user", user_department=None):
         super().__init__()
         self.setWindowTitle("بحث شامل في السجلات")
@@ -26,6 +28,12 @@ class SearchWindow(QWidget):
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("اكتب هنا للبحث في جميع الحقول...")
         search_layout.addWidget(self.search_input)
+        self.fuzzy_check = QCheckBox("بحث تقريبي")
+        self.fuzzy_check.setToolTip("يجد الجهاز أو الفني أو النوع رغم الأخطاء الإملائية، مرتباً حسب التشابه")
+        search_layout.addWidget(self.fuzzy_check)
+        self.attachments_check = QCheckBox("البحث في المرفقات")
+        self.attachments_check.setToolTip("يبحث أيضاً في نصوص ملفات PDF والملفات النصية المرفقة")
+        search_layout.addWidget(self.attachments_check)
         
         btn_search = QPushButton("بحث")
         btn_search.clicked.connect(self.perform_search)
@@ -36,63 +44,126 @@ class SearchWindow(QWidget):
         # --- Results Table ---
         self.table = QTableWidget()
         self.table.verticalHeader().setVisible(False)
-        self.table.setColumnCount(10)
-        self.table.setHorizontalHeaderLabels(["ID", "التاريخ", "النوع", "الجهاز", "الفني", "الإجراءات", "المواد", "ملاحظات", "التحذيرات", "القسم"])
+        self.table.setColumnCount(11)
+        self.table.setHorizontalHeaderLabels(["ID", "التاريخ", "النوع", "الجهاز", "الفني", "الإجراءات", "المواد", "ملاحظات", "التحذيرات", "القسم", "مطابقة في المرفقات"])
         self.table.cellDoubleClicked.connect(self.show_full_details)
+        self.filter_row = RecordFilterRow(self.table, RESULT_COLUMNS)
+        self.pager = RecordPager(self.table, RESULT_COLUMNS, self.filter_row, self.fetch_result_page, self.set_result_row, self)
+        self.filter_row.filters_changed.connect(self.rerun_search)
+        self.pager.query_changed.connect(self.rerun_search)
+        main_layout.addWidget(self.filter_row)
         main_layout.addWidget(self.table)
 
         # --- Status Bar ---
         self.status_bar = QStatusBar()
         main_layout.addWidget(self.status_bar)
 
+        self.current_keyword = ""
+        self.fuzzy_active = False
+        self.attachments_active = False
+        self.attachment_matches = {} # {record id: [attachment match]} for the shown results
+        self.store = get_record_store(self.user_department if self.user_role != 'admin' else None)
+        self.store.records_changed.connect(self.on_records_changed)
+        # A history step emits both records_reset and history_changed; one rerun covers both.
+        self.rerun_timer = QTimer(self)
+        self.rerun_timer.setSingleShot(True)
+        self.rerun_timer.timeout.connect(self.rerun_search)
+        self.store.records_reset.connect(self.rerun_timer.start)
+        self.pager.failed.connect(lambda msg: self.status_bar.showMessage(msg, 8000))
+        self.store.history_changed.connect(self.rerun_timer.start)
+        main_layout.insertWidget(main_layout.indexOf(self.filter_row), DateWindowBar(self.store))
+        self.store.watch()
         self.perform_search() # Perform an initial search to show all records
 
+    def department_filter(self):
+        if self.user_role != 'admin' or self.user_department:
+            return self.user_department
+        return None
+
     def perform_search(self):
         self.status_bar.showMessage("جاري البحث...")
         
-        keyword = self.search_input.text().strip()
-        
-        department_filter = None
-        if self.user_role != 'admin' or self.user_department:
-            department_filter = self.user_department
+        self.current_keyword = self.search_input.text().strip()
+        self.fuzzy_active = self.fuzzy_check.isChecked() and bool(self.current_keyword)
+        self.attachments_active = self.attachments_check.isChecked() and bool(self.current_keyword) and not self.fuzzy_active
+        self.rerun_search()
 
-        results = db_ops.search_all_fields(keyword, department_filter)
-        
-        self.table.setRowCount(len(results))
-        for row_idx, row_data in enumerate(results):
-            for col_idx, key in enumerate(["id", "date", "type", "device", "technician", "procedures", "materials", "notes", "warnings", "department"]):
-                value = row_data.get(key, "")
-                display_text = str(value) if value else ""
-                if len(display_text) > self.MAX_CELL_TEXT_LENGTH:
-                    display_text = display_text[:self.MAX_CELL_TEXT_LENGTH] + "..."
-                item = QTableWidgetItem(display_text)
-                if value:
-                    item.setData(Qt.UserRole, str(value))
-                self.table.setItem(row_idx, col_idx, item)
-        
-        self.status_bar.showMessage(f"تم العثور على {len(results)} سجل.", 5000)
+    def rerun_search(self):
+        """
+        Runs the last submitted search again: the first page in the chosen
+        column order and filters, or the fuzzy results ranked by similarity.
+        """
+        self.attachment_matches = {}
+        self.filter_row.setEnabled(not self.fuzzy_active)
+        self.table.horizontalHeader().setSortIndicatorShown(not self.fuzzy_active)
+        if self.fuzzy_active:
+            results = db_ops.fuzzy_search_records(self.current_keyword, self.department_filter(), date_from=self.store.since)
+            self.pager.show_all(results)
+            self.status_bar.showMessage(f"تم العثور على {len(results)} سجل مشابه (الأقرب أولاً).", 5000)
+            return
+        self.pager.reset()
+        more = " (مرر للأسفل لعرض المزيد)" if self.pager.has_more else ""
+        self.status_bar.showMessage(f"تم عرض {self.table.rowCount()} سجل{more}.", 5000)
+
+    def fetch_result_page(self, sort, descending, after, limit, filters, record_ids):
+        rows = db_ops.fetch_record_page(department=self.department_filter(), filters=filters, sort=sort,
+                                        descending=descending, after=after, limit=limit, keyword=self.current_keyword,
+                                        include_attachments=self.attachments_active, record_ids=record_ids,
+                                        date_from=self.store.since)
+        self.load_attachment_matches([row['id'] for row in rows])
+        return rows
+
+    def set_result_row(self, row_idx, row_data):
+        for col_idx, key in enumerate(RESULT_COLUMNS[:-1]):
+            self.table.setItem(row_idx, col_idx, QTableWidgetItem(list_cell_text(row_data.get(key, ""))))
+        matches = self.attachment_matches.get(row_data['id'], [])
+        self.table.setItem(row_idx, 10, QTableWidgetItem("، ".join(f"{m['original_filename']} (ص {m['page']})" for m in matches)))
+
+    def load_attachment_matches(self, record_ids):
+        """Looks up which attachment pages of record_ids match, for the matches column."""
+        if self.attachments_active:
+            self.attachment_matches.update(db_ops.find_attachment_matches(self.current_keyword, record_ids))
+
+    def on_records_changed(self, record_ids):
+        """
+        Re-checks only the changed records against the current search with
+        one query restricted to their ids (see RecordPager.refresh). Fuzzy
+        results are ranked by similarity, so they are re-run in full.
+        """
+        if self.fuzzy_active:
+            self.rerun_search()
+            return
+        for rec_id in record_ids:
+            self.attachment_matches.pop(rec_id, None)
+        self.pager.refresh(record_ids)
 
     def show_full_details(self, row, col):
         try:
             record_id = self.table.item(row, 0).text()
-            def get_full_text(col_index):
-                item = self.table.item(row, col_index)
-                if item:
-                    full_text = item.data(Qt.UserRole)
-                    return full_text if full_text is not None else item.text()
-                return ""
+            # The results only hold excerpts; the full text is fetched on demand.
+            record = db_ops.fetch_record_details(int(record_id))
+            if not record:
+                QMessageBox.warning(self, "غير موجود", "لم يعد هذا السجل موجوداً.")
+                return
+            def get_full_text(key):
+                value = record.get(key)
+                return str(value) if value else ""
             details_content = f"""
                 <b>المعرف:</b> {record_id}<br>
-                <b>التاريخ:</b> {get_full_text(1)}<br>
-                <b>النوع:</b> {get_full_text(2)}<br>
-                <b>الجهاز:</b> {get_full_text(3)}<br>
-                <b>الفني:</b> {get_full_text(4)}<br>
-                <b>القسم:</b> {get_full_text(9)}<br><br>
-                <b>الإجراءات المتبعة:</b><br>{get_full_text(5) or 'لا توجد'}<br><br>
-                <b>المواد المستخدمة:</b><br>{get_full_text(6) or 'لا توجد'}<br><br>
-                <b>ملاحظات:</b><br>{get_full_text(7) or 'لا توجد'}<br><br>
-                <b>تحذيرات:</b><br>{get_full_text(8) or 'لا توجد'}<br>
+                <b>التاريخ:</b> {get_full_text('date')}<br>
+                <b>النوع:</b> {get_full_text('type')}<br>
+                <b>الجهاز:</b> {get_full_text('device')}<br>
+                <b>الفني:</b> {get_full_text('technician')}<br>
+                <b>القسم:</b> {get_full_text('department')}<br><br>
+                <b>الإجراءات المتبعة:</b><br>{get_full_text('procedures') or 'لا توجد'}<br><br>
+                <b>المواد المستخدمة:</b><br>{get_full_text('materials') or 'لا توجد'}<br><br>
+                <b>ملاحظات:</b><br>{get_full_text('notes') or 'لا توجد'}<br><br>
+                <b>تحذيرات:</b><br>{get_full_text('warnings') or 'لا توجد'}<br>
             """
+            matches = self.attachment_matches.get(int(record_id))
+            if matches:
+                details_content += "<br><b>مطابقة في المرفقات:</b><br>" + "<br>".join(
+                    f"{m['original_filename']} - صفحة {m['page']}" for m in matches)
             details_dialog = QDialog(self)
             details_dialog.setWindowTitle(f"تفاصيل السجل - ID: {record_id}")
             details_dialog.setLayoutDirection(Qt.RightToLeft)
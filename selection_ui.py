@@ -47,21 +47,30 @@ class SelectionWindow(QWidget):
         self.btn_settings = QPushButton("الإعدادات")
         self.btn_settings.clicked.connect(self.open_settings)
         layout.addWidget(self.btn_settings)
+        self.entry_window = None
+        self.search_window = None
 
     def open_entry(self):
-        self.entry_window = EntryWindow(
-            user_id=self.current_user_id,
-            user_role=self.current_user_role,
-            user_department=self.current_user_department
-        )
+        # One instance per session; it stays current through the shared record store while closed.
+        if self.entry_window is None:
+            self.entry_window = EntryWindow(
+                user_id=self.current_user_id,
+                user_role=self.current_user_role,
+                user_department=self.current_user_department
+            )
         self.entry_window.show()
+        self.entry_window.raise_()
+        self.entry_window.activateWindow()
 
     def open_search(self):
-        self.search_window = SearchWindow(
-            user_role=self.current_user_role, 
-            user_department=self.current_user_department
-        )
+        if self.search_window is None:
+            self.search_window = SearchWindow(
+                user_role=self.current_user_role, 
+                user_department=self.current_user_department
+            )
         self.search_window.show()
+        self.search_window.raise_()
+        self.search_window.activateWindow()
 
     def open_admin_dashboard(self):
         self.admin_dashboard_window = AdminDashboardWindow(current_user_id=self.current_user_id)
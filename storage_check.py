@@ -0,0 +1,36 @@
+﻿# storage_check.py
+import argparse
+import sys
+import db_ops
+
+# Command-line entry point for the attachment storage integrity check, so it
+# can run from cron / Task Scheduler without opening the application.
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check attachments_storage against the attachments table.")
+    parser.add_argument("--storage-dir", default=db_ops.ATTACHMENT_DIR, help="Attachment storage directory")
+    parser.add_argument("--delete-orphans", action="store_true", help="Delete files not referenced by any attachment")
+    parser.add_argument("--purge-missing", action="store_true", help="Delete attachment rows whose file is missing")
+    parser.add_argument("--full", action="store_true", help="Re-hash every file instead of only new or changed ones")
+    parser.add_argument("--workers", type=int, default=4, help="Number of parallel hashing threads")
+    args = parser.parse_args(argv)
+
+    success, msg = db_ops.check_schema_version()
+    if not success:
+        print(msg)
+        return 1
+
+    success, report = db_ops.check_attachment_storage(
+        storage_dir=args.storage_dir, delete_orphans=args.delete_orphans,
+        purge_missing=args.purge_missing, full=args.full, workers=args.workers,
+        progress_callback=lambda done, total: print(f"Checked {done}/{total}", end="\r")
+    )
+    if not success:
+        print(report)
+        return 1
+    print()
+    print(db_ops.format_storage_report(report))
+    return 2 if report['missing'] or report['corrupted'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+﻿# /database/storage_queries.py
+
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from .connection import get_cursor
+from .utility_queries import log_activity
+
+ATTACHMENT_DIR = "attachments_storage"
+ORIGINALS_SUBDIR = "originals" # Untouched uploads kept next to their optimized copy.
+INTEGRITY_INDEX_NAME = ".integrity_index.json"
+ORPHAN_GRACE_SECONDS = 3600 # Files younger than this may belong to an upload still in progress.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(path):
+    """Returns the hex SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def original_copy_path(stored_filepath):
+    """Where the untouched original of an optimized attachment is kept, if configured."""
+    storage_dir, stored_filename = os.path.split(stored_filepath)
+    return os.path.join(storage_dir, ORIGINALS_SUBDIR, stored_filename)
+
+def remove_stored_file(stored_filepath):
+    """Removes an attachment file and its kept original, ignoring files that are already gone."""
+    for path in (stored_filepath, original_copy_path(stored_filepath)):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            print(f"Could not remove attachment file {path}: {e}")
+
+def _normalize_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+def _load_integrity_index(storage_dir):
+    """Loads the {filename: [size, mtime_ns, sha256]} cache written by the previous scan."""
+    try:
+        with open(os.path.join(storage_dir, INTEGRITY_INDEX_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_integrity_index(storage_dir, index):
+    index_path = os.path.join(storage_dir, INTEGRITY_INDEX_NAME)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+def _scan_storage_dir(storage_dir):
+    """Returns {normalized_path: os.stat_result} for every regular file in the storage directory."""
+    files = {}
+    if not os.path.isdir(storage_dir):
+        return files
+    with os.scandir(storage_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and not entry.name.startswith(INTEGRITY_INDEX_NAME):
+                files[_normalize_path(entry.path)] = entry.stat()
+    return files
+
+def _scan_originals_dir(storage_dir):
+    """Returns {normalized_path: os.stat_result} for kept originals, keyed by their own path."""
+    return _scan_storage_dir(os.path.join(storage_dir, ORIGINALS_SUBDIR))
+
+def check_attachment_storage(storage_dir=ATTACHMENT_DIR, delete_orphans=False, purge_missing=False,
+                             full=False, workers=4, user_id=None, progress_callback=None):
+    """
+    Reconciles the attachment storage directory with the attachments table.
+
+    Files are hashed in parallel. Unless full=True, a file whose size and
+    modification time match the previous scan reuses the cached hash, so
+    repeated runs only read new or changed files. Attachments without a stored
+    checksum are backfilled; a mismatch is reported as corrupted.
+
+    Returns (success, report) where report is a dict with the lists 'orphans',
+    'missing', 'corrupted' and the counters 'checked', 'hashed',
+    'backfilled', 'deleted_orphans', 'purged_missing', 'freed_bytes'.
+    """
+    report = {'orphans': [], 'missing': [], 'corrupted': [], 'checked': 0, 'hashed': 0,
+              'backfilled': 0, 'deleted_orphans': 0, 'purged_missing': 0, 'freed_bytes': 0}
+    try:
+        with get_cursor() as cur:
+            cur.execute("SELECT id, maintenance_id, original_filename, stored_filepath, sha256 FROM attachments")
+            attachments = cur.fetchall()
+
+        disk_files = _scan_storage_dir(storage_dir)
+        old_index = {} if full else _load_integrity_index(storage_dir)
+        new_index = {}
+        referenced = set()
+        to_verify = []
+        for att in attachments:
+            path = _normalize_path(att['stored_filepath'])
+            referenced.add(path)
+            st = disk_files.get(path)
+            if st is None and not os.path.exists(att['stored_filepath']):
+                report['missing'].append(att)
+                continue
+            if st is None:
+                # Stored outside the storage directory; still verify it.
+                st = os.stat(att['stored_filepath'])
+            to_verify.append((att, path, st))
+
+        def hash_one(item):
+            att, path, st = item
+            name = os.path.basename(path)
+            cached = old_index.get(name)
+            if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+                return att, name, st, cached[2], False
+            return att, name, st, file_sha256(path), True
+
+        total = len(to_verify)
+        backfill = []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for done, (att, name, st, digest, was_hashed) in enumerate(pool.map(hash_one, to_verify), 1):
+                report['checked'] += 1
+                report['hashed'] += int(was_hashed)
+                new_index[name] = [st.st_size, st.st_mtime_ns, digest]
+                if att['sha256'] is None:
+                    backfill.append((digest, att['id']))
+                elif att['sha256'] != digest:
+                    report['corrupted'].append(att)
+                if progress_callback and (done % 50 == 0 or done == total):
+                    progress_callback(done, total)
+
+        if backfill:
+            with get_cursor() as cur:
+                cur.executemany("UPDATE attachments SET sha256 = %s WHERE id = %s AND sha256 IS NULL", backfill)
+            report['backfilled'] = len(backfill)
+
+        now = time.time()
+        candidates = list(disk_files.items())
+        # A kept original is orphaned when its optimized copy is no longer referenced.
+        candidates += [(path, st) for path, st in _scan_originals_dir(storage_dir).items()
+                       if _normalize_path(os.path.join(storage_dir, os.path.basename(path))) not in referenced]
+        for path, st in candidates:
+            if path in referenced:
+                continue
+            if now - st.st_mtime < ORPHAN_GRACE_SECONDS:
+                continue
+            report['orphans'].append({'path': path, 'size': st.st_size})
+            if delete_orphans:
+                try:
+                    os.remove(path)
+                    report['deleted_orphans'] += 1
+                    report['freed_bytes'] += st.st_size
+                except OSError as e:
+                    print(f"Could not remove orphaned file {path}: {e}")
+
+        if purge_missing and report['missing']:
+            with get_cursor() as cur:
+                for att in report['missing']:
+                    cur.execute("DELETE FROM attachments WHERE id = %s", (att['id'],))
+                    if cur.rowcount > 0:
+                        report['purged_missing'] += 1
+                        log_activity(user_id, 'DELETE', 'attachment', att['id'], {'filename': att['original_filename'], 'maintenance_id': att['maintenance_id'], 'missing': True})
+
+        if os.path.isdir(storage_dir):
+            _save_integrity_index(storage_dir, new_index)
+        return True, report
+    except Exception as e:
+        return False, f"حدث استثناء أثناء فحص المرفقات:\n{str(e)}"
+
+def format_storage_report(report):
+    """Renders a check_attachment_storage report as plain text."""
+    lines = [
+        f"الملفات المفحوصة: {report['checked']} (تمت قراءة {report['hashed']})",
+        f"ملفات يتيمة: {len(report['orphans'])}",
+        f"مرفقات مفقودة: {len(report['missing'])}",
+        f"ملفات تالفة: {len(report['corrupted'])}",
+    ]
+    if report['backfilled']:
+        lines.append(f"تم تسجيل البصمة لـ {report['backfilled']} مرفق")
+    if report['deleted_orphans']:
+        lines.append(f"تم حذف {report['deleted_orphans']} ملف يتيم ({report['freed_bytes'] / (1024 * 1024):.1f} MB)")
+    if report['purged_missing']:
+        lines.append(f"تمت إزالة {report['purged_missing']} سجل مرفق مفقود")
+    for orphan in report['orphans']:
+        lines.append(f"يتيم: {orphan['path']}")
+    for att in report['missing']:
+        lines.append(f"مفقود: {att['stored_filepath']} (سجل {att['maintenance_id']})")
+    for att in report['corrupted']:
+        lines.append(f"تالف: {att['stored_filepath']} (سجل {att['maintenance_id']})")
+    return "\n".join(lines)
@@ -0,0 +1,14 @@
+﻿# tests/conftest.py
+import os
+import sys
+import types
+
+# The query modules live in the database package and use relative imports.
+# In a checkout where they sit next to main.py, register that directory as
+# the package so the tests can import database.<module> either way.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+if not os.path.isdir(os.path.join(ROOT, 'database')) and 'database' not in sys.modules:
+    package = types.ModuleType('database')
+    package.__path__ = [ROOT]
+    sys.modules['database'] = package
@@ -0,0 +1,35 @@
+﻿# tests/test_activity_codes.py
+import pytest
+from database.activity_codes import parse_legacy_description, render_activity_description
+
+@pytest.mark.parametrize("action, record_type, record_id, description, payload", [
+    ('INSERT', 'maintenance', 7, "Added record for device: طابعة HP", {'device': "طابعة HP"}),
+    ('TRASH', 'maintenance', 7, "Moved record to trash ID: 7", {}),
+    ('INSERT', 'attachment', 3, "Added attachment 'a b.pdf' to record 12", {'filename': "a b.pdf", 'maintenance_id': "12"}),
+    ('DELETE', 'attachment', 3, "Removed attachment 'scan.pdf' from record 12", {'filename': "scan.pdf", 'maintenance_id': "12"}),
+    ('DELETE', 'attachment', 3, "Removed missing attachment 'scan.pdf' from record 12",
+     {'filename': "scan.pdf", 'maintenance_id': "12", 'missing': True}),
+    ('UPDATE', 'maintenance', 7, "Updated record for device: Dell", {'device': "Dell"}),
+    ('UPDATE', 'user', 4, "Updated user ID 4 (username, role)", {'fields': ['username', 'role']}),
+    ('INSERT', 'user', 4, "Added user: ali with role: admin", {'username': "ali", 'role': "admin"}),
+])
+def test_parses_and_renders_back(action, record_type, record_id, description, payload):
+    parsed = parse_legacy_description(action, record_type, record_id, description)
+    assert parsed == payload
+    assert render_activity_description(action, record_type, record_id, parsed) == description
+
+@pytest.mark.parametrize("action, record_type, record_id, description", [
+    # The id in the text is not the row's record_id, so rendering would change it.
+    ('TRASH', 'maintenance', 7, "Moved record to trash ID: 8"),
+    ('INSERT', 'maintenance', 7, "something written by hand"),
+    ('UPDATE', 'user', 4, "Updated user ID 5 (role)"),
+    ('LOGIN', 'user', 4, "User logged in"),
+])
+def test_keeps_text_that_does_not_round_trip(action, record_type, record_id, description):
+    parsed = parse_legacy_description(action, record_type, record_id, description)
+    assert parsed == {'text': description}
+    assert render_activity_description(action, record_type, record_id, parsed) == description
+
+def test_empty_description():
+    assert parse_legacy_description('INSERT', 'maintenance', 1, None) == {}
+    assert parse_legacy_description('INSERT', 'maintenance', 1, "") == {}
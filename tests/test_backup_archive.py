@@ -0,0 +1,29 @@
+﻿# tests/test_backup_archive.py
+import os
+import pytest
+from database.backup_archive import _safe_path
+
+def test_bare_names_stay_inside_base(tmp_path):
+    base = str(tmp_path)
+    for name in ("scan.pdf", "تقرير 2024.pdf", "report.v2.pdf", ".hidden"):
+        assert _safe_path(base, name) == os.path.join(os.path.realpath(base), name)
+
+@pytest.mark.parametrize("name", [
+    None, "", 5, "..", "../config.ini", "sub/file.pdf", "sub\\file.pdf", "/etc/passwd",
+    "C:\\Windows\\win.ini", "C:file.pdf", "file..pdf",
+])
+def test_rejects_names_that_could_leave_base(tmp_path, name):
+    with pytest.raises(ValueError, match="اسم ملف غير صالح"):
+        _safe_path(str(tmp_path), name)
+
+def test_rejects_symlink_out_of_base(tmp_path):
+    base = tmp_path / "attachments"
+    base.mkdir()
+    outside = tmp_path / "outside.pdf"
+    outside.write_bytes(b"x")
+    try:
+        os.symlink(str(outside), str(base / "link.pdf"))
+    except (OSError, NotImplementedError):
+        pytest.skip("symlinks are not available")
+    with pytest.raises(ValueError):
+        _safe_path(str(base), "link.pdf")
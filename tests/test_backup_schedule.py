@@ -0,0 +1,92 @@
+﻿# tests/test_backup_schedule.py
+import json
+import os
+from datetime import datetime, timedelta
+from database.backup_schedule import (select_backups_to_keep, prune_scheduled_backups, list_scheduled_backups,
+                                      is_backup_due, SCHEDULED_BACKUP_PREFIX)
+from database.backup_archive import manifest_sidecar_path, ARCHIVE_EXTENSION
+
+def _name(created):
+    return f"{SCHEDULED_BACKUP_PREFIX}{created.strftime('%Y%m%d_%H%M%S')}{ARCHIVE_EXTENSION}"
+
+def _daily(days, start=datetime(2024, 3, 31, 2, 0)):
+    """One backup per day at 02:00 going back from start, newest first, as [(path, created_at)]."""
+    return [(_name(start - timedelta(days=i)), start - timedelta(days=i)) for i in range(days)]
+
+def test_keeps_newest_per_day_week_and_month():
+    backups = _daily(120)
+    keep = select_backups_to_keep(backups, keep_daily=3, keep_weekly=2, keep_monthly=3)
+    created = sorted((c for p, c in backups if p in keep), reverse=True)
+    assert created == [
+        datetime(2024, 3, 31, 2), datetime(2024, 3, 30, 2), datetime(2024, 3, 29, 2),  # days
+        datetime(2024, 3, 24, 2),  # Sunday closing the previous ISO week
+        datetime(2024, 2, 29, 2), datetime(2024, 1, 31, 2),  # months
+    ]
+
+def test_several_backups_a_day_keep_the_newest():
+    day = datetime(2024, 3, 31)
+    backups = [(_name(day.replace(hour=h)), day.replace(hour=h)) for h in (2, 14, 20)]
+    assert select_backups_to_keep(backups, 1, 0, 0) == {_name(day.replace(hour=20))}
+
+def test_zero_limits_keep_nothing():
+    assert select_backups_to_keep(_daily(10), 0, 0, 0) == set()
+
+def _write_backup(backup_dir, created, base=None):
+    """Writes an archive and its sidecar manifest; an incremental one references base for an unchanged file."""
+    path = os.path.join(backup_dir, _name(created))
+    with open(path, 'wb') as f:
+        f.write(b"archive")
+    own = os.path.basename(path)
+    manifest = {
+        'kind': 'incremental' if base else 'full',
+        'attachments': {'a.pdf': {'archive': base or own}, 'b.pdf': {'archive': own}},
+        'originals': {'a.png': {'archive': base or own}},
+    }
+    with open(manifest_sidecar_path(path), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return path
+
+def test_prune_keeps_bases_of_kept_incrementals(tmp_path):
+    backup_dir = str(tmp_path)
+    start = datetime(2024, 3, 1, 2)
+    full = _write_backup(backup_dir, start)
+    old_full = _write_backup(backup_dir, start - timedelta(days=40))
+    incrementals = [_write_backup(backup_dir, start + timedelta(days=i), base=os.path.basename(full)) for i in (1, 2, 3)]
+    manual = os.path.join(backup_dir, "my_backup" + ARCHIVE_EXTENSION)
+    open(manual, 'wb').close()
+
+    deleted = prune_scheduled_backups(backup_dir, keep_daily=2, keep_weekly=0, keep_monthly=0)
+
+    assert sorted(deleted) == sorted([incrementals[0], old_full])
+    for path in (full, *incrementals[1:]):
+        assert os.path.exists(path) and os.path.exists(manifest_sidecar_path(path))
+    for path in deleted:
+        assert not os.path.exists(path) and not os.path.exists(manifest_sidecar_path(path))
+    assert os.path.exists(manual)
+
+def test_base_referenced_only_by_originals_is_kept(tmp_path):
+    backup_dir = str(tmp_path)
+    base = _write_backup(backup_dir, datetime(2024, 3, 1, 2))
+    latest = _write_backup(backup_dir, datetime(2024, 3, 2, 2), base=os.path.basename(base))
+    with open(manifest_sidecar_path(latest), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest['attachments'] = {'b.pdf': {'archive': os.path.basename(latest)}}
+    with open(manifest_sidecar_path(latest), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    assert prune_scheduled_backups(backup_dir, 1, 0, 0) == []
+
+def test_list_ignores_other_files(tmp_path):
+    created = datetime(2024, 3, 1, 2)
+    path = _write_backup(str(tmp_path), created)
+    for name in (f"{SCHEDULED_BACKUP_PREFIX}bad{ARCHIVE_EXTENSION}", "notes.txt", "manual" + ARCHIVE_EXTENSION):
+        open(os.path.join(str(tmp_path), name), 'wb').close()
+    assert list_scheduled_backups(str(tmp_path)) == [(path, created)]
+    assert list_scheduled_backups(os.path.join(str(tmp_path), "missing")) == []
+
+def test_missed_slot_is_due_once():
+    settings = {'times': ['02:00', '14:00']}
+    now = datetime(2024, 3, 2, 10, 0)
+    assert is_backup_due(settings, now, last_run=None)
+    assert is_backup_due(settings, now, last_run=datetime(2024, 3, 1, 14, 30))
+    assert not is_backup_due(settings, now, last_run=datetime(2024, 3, 2, 2, 5))
+    assert not is_backup_due({'times': []}, now)
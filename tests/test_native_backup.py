@@ -0,0 +1,69 @@
+﻿# tests/test_native_backup.py
+from database.native_backup import split_create_table
+
+CREATE_ATTACHMENTS = """CREATE TABLE `attachments` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `maintenance_id` int NOT NULL,
+  `file_path` varchar(255) NOT NULL,
+  `file_hash` char(64) DEFAULT NULL,
+  `content` mediumtext,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_file_path` (`file_path`),
+  KEY `idx_maintenance` (`maintenance_id`),
+  FULLTEXT KEY `ft_content` (`content`),
+  CONSTRAINT `fk_attachments_maintenance` FOREIGN KEY (`maintenance_id`) REFERENCES `maintenance` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB AUTO_INCREMENT=42 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"""
+
+def test_defers_secondary_keys_and_foreign_keys():
+    create, indexes, foreign_keys = split_create_table(CREATE_ATTACHMENTS)
+    assert create == """CREATE TABLE `attachments` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `maintenance_id` int NOT NULL,
+  `file_path` varchar(255) NOT NULL,
+  `file_hash` char(64) DEFAULT NULL,
+  `content` mediumtext,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB AUTO_INCREMENT=42 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"""
+    assert indexes == ["UNIQUE KEY `uq_file_path` (`file_path`)",
+                       "KEY `idx_maintenance` (`maintenance_id`)",
+                       "FULLTEXT KEY `ft_content` (`content`)"]
+    assert foreign_keys == ["CONSTRAINT `fk_attachments_maintenance` FOREIGN KEY (`maintenance_id`) "
+                            "REFERENCES `maintenance` (`id`) ON DELETE CASCADE"]
+
+def test_keeps_keys_on_auto_increment_columns():
+    create_sql = """CREATE TABLE `maintenance_versions` (
+  `id` bigint NOT NULL AUTO_INCREMENT,
+  `maintenance_id` int NOT NULL,
+  `version` int NOT NULL,
+  PRIMARY KEY (`maintenance_id`,`version`),
+  KEY `idx_id` (`id`),
+  KEY `idx_version` (`version`)
+) ENGINE=InnoDB"""
+    create, indexes, foreign_keys = split_create_table(create_sql)
+    assert "  KEY `idx_id` (`id`)\n)" in create
+    assert indexes == ["KEY `idx_version` (`version`)"]
+    assert foreign_keys == []
+
+def test_keeps_partition_clause():
+    create_sql = """CREATE TABLE `activity_log` (
+  `id` bigint NOT NULL AUTO_INCREMENT,
+  `timestamp` datetime NOT NULL,
+  `user_id` int DEFAULT NULL,
+  PRIMARY KEY (`id`,`timestamp`),
+  KEY `idx_user` (`user_id`)
+) ENGINE=InnoDB
+/*!50100 PARTITION BY RANGE (to_days(`timestamp`))
+(PARTITION p2024 VALUES LESS THAN (739252) ENGINE = InnoDB,
+ PARTITION pmax VALUES LESS THAN MAXVALUE ENGINE = InnoDB) */"""
+    create, indexes, _ = split_create_table(create_sql)
+    assert create.endswith(create_sql[create_sql.index("\n) ENGINE"):])
+    assert "idx_user" not in create
+    assert indexes == ["KEY `idx_user` (`user_id`)"]
+
+def test_table_without_secondary_keys_is_unchanged():
+    create_sql = """CREATE TABLE `settings` (
+  `name` varchar(64) NOT NULL,
+  `value` text,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB"""
+    assert split_create_table(create_sql) == (create_sql, [], [])
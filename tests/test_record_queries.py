@@ -0,0 +1,66 @@
+﻿# tests/test_record_queries.py
+import sqlite3
+from datetime import date
+import pytest
+from database.record_queries import _after_clause, _date_prefix_range
+
+# NULL sorts first ascending and last descending in SQLite as in MySQL, so
+# the keyset conditions can be checked by paging through an in-memory table.
+ROWS = [(1, 'b'), (2, None), (3, 'a'), (4, 'b'), (5, None), (6, 'c'), (7, 'a'), (8, 'b'), (9, None)]
+
+@pytest.fixture(scope='module')
+def db():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE maintenance (id INTEGER PRIMARY KEY, device TEXT)")
+    conn.executemany("INSERT INTO maintenance VALUES (?, ?)", ROWS)
+    yield conn
+    conn.close()
+
+def _page(db, sort_sql, descending, after, limit):
+    direction = "DESC" if descending else "ASC"
+    sql, params = "SELECT id, device FROM maintenance WHERE 1 = 1", []
+    if after is not None:
+        sql += _after_clause(sort_sql, descending, after, params)
+    sql += f" ORDER BY {sort_sql} {direction}, maintenance.id {direction} LIMIT {limit}"
+    return db.execute(sql.replace("%s", "?"), params).fetchall()
+
+@pytest.mark.parametrize("sort_sql", ['maintenance.device', 'maintenance.id'])
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("limit", [1, 2, 4])
+def test_pages_cover_every_row_once_in_order(db, sort_sql, descending, limit):
+    expected = _page(db, sort_sql, descending, None, len(ROWS))
+    seen, after = [], None
+    while True:
+        page = _page(db, sort_sql, descending, after, limit)
+        if not page:
+            break
+        seen.extend(page)
+        last_id, last_device = page[-1]
+        after = (last_id if sort_sql == 'maintenance.id' else last_device, last_id)
+    assert seen == expected
+
+def test_null_keyset_conditions():
+    params = []
+    assert _after_clause('maintenance.device', True, (None, 5), params) == \
+        " AND maintenance.device IS NULL AND maintenance.id < %s"
+    assert params == [5]
+    params = []
+    assert _after_clause('maintenance.device', False, (None, 5), params) == \
+        " AND ((maintenance.device IS NULL AND maintenance.id > %s) OR maintenance.device IS NOT NULL)"
+    assert params == [5]
+
+@pytest.mark.parametrize("text, expected", [
+    ('2024', (date(2024, 1, 1), date(2025, 1, 1))),
+    ('2024-05', (date(2024, 5, 1), date(2024, 6, 1))),
+    ('2024-12', (date(2024, 12, 1), date(2025, 1, 1))),
+    ('2024-1', (date(2024, 1, 1), date(2024, 2, 1))),
+    ('2024-02-29', (date(2024, 2, 29), date(2024, 3, 1))),
+    ('2024-12-31', (date(2024, 12, 31), date(2025, 1, 1))),
+])
+def test_date_prefix_range(text, expected):
+    assert _date_prefix_range(text) == expected
+
+@pytest.mark.parametrize("text", ['', 'abc', '2024-13', '2024-00', '2023-02-29', '2024-05-17-1', '2024/05'])
+def test_date_prefix_range_rejects(text):
+    with pytest.raises(ValueError, match="تاريخ غير صالح"):
+        _date_prefix_range(text)
@@ -0,0 +1,101 @@
+﻿# tests/test_version_queries.py
+from contextlib import contextmanager
+import pytest
+from database import version_queries
+from database.version_queries import (record_version, _replay, diff_record_versions, get_record_version,
+                                      VERSIONED_FIELDS, SNAPSHOT_EVERY, TEXT_PATCH_MIN_LENGTH)
+
+class FakeVersionCursor:
+    """Answers the maintenance_versions statements of version_queries from a list."""
+
+    def __init__(self):
+        self.rows = []
+        self.result = []
+
+    def execute(self, sql, params):
+        if sql.lstrip().startswith("INSERT"):
+            maintenance_id, version, user_id, is_snapshot, changed_mask, data = params
+            self.rows.append({'maintenance_id': maintenance_id, 'version': version,
+                              'is_snapshot': is_snapshot, 'data': data})
+        elif "MAX(version) AS version" in sql:
+            versions = [r['version'] for r in self.rows if r['maintenance_id'] == params[0]]
+            self.result = [{'version': max(versions) if versions else None}]
+        else: # _version_rows
+            maintenance_id, to_version, _, from_version = params
+            rows = [r for r in self.rows if r['maintenance_id'] == maintenance_id]
+            base = max([r['version'] for r in rows if r['is_snapshot'] and r['version'] <= from_version], default=1)
+            self.result = [r for r in rows if base <= r['version'] <= to_version]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+@pytest.fixture
+def cur(monkeypatch):
+    cursor = FakeVersionCursor()
+
+    @contextmanager
+    def get_cursor():
+        yield cursor
+
+    monkeypatch.setattr(version_queries, 'get_cursor', get_cursor)
+    return cursor
+
+def _fields(**changes):
+    fields = {field: f"{field} 1" for field in VERSIONED_FIELDS}
+    fields.update(changes)
+    return fields
+
+def _history(cur, count):
+    """Writes count versions of record 1, each changing the notes; returns the fields of every version."""
+    states = {1: _fields(notes="ملاحظة " * 60)}
+    record_version(cur, 1, None, None, states[1])
+    for version in range(2, count + 1):
+        old = states[version - 1]
+        new = dict(old, notes=old['notes'] + f" تعديل {version}")
+        if version % 3 == 0:
+            new['technician'] = f"فني {version}"
+        assert record_version(cur, 1, None, old, new)[0] == version
+        states[version] = new
+    return states
+
+def test_replay_rebuilds_every_version(cur):
+    states = _history(cur, 2 * SNAPSHOT_EVERY + 5)
+    assert _replay(cur.rows, set(states)) == states
+    snapshots = [r['version'] for r in cur.rows if r['is_snapshot']]
+    assert snapshots == [1, SNAPSHOT_EVERY + 1, 2 * SNAPSHOT_EVERY + 1]
+
+def test_long_text_is_stored_as_patch(cur):
+    _history(cur, 2)
+    delta = cur.rows[1]
+    assert not delta['is_snapshot']
+    assert '"p"' in delta['data'] and len(delta['data']) < TEXT_PATCH_MIN_LENGTH
+
+def test_get_record_version_reads_from_nearest_snapshot(cur):
+    states = _history(cur, 2 * SNAPSHOT_EVERY + 5)
+    for version in (1, 5, SNAPSHOT_EVERY + 1, SNAPSHOT_EVERY + 4, 2 * SNAPSHOT_EVERY + 5):
+        assert get_record_version(1, version) == states[version]
+    assert get_record_version(1, 99) is None
+
+def test_diff_record_versions(cur):
+    states = _history(cur, SNAPSHOT_EVERY + 4)
+    diff = diff_record_versions(1, 2, SNAPSHOT_EVERY + 3)
+    assert set(diff) == {'notes', 'technician'}
+    assert diff['notes'] == (states[2]['notes'], states[SNAPSHOT_EVERY + 3]['notes'])
+    # Either order; the result is always (from, to).
+    backwards = diff_record_versions(1, SNAPSHOT_EVERY + 3, 2)
+    assert backwards['technician'] == (states[SNAPSHOT_EVERY + 3]['technician'], states[2]['technician'])
+    assert diff_record_versions(1, 4, 4) == {}
+
+def test_unchanged_update_writes_no_version(cur):
+    _history(cur, 1)
+    fields = _fields(notes="ملاحظة " * 60)
+    assert record_version(cur, 1, None, fields, dict(fields)) == (None, [])
+    assert len(cur.rows) == 1
+
+def test_baseline_snapshot_for_rows_without_history(cur):
+    old, new = _fields(), _fields(device="Dell")
+    assert record_version(cur, 2, 5, old, new) == (2, ['device'])
+    assert _replay(cur.rows, {1, 2}) == {1: old, 2: new}
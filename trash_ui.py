@@ -2,6 +2,7 @@
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import Qt
 import db_ops
+from record_sync import shared_change_poller, notify_records_changed, apply_record_delta
 
 class TrashWindow(QDialog):
     def __init__(self, current_user_id, parent=None):
@@ -29,18 +30,35 @@ class TrashWindow(QDialog):
         self.btn_restore.clicked.connect(self.restore_selected)
         self.btn_delete_perm.clicked.connect(self.delete_permanently)
         self.btn_close.clicked.connect(self.accept)
+        self.change_poller = shared_change_poller()
+        self.change_poller.records_changed.connect(self.refresh_record_rows)
+        self.change_poller.resync_needed.connect(self.load_deleted_records)
+        self.change_poller.start()
+        self.finished.connect(self.disconnect_change_feed)
         self.load_deleted_records()
 
+    def disconnect_change_feed(self):
+        self.change_poller.records_changed.disconnect(self.refresh_record_rows)
+        self.change_poller.resync_needed.disconnect(self.load_deleted_records)
+
     def load_deleted_records(self):
         records = db_ops.fetch_deleted_records()
         self.table.setRowCount(len(records))
         for i, record in enumerate(records):
-            self.table.setItem(i, 0, QTableWidgetItem(str(record['id'])))
-            self.table.setItem(i, 1, QTableWidgetItem(str(record['date'])))
-            self.table.setItem(i, 2, QTableWidgetItem(record['device']))
-            self.table.setItem(i, 3, QTableWidgetItem(record['department']))
+            self.set_record_row(i, record)
         self.table.resizeColumnsToContents()
 
+    def set_record_row(self, i, record):
+        self.table.setItem(i, 0, QTableWidgetItem(str(record['id'])))
+        self.table.setItem(i, 1, QTableWidgetItem(str(record['date'])))
+        self.table.setItem(i, 2, QTableWidgetItem(record['device']))
+        self.table.setItem(i, 3, QTableWidgetItem(record['department']))
+
+    def refresh_record_rows(self, record_ids):
+        """Re-fetches only record_ids, e.g. records trashed or restored on another machine."""
+        records = db_ops.fetch_deleted_records(record_ids=record_ids)
+        apply_record_delta(self.table, record_ids, records, self.set_record_row)
+
     def get_selected_id(self):
         selected_items = self.table.selectedItems()
         if not selected_items:
@@ -53,7 +71,8 @@ class TrashWindow(QDialog):
         if rec_id:
             db_ops.restore_record(rec_id, self.current_user_id)
             QMessageBox.information(self, "نجاح", "تم استعادة السجل بنجاح.")
-            self.load_deleted_records()
+            self.refresh_record_rows([rec_id])
+            notify_records_changed([rec_id])
 
     def delete_permanently(self):
         rec_id = self.get_selected_id()
@@ -61,4 +80,4 @@ class TrashWindow(QDialog):
             reply = QMessageBox.warning(self, 'تأكيد الحذف النهائي', "هل أنت متأكد؟ لا يمكن التراجع عن هذا الإجراء.", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.Yes:
                 db_ops.permanently_delete_record(rec_id, self.current_user_id)
-                self.load_deleted_records()
\ No newline at end of file
+                self.refresh_record_rows([rec_id])
\ No newline at end of file
@@ -6,13 +6,16 @@ from .connection import get_cursor
 # For now, we will import log_activity from the main db_ops.
 # We will clean this up in a later step.
 # Change this line in /database/user_queries.py
-from .utility_queries import log_activity
+from .utility_queries import log_activity, resolve_department_id
 
 # --- AUTH & USER MANAGEMENT ---
 def verify_user(username, password):
     """Verifies a user's credentials against the database."""
     with get_cursor() as cur:
-        cur.execute("SELECT id, role_id, department FROM users WHERE username=%s AND password_hash=%s AND is_deleted = 0", (username, password))
+        cur.execute("""
+            SELECT u.id, u.role_id, d.name AS department FROM users u LEFT JOIN departments d ON d.id = u.department_id
+            WHERE u.username=%s AND u.password_hash=%s AND u.is_deleted = 0
+        """, (username, password))
         return cur.fetchone()
 
 def get_role_name_by_id(role_id):
@@ -34,9 +37,10 @@ def add_user(username, password, role_name, department, current_user_id):
             cur.execute("SELECT id FROM users WHERE username=%s AND is_deleted = 0", (username,))
             if cur.fetchone(): return False, "اسم المستخدم موجود بالفعل"
             
-            cur.execute("INSERT INTO users (username, password_hash, role_id, department) VALUES (%s, %s, %s, %s)", (username, password, role_id, department))
+            department_id = resolve_department_id(cur, department)
+            cur.execute("INSERT INTO users (username, password_hash, role_id, department_id) VALUES (%s, %s, %s, %s)", (username, password, role_id, department_id))
             new_user_id = cur.lastrowid
-            log_activity(current_user_id, 'INSERT', 'user', new_user_id, f"Added user: {username} with role: {role_name}")
+            log_activity(current_user_id, 'INSERT', 'user', new_user_id, {'username': username, 'role': role_name})
             return True, "تمت الإضافة بنجاح"
     except Exception as e:
         return False, str(e)
@@ -49,18 +53,19 @@ def update_user(user_id, role_name, department, new_password, current_user_id):
             role = cur.fetchone()
             if not role: return False, "الدور المحدد غير صالح."
             role_id = role['id']
+            department_id = resolve_department_id(cur, department)
 
             if new_password:
-                sql = "UPDATE users SET role_id=%s, department=%s, password_hash=%s WHERE id=%s"
-                params = (role_id, department, new_password, user_id)
-                log_description = f"Updated user ID {user_id} (department, role, password)"
+                sql = "UPDATE users SET role_id=%s, department_id=%s, password_hash=%s WHERE id=%s"
+                params = (role_id, department_id, new_password, user_id)
+                changed_fields = ['department', 'role', 'password']
             else:
-                sql = "UPDATE users SET role_id=%s, department=%s WHERE id=%s"
-                params = (role_id, department, user_id)
-                log_description = f"Updated user ID {user_id} (department, role)"
+                sql = "UPDATE users SET role_id=%s, department_id=%s WHERE id=%s"
+                params = (role_id, department_id, user_id)
+                changed_fields = ['department', 'role']
             
             cur.execute(sql, params)
-            log_activity(current_user_id, 'UPDATE', 'user', user_id, log_description)
+            log_activity(current_user_id, 'UPDATE', 'user', user_id, {'fields': changed_fields})
             return True, "تم تحديث المستخدم بنجاح."
     except Exception as e:
         return False, f"فشل تحديث المستخدم: {str(e)}"
@@ -73,7 +78,7 @@ def delete_user(user_id_to_delete, current_user_id):
         with get_cursor() as cur:
             cur.execute("UPDATE users SET is_deleted = 1 WHERE id = %s", (user_id_to_delete,))
             if cur.rowcount > 0:
-                log_activity(current_user_id, 'TRASH', 'user', user_id_to_delete, f"Moved user to trash ID: {user_id_to_delete}")
+                log_activity(current_user_id, 'TRASH', 'user', user_id_to_delete)
                 return True, "تم نقل المستخدم إلى سلة المحذوفات."
             else:
                 return False, "لم يتم العثور على المستخدم."
@@ -83,7 +88,7 @@ def delete_user(user_id_to_delete, current_user_id):
 # --- TRASH MANAGEMENT (Users) ---
 def fetch_deleted_users():
     """Fetches all soft-deleted users."""
-    sql = "SELECT u.id, u.username, r.role_name, u.department FROM users u JOIN roles r ON u.role_id = r.id WHERE u.is_deleted = 1 ORDER BY u.id"
+    sql = "SELECT u.id, u.username, r.role_name, d.name AS department FROM users u JOIN roles r ON u.role_id = r.id LEFT JOIN departments d ON d.id = u.department_id WHERE u.is_deleted = 1 ORDER BY u.id"
     with get_cursor() as cur:
         cur.execute(sql)
         return cur.fetchall()
@@ -93,20 +98,20 @@ def restore_user(user_id, admin_id):
     with get_cursor() as cur:
         cur.execute("UPDATE users SET is_deleted = 0 WHERE id = %s", (user_id,))
         if cur.rowcount > 0:
-            log_activity(admin_id, 'RESTORE', 'user', user_id, f"Restored user from trash ID: {user_id}")
+            log_activity(admin_id, 'RESTORE', 'user', user_id)
 
 def permanently_delete_user(user_id, admin_id):
     """Permanently deletes a user from the database."""
     with get_cursor() as cur:
         cur.execute("DELETE FROM users WHERE id = %s AND is_deleted = 1", (user_id,))
         if cur.rowcount > 0:
-            log_activity(admin_id, 'DELETE', 'user', user_id, f"Permanently deleted user ID: {user_id}")
+            log_activity(admin_id, 'DELETE', 'user', user_id)
 
 
 # --- ADMIN DASHBOARD HELPERS (User-related) ---
 def fetch_all_users():
     """Fetches all active users."""
-    sql = "SELECT u.id, u.username, r.role_name, u.department FROM users u JOIN roles r ON u.role_id = r.id WHERE u.is_deleted = 0 ORDER BY u.id"
+    sql = "SELECT u.id, u.username, r.role_name, d.name AS department FROM users u JOIN roles r ON u.role_id = r.id LEFT JOIN departments d ON d.id = u.department_id WHERE u.is_deleted = 0 ORDER BY u.id"
     with get_cursor() as cur:
         cur.execute(sql)
         return cur.fetchall()
\ No newline at end of file
@@ -2,67 +2,346 @@
 
 import subprocess
 import os
+import io
+import gzip
+import time
+import itertools
+import tempfile
 from datetime import datetime
 import mysql.connector
 from .connection import get_cursor, get_db_config
+from .record_archive import maintenance_source
+from .activity_codes import encode_activity, decode_activity_row, ACTIVITY_ACTIONS, ACTIVITY_RECORD_TYPES, \
+    ACTIVITY_ACTION_NAMES, ACTIVITY_RECORD_TYPE_NAMES
 
 # --- ACTIVITY LOG ---
-def log_activity(user_id, action, record_type, record_id=None, description=None):
-    """Logs a user's action to the activity_log table."""
-    sql = "INSERT INTO activity_log (user_id, action, record_type, record_id, description) VALUES (%s, %s, %s, %s, %s)"
+def log_activity(user_id, action, record_type, record_id=None, payload=None):
+    """
+    Logs a user's action to the activity_log table. payload holds the event
+    details (e.g. {'device': ...}) that ACTIVITY_TEMPLATES turns into the
+    description when the log is read.
+    """
+    action_code, record_type_code, payload_json = encode_activity(action, record_type, payload)
+    sql = "INSERT INTO activity_log (user_id, action_code, record_type_code, record_id, payload) VALUES (%s, %s, %s, %s, %s)"
     with get_cursor() as cur:
-        cur.execute(sql, (user_id, action, record_type, record_id, description or ""))
+        cur.execute(sql, (user_id, action_code, record_type_code, record_id, payload_json))
 
-def fetch_activity_log(limit=100):
-    """Fetches the latest activity logs."""
-    sql = """
-        SELECT al.id, u.username, al.action, al.record_type, al.record_id, al.description, al.timestamp
+ACTIVITY_PAGE_SIZE = 200
+
+def _activity_log_filter_sql(filters):
+    """
+    Builds the WHERE clauses for an activity log query. filters may hold
+    user_id, action, record_type, record_id, date_from and date_to (dates,
+    both inclusive); missing or None entries are not filtered on.
+    """
+    clauses, params = [], []
+    for column in ('user_id', 'record_id'):
+        if filters.get(column) is not None:
+            clauses.append(f"al.{column} = %s")
+            params.append(filters[column])
+    if filters.get('action') is not None:
+        clauses.append("al.action_code = %s")
+        params.append(ACTIVITY_ACTIONS.get(filters['action'], 0))
+    if filters.get('record_type') is not None:
+        clauses.append("al.record_type_code = %s")
+        params.append(ACTIVITY_RECORD_TYPES.get(filters['record_type'], 0))
+    if filters.get('date_from'):
+        clauses.append("al.timestamp >= %s")
+        params.append(filters['date_from'])
+    if filters.get('date_to'):
+        clauses.append("al.timestamp < %s + INTERVAL 1 DAY")
+        params.append(filters['date_to'])
+    return clauses, params
+
+def fetch_activity_log_page(filters=None, after=None, page_size=ACTIVITY_PAGE_SIZE, include_archived=False):
+    """
+    Fetches one page of the activity log, newest first, ordered by
+    (timestamp, id). Pass the (timestamp, id) of the last row already shown
+    as after to get the next page; this keyset form costs the same on the
+    last page as on the first, unlike OFFSET. Every filter combination is
+    served by one of the idx_activity_* indexes.
+    With include_archived=True, a page that runs past the rows still in the
+    table continues into the archived months (rows there carry 'archived').
+    """
+    clauses, params = _activity_log_filter_sql(filters or {})
+    if after is not None:
+        clauses.append("(al.timestamp, al.id) < (%s, %s)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f"""
+        SELECT al.id, al.user_id, u.username, al.action_code, al.record_type_code, al.record_id, al.payload, al.timestamp
         FROM activity_log al LEFT JOIN users u ON al.user_id = u.id
-        ORDER BY al.timestamp DESC LIMIT %s
+        {where}
+        ORDER BY al.timestamp DESC, al.id DESC LIMIT %s
     """
     with get_cursor() as cur:
-        cur.execute(sql, (limit,))
-        return cur.fetchall()
+        cur.execute(sql, (*params, page_size))
+        rows = [decode_activity_row(row) for row in cur.fetchall()]
+    if include_archived and len(rows) < page_size:
+        from .activity_archive import iter_archived_activity # Archived months are older than anything in the table.
+        resume_after = (rows[-1]['timestamp'], rows[-1]['id']) if rows else after
+        rows.extend(itertools.islice(iter_archived_activity(filters, after=resume_after), page_size - len(rows)))
+    return rows
+
+def fetch_activity_log(limit=100):
+    """Fetches the latest activity logs."""
+    return fetch_activity_log_page(page_size=limit)
+
+def get_activity_log_filter_options():
+    """Returns the users (including deleted ones), actions and record types to offer as filters."""
+    with get_cursor() as cur:
+        cur.execute("SELECT id, username FROM users ORDER BY username")
+        users = cur.fetchall()
+        cur.execute("SELECT DISTINCT action_code FROM activity_log")
+        actions = sorted(ACTIVITY_ACTION_NAMES[row['action_code']] for row in cur.fetchall() if row['action_code'] in ACTIVITY_ACTION_NAMES)
+        cur.execute("SELECT DISTINCT record_type_code FROM activity_log")
+        record_types = sorted(ACTIVITY_RECORD_TYPE_NAMES[row['record_type_code']] for row in cur.fetchall() if row['record_type_code'] in ACTIVITY_RECORD_TYPE_NAMES)
+    return {'users': users, 'actions': actions, 'record_types': record_types}
 
 # --- BACKUP & RESTORE ---
-def backup_database(output_path):
-    """Creates a backup of the database using mysqldump."""
+BACKUP_CHUNK_SIZE = 1024 * 1024
+BACKUP_FILE_FILTER = "Backup Files (*.sql.gz *.sql.zst *.sql *.jsonl.gz *.jsonl.zst *.jsonl)"
+
+class IoThrottle:
+    """
+    Caps the sustained throughput of one backup run by sleeping whenever the
+    bytes consumed so far get ahead of the allowed rate. A rate of 0 or less
+    disables throttling.
+    """
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self._start = time.monotonic()
+        self._consumed = 0
+
+    def consume(self, nbytes):
+        if self.bytes_per_second <= 0:
+            return
+        self._consumed += nbytes
+        ahead = self._consumed / self.bytes_per_second - (time.monotonic() - self._start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+def _backup_compression(path):
+    """Picks the compression from the file extension: 'zstd', 'gzip' or None."""
+    lower = path.lower()
+    if lower.endswith('.zst'):
+        return 'zstd'
+    if lower.endswith('.gz'):
+        return 'gzip'
+    return None
+
+def _open_backup_writer(path):
+    """Opens a binary writer for a backup file, compressing according to its extension."""
+    compression = _backup_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'zstd':
+        import zstandard # Optional dependency, only needed for .zst archives.
+        return zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(open(path, 'wb'))
+    return open(path, 'wb')
+
+def _open_backup_reader(raw_file, path):
+    """Wraps an already opened binary file so reads return decompressed SQL."""
+    compression = _backup_compression(path)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw_file, mode='rb')
+    if compression == 'zstd':
+        import zstandard
+        # Buffered so callers can iterate lines as well as read chunks.
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw_file))
+    return raw_file
+
+class _RowCounter:
+    """
+    Estimates rows flowing through a mysqldump stream. Every extended INSERT
+    starts one row and each '),(' separator starts another. A few bytes are
+    carried between chunks so separators split across reads are still seen.
+    """
+    def __init__(self):
+        self.rows = 0
+        self._tail = b''
+
+    def feed(self, chunk):
+        data = self._tail + chunk
+        self.rows += data.count(b'INSERT INTO ') + data.count(b'),(')
+        # Keep fewer bytes than either token so nothing is counted twice.
+        self._tail = data[-2:]
+
+def _mysql_client_args(db_config):
+    return [f"--host={db_config['host']}", f"--user={db_config['user']}",
+            f"--default-character-set={db_config.get('charset', 'utf8mb4')}"]
+
+def _mysql_client_env(db_config):
+    """Passes the password through the environment so it does not show up in process listings."""
+    env = os.environ.copy()
+    env['MYSQL_PWD'] = db_config['password']
+    return env
+
+def estimate_database_rows():
+    """Returns InnoDB's row estimate for the whole schema; cheap, used only for progress."""
+    with get_cursor() as cur:
+        cur.execute("SELECT COALESCE(SUM(TABLE_ROWS), 0) AS row_count FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()")
+        return int(cur.fetchone()['row_count'])
+
+def backup_database(output_path, progress_callback=None, throttle=None):
+    """
+    Creates a backup of the database using mysqldump. The dump is streamed in
+    binary mode and compressed on the fly when output_path ends in .gz or .zst.
+    progress_callback(bytes_written, rows_total_estimate, rows_done) is called
+    after every chunk. An IoThrottle slows the read loop, and through the pipe
+    mysqldump itself.
+    """
     try:
         db_config = get_db_config()
-        cmd = [
-            "mysqldump", f"--host={db_config['host']}", f"--user={db_config['user']}",
-            f"--password={db_config['password']}", "--single-transaction",
-            "--routines", "--triggers", db_config['database']
-        ]
-        with open(output_path, 'w', encoding='utf-8') as f:
-            result = subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE, text=True, check=False)
-        if result.returncode == 0:
-            return True, f"تم إنشاء النسخة الاحتياطية بنجاح في:\n{output_path}"
-        else:
-            return False, f"فشل النسخ الاحتياطي:\n{result.stderr.strip()}"
+        cmd = ["mysqldump", *_mysql_client_args(db_config), "--single-transaction", "--quick",
+               "--routines", "--triggers", db_config['database']]
+        rows_total = 0
+        if progress_callback:
+            try:
+                rows_total = estimate_database_rows()
+            except Exception:
+                rows_total = 0
+        counter = _RowCounter()
+        bytes_done = 0
+        with tempfile.TemporaryFile() as err, _open_backup_writer(output_path) as out:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err, env=_mysql_client_env(db_config))
+            try:
+                for chunk in iter(lambda: proc.stdout.read(BACKUP_CHUNK_SIZE), b''):
+                    out.write(chunk)
+                    bytes_done += len(chunk)
+                    counter.feed(chunk)
+                    if throttle:
+                        throttle.consume(len(chunk))
+                    if progress_callback:
+                        progress_callback(bytes_done, rows_total, counter.rows)
+            finally:
+                proc.stdout.close()
+                returncode = proc.wait()
+            err.seek(0)
+            stderr = err.read().decode('utf-8', errors='replace')
+        if returncode == 0:
+            return True, f"تم إنشاء النسخة الاحتياطية بنجاح في:\n{output_path}\n({counter.rows} صف، {bytes_done / (1024 * 1024):.1f} MB قبل الضغط)"
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False, f"فشل النسخ الاحتياطي:\n{stderr.strip()}"
     except Exception as e:
         return False, f"حدث استثناء أثناء النسخ الاحتياطي:\n{str(e)}"
 
-def restore_database(input_path):
-    """Restores the database from a backup file."""
+def restore_database(input_path, progress_callback=None):
+    """
+    Restores the database from a backup file, decompressing .gz/.zst archives
+    on the fly and streaming them into the mysql client.
+    progress_callback(archive_bytes_read, archive_size, rows_done) is called
+    after every chunk.
+    """
     try:
         if not os.path.exists(input_path):
             return False, f"ملف النسخة الاحتياطية غير موجود: {input_path}"
         db_config = get_db_config()
-        cmd = [
-            "mysql", f"--host={db_config['host']}", f"--user={db_config['user']}",
-            f"--password={db_config['password']}", db_config['database']
-        ]
-        with open(input_path, 'r', encoding='utf-8') as f:
-            result = subprocess.run(cmd, stdin=f, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False)
-        if result.returncode == 0:
+        cmd = ["mysql", *_mysql_client_args(db_config), db_config['database']]
+        archive_size = os.path.getsize(input_path)
+        counter = _RowCounter()
+        with tempfile.TemporaryFile() as err, open(input_path, 'rb') as raw:
+            reader = _open_backup_reader(raw, input_path)
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=err, env=_mysql_client_env(db_config))
+            try:
+                for chunk in iter(lambda: reader.read(BACKUP_CHUNK_SIZE), b''):
+                    proc.stdin.write(chunk)
+                    counter.feed(chunk)
+                    if progress_callback:
+                        progress_callback(raw.tell(), archive_size, counter.rows)
+            except BrokenPipeError:
+                pass # mysql exited early; its stderr explains why.
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+                returncode = proc.wait()
+            err.seek(0)
+            stderr = err.read().decode('utf-8', errors='replace')
+        if returncode == 0:
             return True, "تمت استعادة النسخة الاحتياطية بنجاح."
         else:
-            return False, f"فشل استعادة النسخة الاحتياطية:\n{result.stderr.strip()}"
+            return False, f"فشل استعادة النسخة الاحتياطية:\n{stderr.strip()}"
     except Exception as e:
         return False, f"حدث استثناء أثناء استعادة النسخة الاحتياطية:\n{str(e)}"
 
 # --- DEPARTMENT MANAGEMENT ---
+# maintenance and users reference departments by department_id, so a rename is
+# a single-row update. Callers still pass and receive department names; the
+# query functions translate.
+DEPARTMENT_BATCH_ROWS = 5000
+
+def resolve_department_id(cur, name):
+    """Returns the id of the department called name, or None for an empty name."""
+    if not name:
+        return None
+    cur.execute("SELECT id FROM departments WHERE name = %s", (name,))
+    row = cur.fetchone()
+    if not row:
+        raise ValueError(f"القسم '{name}' غير موجود.")
+    return row['id']
+
+def backfill_department_ids(batch_rows=DEPARTMENT_BATCH_ROWS, progress_callback=None):
+    """
+    Fills maintenance.department_id and users.department_id from the legacy
+    department name columns, batch_rows ids per transaction so neither table
+    is locked for long; usable as a migration step or from
+    migrate_departments.py on a live database. Names that no longer match a
+    department (left behind by renames before this change) are re-created
+    as departments so no record loses its department. Resumable.
+    """
+    for table in ('maintenance', 'users'):
+        with get_cursor() as batch_cur:
+            batch_cur.execute(f"""
+                SELECT DISTINCT department FROM {table}
+                WHERE department_id IS NULL AND department IS NOT NULL AND department <> ''
+            """)
+            missing = [(row['department'],) for row in batch_cur.fetchall()]
+            batch_cur.executemany("INSERT IGNORE INTO departments (name) VALUES (%s)", missing)
+        last_id = 0
+        while True:
+            with get_cursor() as batch_cur:
+                batch_cur.execute(f"SELECT MAX(id) AS upto FROM (SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s) AS batch",
+                                  (last_id, batch_rows))
+                upto = batch_cur.fetchone()['upto']
+                if upto is None:
+                    break
+                batch_cur.execute(f"""
+                    UPDATE {table} t JOIN departments d ON d.name = t.department
+                    SET t.department_id = d.id
+                    WHERE t.id > %s AND t.id <= %s AND t.department_id IS NULL
+                """, (last_id, upto))
+                last_id = upto
+            if progress_callback:
+                progress_callback(table, last_id)
+
+def add_department_foreign_keys(cur):
+    """
+    Migration step: adds the department_id foreign keys once the ids are
+    filled. With foreign_key_checks off MySQL adds them in place instead of
+    copying the table; the backfill already guarantees the references.
+    Skips keys that exist (databases migrated when version 11 added them).
+    """
+    cur.execute("""
+        SELECT CONSTRAINT_NAME AS name FROM information_schema.TABLE_CONSTRAINTS
+        WHERE TABLE_SCHEMA = DATABASE() AND CONSTRAINT_TYPE = 'FOREIGN KEY'
+    """)
+    existing = {row['name'] for row in cur.fetchall()}
+    keys = [
+        ('maintenance', 'fk_maintenance_department', ''),
+        ('users', 'fk_users_department', ' ON DELETE SET NULL'),
+    ]
+    cur.execute("SET SESSION foreign_key_checks = 0")
+    try:
+        for table, name, on_delete in keys:
+            if name not in existing:
+                cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY (department_id)"
+                            f" REFERENCES departments (id){on_delete}, ALGORITHM=INPLACE, LOCK=NONE")
+    finally:
+        cur.execute("SET SESSION foreign_key_checks = 1")
+
 def get_all_departments():
     """Retrieves a list of all department names."""
     with get_cursor() as cur:
@@ -75,18 +354,18 @@ def add_department(name, user_id):
         with get_cursor() as cur:
             cur.execute("INSERT INTO departments (name) VALUES (%s)", (name,))
             new_dept_id = cur.lastrowid
-            log_activity(user_id, 'INSERT', 'department', new_dept_id, f"Added department: {name}")
+            log_activity(user_id, 'INSERT', 'department', new_dept_id, {'name': name})
             return True, "تمت إضافة القسم بنجاح."
     except mysql.connector.Error as err:
         if err.errno == 1062: return False, "هذا القسم موجود بالفعل."
         return False, str(err)
 
 def update_department(department_id, new_name, user_id):
-    """Updates the name of a department."""
+    """Renames a department; records and users follow through department_id."""
     try:
         with get_cursor() as cur:
             cur.execute("UPDATE departments SET name = %s WHERE id = %s", (new_name, department_id))
-            log_activity(user_id, 'UPDATE', 'department', department_id, f"Renamed department to: {new_name}")
+            log_activity(user_id, 'UPDATE', 'department', department_id, {'name': new_name})
             return True, "تم تحديث القسم بنجاح."
     except mysql.connector.Error as err:
         if err.errno == 1062: return False, "اسم القسم هذا مستخدم بالفعل."
@@ -101,14 +380,17 @@ def delete_department(department_id, user_id):
             if not dept_name_row: return False, "Department not found."
             dept_name = dept_name_row['name']
             
-            cur.execute("SELECT COUNT(*) as count FROM users WHERE department = %s AND is_deleted = 0", (dept_name,))
-            if cur.fetchone()['count'] > 0: return False, "لا يمكن حذف القسم لأنه معين لمستخدمين حاليين."
+            # Existence checks on the department_id foreign key indexes.
+            cur.execute("SELECT EXISTS(SELECT 1 FROM users WHERE department_id = %s AND is_deleted = 0) AS used", (department_id,))
+            if cur.fetchone()['used']: return False, "لا يمكن حذف القسم لأنه معين لمستخدمين حاليين."
             
-            cur.execute("SELECT COUNT(*) as count FROM maintenance WHERE department = %s AND is_deleted = 0", (dept_name,))
-            if cur.fetchone()['count'] > 0: return False, "لا يمكن حذف القسم لأنه مستخدم في سجلات الصيانة."
+            cur.execute("SELECT EXISTS(SELECT 1 FROM maintenance WHERE department_id = %s)"
+                        " OR EXISTS(SELECT 1 FROM maintenance_archive WHERE department_id = %s) AS used",
+                        (department_id, department_id))
+            if cur.fetchone()['used']: return False, "لا يمكن حذف القسم لأنه مستخدم في سجلات الصيانة (بما فيها سلة المحذوفات والأرشيف)."
             
             cur.execute("DELETE FROM departments WHERE id = %s", (department_id,))
-            log_activity(user_id, 'DELETE', 'department', department_id, f"Deleted department: {dept_name}")
+            log_activity(user_id, 'DELETE', 'department', department_id, {'name': dept_name})
             return True, "تم حذف القسم بنجاح."
     except Exception as e:
         return False, str(e)
@@ -121,23 +403,28 @@ def get_department_id_by_name(name):
         return result['id'] if result else None
 
 # --- RECORD HISTORY ---
-def get_history_for_record(record_id):
-    """Fetches the activity log history for a specific maintenance record."""
+def get_history_for_record(record_id, include_archived=False):
+    """Fetches the activity log history for a specific maintenance record, optionally including archived months."""
     sql = """
-        SELECT u.username, al.action, al.description, al.timestamp
+        SELECT al.id, u.username, al.action_code, al.record_type_code, al.record_id, al.payload, al.timestamp
         FROM activity_log al LEFT JOIN users u ON al.user_id = u.id
-        WHERE al.record_type = 'maintenance' AND al.record_id = %s
-        ORDER BY al.timestamp DESC
+        WHERE al.record_type_code = %s AND al.record_id = %s
+        ORDER BY al.timestamp DESC, al.id DESC
     """
     with get_cursor() as cur:
-        cur.execute(sql, (record_id,))
-        return cur.fetchall()
+        cur.execute(sql, (ACTIVITY_RECORD_TYPES['maintenance'], record_id))
+        rows = [decode_activity_row(row) for row in cur.fetchall()]
+    if include_archived:
+        from .activity_archive import iter_archived_activity
+        rows.extend(iter_archived_activity({'record_type': 'maintenance', 'record_id': record_id}))
+    return rows
         
 # --- ADMIN & REPORTING HELPERS ---
 def get_total_record_count():
-    """Gets the count of total active records."""
+    """Gets the count of total active records, archived ones included."""
     with get_cursor() as cur:
-        cur.execute("SELECT COUNT(*) AS count FROM maintenance WHERE is_deleted = 0")
+        cur.execute("SELECT (SELECT COUNT(*) FROM maintenance WHERE is_deleted = 0)"
+                    " + (SELECT COUNT(*) FROM maintenance_archive) AS count")
         result = cur.fetchone()
         return result['count'] if result else 0
 
@@ -156,39 +443,15 @@ def get_user_role_count(role_name):
         result = cur.fetchone()
         return result['count'] if result else 0
 
-def search_records_advanced(filters):
-    """Performs an advanced search for maintenance records."""
-    base_sql = "SELECT * FROM maintenance WHERE is_deleted = 0"
-    params = []
-    
-    if filters.get('date_from') and filters.get('date_to'):
-        base_sql += " AND date BETWEEN %s AND %s"
-        params.extend([filters['date_from'], filters['date_to']])
-
-    if filters.get('department'):
-        base_sql += " AND department = %s"
-        params.append(filters['department'])
-
-    if filters.get('keyword'):
-        kw = f"%{filters['keyword']}%"
-        base_sql += " AND (device LIKE %s OR procedures LIKE %s OR materials LIKE %s OR notes LIKE %s OR warnings LIKE %s)"
-        params.extend([kw] * 5)
-
-    base_sql += " ORDER BY id DESC"
-    
-    with get_cursor() as cur:
-        cur.execute(base_sql, params)
-        return cur.fetchall()
-
 def get_records_count_in_period(date_from, date_to, department=None):
     """Gets the count of records within a specific date range."""
-    sql = "SELECT COUNT(*) AS count FROM maintenance WHERE is_deleted = 0 AND date BETWEEN %s AND %s"
+    sql = "SELECT COUNT(*) AS count FROM {source} m WHERE m.is_deleted = 0 AND m.date BETWEEN %s AND %s"
     params = [date_from, date_to]
     if department:
-        sql += " AND department = %s "
+        sql += " AND m.department_id = (SELECT id FROM departments WHERE name = %s) "
         params.append(department)
     with get_cursor() as cur:
-        cur.execute(sql, params)
+        cur.execute(sql.format(source=maintenance_source(cur, date_from, date_to)), params)
         result = cur.fetchone()
         return result['count'] if result else 0
 
@@ -206,31 +469,44 @@ def get_avg_records_per_day(date_from, date_to, department=None):
 
 def get_records_per_department(date_from, date_to):
     """Gets the count of records grouped by department."""
-    sql = "SELECT department, COUNT(*) AS count FROM maintenance WHERE is_deleted = 0 AND date BETWEEN %s AND %s GROUP BY department ORDER BY count DESC"
+    sql = """
+        SELECT d.name AS department, COUNT(*) AS count
+        FROM {source} m LEFT JOIN departments d ON d.id = m.department_id
+        WHERE m.is_deleted = 0 AND m.date BETWEEN %s AND %s
+        GROUP BY m.department_id, d.name ORDER BY count DESC
+    """
     with get_cursor() as cur:
-        cur.execute(sql, (date_from, date_to))
+        cur.execute(sql.format(source=maintenance_source(cur, date_from, date_to)), (date_from, date_to))
         return cur.fetchall()
 
 def get_device_type_counts(date_from, date_to, department=None):
-    """Gets the count of records grouped by device type."""
-    sql = "SELECT type AS device_type, COUNT(*) AS count FROM maintenance WHERE is_deleted = 0 AND date BETWEEN %s AND %s"
+    """Gets the count of records grouped by device type (on type_id; records not yet backfilled by name)."""
+    sql = """
+        SELECT MAX(COALESCE(l.name, m.type)) AS device_type, COUNT(*) AS count
+        FROM {source} m LEFT JOIN maintenance_types l ON l.id = m.type_id
+        WHERE m.is_deleted = 0 AND m.date BETWEEN %s AND %s
+    """
     params = [date_from, date_to]
     if department:
-        sql += " AND department = %s "
+        sql += " AND m.department_id = (SELECT id FROM departments WHERE name = %s) "
         params.append(department)
-    sql += " GROUP BY type ORDER BY count DESC"
+    sql += " GROUP BY m.type_id, IF(m.type_id IS NULL, m.type, NULL) ORDER BY count DESC"
     with get_cursor() as cur:
-        cur.execute(sql, params)
+        cur.execute(sql.format(source=maintenance_source(cur, date_from, date_to)), params)
         return cur.fetchall()
 
 def get_technician_counts(date_from, date_to, department=None):
-    """Gets the count of records grouped by technician."""
-    sql = "SELECT technician, COUNT(*) AS count FROM maintenance WHERE is_deleted = 0 AND date BETWEEN %s AND %s"
+    """Gets the count of records grouped by technician (on technician_id; records not yet backfilled by name)."""
+    sql = """
+        SELECT MAX(COALESCE(l.name, m.technician)) AS technician, COUNT(*) AS count
+        FROM {source} m LEFT JOIN technicians l ON l.id = m.technician_id
+        WHERE m.is_deleted = 0 AND m.date BETWEEN %s AND %s
+    """
     params = [date_from, date_to]
     if department:
-        sql += " AND department = %s "
+        sql += " AND m.department_id = (SELECT id FROM departments WHERE name = %s) "
         params.append(department)
-    sql += " GROUP BY technician ORDER BY count DESC"
+    sql += " GROUP BY m.technician_id, IF(m.technician_id IS NULL, m.technician, NULL) ORDER BY count DESC"
     with get_cursor() as cur:
-        cur.execute(sql, params)
+        cur.execute(sql.format(source=maintenance_source(cur, date_from, date_to)), params)
         return cur.fetchall()
\ No newline at end of file
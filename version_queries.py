@@ -0,0 +1,146 @@
+﻿# /database/version_queries.py
+
+import json
+import difflib
+from datetime import date, datetime
+from .connection import get_cursor
+
+# Field-level history of maintenance rows, kept in maintenance_versions.
+# Version 1 (and every SNAPSHOT_EVERY-th version after it) stores every field;
+# the versions in between store only the fields that changed. Long text
+# fields are stored as a patch against the previous value when that is
+# smaller: {"p": [[start, end, replacement], ...]}. Reconstructing a version
+# reads at most SNAPSHOT_EVERY rows. changed_mask has bit i set when
+# VERSIONED_FIELDS[i] changed, so listing versions never decodes the data.
+VERSIONED_FIELDS = ('date', 'type', 'device', 'technician', 'procedures', 'materials', 'notes', 'warnings', 'department')
+SNAPSHOT_EVERY = 10
+TEXT_PATCH_MIN_LENGTH = 200
+VERSION_PAGE_SIZE = 20
+
+def _normalize(value):
+    """Stores every field as a string (dates as ISO) so a changed value compares reliably."""
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+def fields_from_data(data):
+    """Maps the positional data tuple used by insert_record/update_record to a field dict."""
+    return {field: _normalize(value) for field, value in zip(VERSIONED_FIELDS, data)}
+
+def _encode_change(old, new):
+    """Returns new as-is, or a patch against old if that is meaningfully shorter."""
+    if not (isinstance(old, str) and isinstance(new, str)) or len(new) < TEXT_PATCH_MIN_LENGTH:
+        return new
+    ops = [[i1, i2, new[j1:j2]] for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new).get_opcodes() if tag != 'equal']
+    patch = {'p': ops}
+    return patch if len(json.dumps(patch, ensure_ascii=False)) < len(json.dumps(new, ensure_ascii=False)) else new
+
+def _apply_change(old, change):
+    if not isinstance(change, dict):
+        return change
+    result = old
+    for start, end, replacement in reversed(change['p']):
+        result = result[:start] + replacement + result[end:]
+    return result
+
+def _load_json(value):
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode('utf-8')
+    return json.loads(value)
+
+def record_version(cur, maintenance_id, user_id, old_fields, new_fields):
+    """
+    Appends a version for a maintenance row inside the caller's transaction,
+    which must hold a lock on that row (SELECT ... FOR UPDATE or the INSERT
+    itself). Rows that predate version history get a baseline snapshot of
+    old_fields first. Returns (version, changed field names), or (None, [])
+    when nothing changed.
+    """
+    cur.execute("SELECT MAX(version) AS version FROM maintenance_versions WHERE maintenance_id = %s", (maintenance_id,))
+    last = cur.fetchone()['version'] or 0
+    sql = """
+        INSERT INTO maintenance_versions (maintenance_id, version, user_id, is_snapshot, changed_mask, data)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """
+    if old_fields is None:
+        changed = list(VERSIONED_FIELDS)
+    else:
+        changed = [f for f in VERSIONED_FIELDS if old_fields.get(f) != new_fields.get(f)]
+        if not changed:
+            return None, []
+        if last == 0:
+            cur.execute(sql, (maintenance_id, 1, None, 1, 0, json.dumps(old_fields, ensure_ascii=False)))
+            last = 1
+    version = last + 1
+    is_snapshot = old_fields is None or (version - 1) % SNAPSHOT_EVERY == 0
+    if is_snapshot:
+        data = new_fields
+    else:
+        data = {f: _encode_change(old_fields.get(f), new_fields.get(f)) for f in changed}
+    changed_mask = sum(1 << VERSIONED_FIELDS.index(f) for f in changed)
+    cur.execute(sql, (maintenance_id, version, user_id, int(is_snapshot), changed_mask,
+                      json.dumps(data, ensure_ascii=False, separators=(',', ':'))))
+    return version, changed
+
+def _version_rows(cur, maintenance_id, from_version, to_version):
+    """Rows needed to rebuild from_version..to_version: back to the nearest snapshot at or before from_version."""
+    cur.execute("""
+        SELECT version, is_snapshot, data FROM maintenance_versions
+        WHERE maintenance_id = %s AND version <= %s AND version >= (
+            SELECT COALESCE(MAX(version), 1) FROM maintenance_versions
+            WHERE maintenance_id = %s AND is_snapshot = 1 AND version <= %s)
+        ORDER BY version
+    """, (maintenance_id, to_version, maintenance_id, from_version))
+    return cur.fetchall()
+
+def _replay(rows, wanted):
+    """Applies rows in order, returning {version: fields} for each version in wanted."""
+    state, states = {}, {}
+    for row in rows:
+        data = _load_json(row['data'])
+        if row['is_snapshot']:
+            state = dict(data)
+        else:
+            for field, change in data.items():
+                state[field] = _apply_change(state.get(field), change)
+        if row['version'] in wanted:
+            states[row['version']] = dict(state)
+    return states
+
+def get_record_version(maintenance_id, version):
+    """Reconstructs the fields of a maintenance row as of a version, or None if it does not exist."""
+    with get_cursor() as cur:
+        rows = _version_rows(cur, maintenance_id, version, version)
+    return _replay(rows, {version}).get(version)
+
+def diff_record_versions(maintenance_id, from_version, to_version):
+    """Returns {field: (old, new)} for every field that differs between two versions."""
+    low, high = sorted((from_version, to_version))
+    with get_cursor() as cur:
+        rows = _version_rows(cur, maintenance_id, low, high)
+    states = _replay(rows, {low, high})
+    old, new = states.get(from_version, {}), states.get(to_version, {})
+    return {f: (old.get(f), new.get(f)) for f in VERSIONED_FIELDS if old.get(f) != new.get(f)}
+
+def get_record_versions(maintenance_id, before_version=None, limit=VERSION_PAGE_SIZE):
+    """
+    Lists versions of a maintenance row newest first, limit at a time; pass the
+    oldest version already shown as before_version for the next page. Each
+    entry has version, username, created_at, is_snapshot and the names of the
+    fields it changed (none for the baseline of a row that predates history).
+    """
+    sql = """
+        SELECT v.version, v.is_snapshot, v.changed_mask, v.created_at, u.username
+        FROM maintenance_versions v LEFT JOIN users u ON v.user_id = u.id
+        WHERE v.maintenance_id = %s AND v.version < %s
+        ORDER BY v.version DESC LIMIT %s
+    """
+    with get_cursor() as cur:
+        cur.execute(sql, (maintenance_id, before_version or 2 ** 31 - 1, limit))
+        rows = cur.fetchall()
+    for row in rows:
+        mask = row.pop('changed_mask')
+        row['changed_fields'] = [f for i, f in enumerate(VERSIONED_FIELDS) if mask & (1 << i)]
+    return rows